@@ -25,22 +25,42 @@ from ._version import get_versions
 __version__ = get_versions()['version']
 del get_versions
 
+import sys
+import importlib
+
 from . import tools  # NOQA
 
 from .api import *  # NOQA
 import bluepyopt.optimisations
-import bluepyopt.deapext.optimisations
-
-# Add some backward compatibility for the time when DEAPoptimisation not in
-# deapext yet
-# TODO deprecate this
-bluepyopt.optimisations.DEAPOptimisation = \
-    bluepyopt.deapext.optimisations.DEAPOptimisation
-
 import bluepyopt.evaluators
+import bluepyopt.executors
 import bluepyopt.objectives
 import bluepyopt.parameters  # NOQA
 
+# The subpackages that import deap, pandas, ... are only imported when they
+# are used, so that the worker processes that only evaluate models don't
+# pay for them at startup
+_LAZY_SUBPACKAGES = ('deapext', 'ephys')
+
+
+def __getattr__(name):
+    """Import the subpackages on first use"""
+
+    if name in _LAZY_SUBPACKAGES:
+        return importlib.import_module('.' + name, __name__)
+
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ (PEP 562) needs Python 3.7, deapext is imported
+    # with the package like before
+    import bluepyopt.deapext.optimisations
+
+    bluepyopt.optimisations.DEAPOptimisation = \
+        bluepyopt.deapext.optimisations.DEAPOptimisation
+
 # TODO let objects read / write themselves using json
 # TODO create 'Variables' class
 # TODO use 'locations' instead of 'location'
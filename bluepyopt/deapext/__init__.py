@@ -0,0 +1,50 @@
+"""Init script"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import sys
+import importlib
+
+# The modules are imported on first use, they used to be imported by
+# import bluepyopt
+_SUBMODULES = (
+    'algorithms',
+    'callbacks',
+    'costmodel',
+    'islands',
+    'optimisations',
+    'tools')
+
+
+def __getattr__(name):
+    """Import the submodules on first use"""
+
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ (PEP 562) needs Python 3.7, the submodules are
+    # imported with the package
+    for _name in _SUBMODULES:
+        importlib.import_module('.' + _name, __name__)
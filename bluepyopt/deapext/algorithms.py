@@ -22,13 +22,21 @@ Copyright (c) 2016, EPFL/Blue Brain Project
 # pylint: disable=R0914, R0912
 
 
+import os
+import copy
+import math
 import random
 import logging
+import contextlib
 
 import deap.algorithms
 import deap.tools
 import pickle
 
+import bluepyopt.executors
+import bluepyopt.tools
+import bluepyopt.deapext.callbacks
+
 logger = logging.getLogger('__main__')
 
 
@@ -38,38 +46,354 @@ def _evaluate_invalid_fitness(toolbox, population):
     Returns the count of individuals with invalid fitness
     '''
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
-    fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
-    for ind, fit in zip(invalid_ind, fitnesses):
-        ind.fitness.values = fit
+
+    if getattr(toolbox, 'fidelity_ladder', None):
+        _evaluate_fidelity_ladder(toolbox, invalid_ind)
+        return len(invalid_ind)
+
+    # Without ladder, the individuals get the full fidelity
+    for ind in invalid_ind:
+        if hasattr(ind, 'fidelity'):
+            del ind.fidelity
+
+    batched = hasattr(toolbox, 'evaluate_population')
+    cost_model = None if batched else getattr(toolbox, 'cost_model', None)
+
+    predictions = {}
+    if batched:
+        batch_size = toolbox.population_batch_size
+        batches = [invalid_ind[index:index + batch_size]
+                   for index in range(0, len(invalid_ind), batch_size)]
+        evaluate = toolbox.evaluate_population
+    else:
+        if cost_model is not None:
+            # Submit the individuals that are expected to take longest first
+            predictions = {id(ind): cost_model.predict(ind)
+                           for ind in invalid_ind}
+            if None not in predictions.values():
+                invalid_ind.sort(
+                    key=lambda ind: predictions[id(ind)], reverse=True)
+            evaluate = toolbox.evaluate_timed
+        else:
+            evaluate = toolbox.evaluate
+        batches = [[ind] for ind in invalid_ind]
+
+    def assign(batch, result):
+        '''Assign the fitness of the individuals of a batch'''
+        for ind, fit in zip(batch, result if batched else [result]):
+            if cost_model is not None:
+                fit, timings = fit
+                _log_cost_prediction(
+                    predictions[id(ind)], sum(timings.values()))
+                cost_model.update(ind, timings)
+            ind.fitness.values = fit
+
+    executor = getattr(toolbox, 'executor', None)
+    if executor is not None:
+        retry = getattr(toolbox, 'retry', None)
+
+        # Assign the fitnesses as soon as the evaluations complete
+        tasks = {executor.submit(evaluate, batch if batched else batch[0]):
+                 batch for batch in batches}
+        for task in executor.as_completed(
+                list(tasks),
+                task_timeout=retry.task_timeout if retry else None,
+                speculation=getattr(toolbox, 'speculation', None),
+                retry=retry):
+            kind = bluepyopt.executors.classify_failure(task.exception()) \
+                if retry is not None else None
+            if kind is not None:
+                # Evaluations that kept failing get the max_score
+                retry.record(task, kind, 'max_score')
+                for ind in tasks[task]:
+                    ind.fitness.values = toolbox.max_score_objectives
+            else:
+                assign(tasks[task], task.result())
+    else:
+        results = toolbox.map(
+            evaluate, [batch if batched else batch[0] for batch in batches])
+        for batch, result in zip(batches, results):
+            assign(batch, result)
 
     return len(invalid_ind)
 
 
-def _update_history_and_hof(halloffame, history, population):
+def _evaluate_fidelity_ladder(toolbox, population):
+    '''Evaluate individuals from the cheapest level of fidelity up
+
+    toolbox.fidelity_ladder lists the evaluation function and the promoted
+    fraction of every level. The individuals with the best fitness at a
+    level are evaluated again at the next level, the others keep the
+    fitness of this level. The last level is toolbox.evaluate. Every
+    individual gets the index of the level of its fitness in its fidelity
+    attribute
+    '''
+    top_toolbox = copy.copy(toolbox)
+    del top_toolbox.fidelity_ladder
+
+    # The cost model and the batches are those of the full evaluation
+    level_toolbox = copy.copy(top_toolbox)
+    for name in ('evaluate_population', 'cost_model', 'evaluate_timed'):
+        if hasattr(level_toolbox, name):
+            delattr(level_toolbox, name)
+
+    candidates = population
+    for level, (evaluate, promote_fraction) in enumerate(
+            toolbox.fidelity_ladder):
+        level_toolbox.evaluate = evaluate
+        _evaluate_invalid_fitness(level_toolbox, candidates)
+        for ind in candidates:
+            ind.fidelity = level
+
+        n_promoted = int(math.ceil(promote_fraction * len(candidates)))
+        candidates = sorted(
+            candidates,
+            key=lambda ind: sum(ind.fitness.wvalues),
+            reverse=True)[:n_promoted]
+        logger.debug(
+            'Promoting %d individuals from fidelity level %d',
+            len(candidates), level)
+        for ind in candidates:
+            del ind.fitness.values
+
+    _evaluate_invalid_fitness(top_toolbox, candidates)
+    for ind in candidates:
+        ind.fidelity = len(toolbox.fidelity_ladder)
+
+
+def _fidelity(ind):
+    '''Level of fidelity of the fitness of an individual
+
+    Individuals that were not evaluated with a fidelity ladder have the
+    full fidelity
+    '''
+    return getattr(ind, 'fidelity', float('inf'))
+
+
+def _top_fidelity(toolbox):
+    '''Level of the full fidelity, None without fidelity ladder'''
+    ladder = getattr(toolbox, 'fidelity_ladder', None)
+    return len(ladder) if ladder else None
+
+
+def _log_cost_prediction(predicted, actual):
+    '''Log predicted and actual evaluation time'''
+    if predicted is None:
+        logger.debug('Evaluation took %.6g s, no prediction yet', actual)
+    else:
+        logger.debug(
+            'Evaluation took %.6g s, predicted %.6g s (ratio %.3g)',
+            actual, predicted, actual / predicted)
+
+
+def failure_report_filename(cp_filename):
+    '''Name of the failure report written next to a checkpoint'''
+    return '%s_failures.json' % os.path.splitext(cp_filename)[0]
+
+
+def _update_history_and_hof(
+        halloffame, history, population, top_fidelity=None):
     '''Update the hall of fame with the generated individuals
 
+    With top_fidelity, only the individuals evaluated at this level of
+    fidelity enter the hall of fame
+
     Note: History and Hall-of-Fame behave like dictionaries
     '''
     if halloffame is not None:
-        halloffame.update(population)
+        if top_fidelity is not None:
+            halloffame.update(
+                [ind for ind in population if _fidelity(ind) >= top_fidelity])
+        else:
+            halloffame.update(population)
 
     history.update(population)
 
 
-def _record_stats(stats, logbook, gen, population, invalid_count):
-    '''Update the statistics with the new population'''
+def _fidelity_counts(population, top_fidelity):
+    '''Number of individuals of the population at every level of fidelity'''
+    return [
+        len([ind for ind in population
+             if min(_fidelity(ind), top_fidelity) == level])
+        for level in range(top_fidelity + 1)]
+
+
+def _record_stats(
+        stats, logbook, gen, population, invalid_count, top_fidelity=None):
+    '''Update the statistics with the new population
+
+    With top_fidelity, the number of individuals at every level of fidelity
+    is recorded in the fidelity column
+    '''
     record = stats.compile(population) if stats is not None else {}
+    if top_fidelity is not None:
+        record['fidelity'] = _fidelity_counts(population, top_fidelity)
     logbook.record(gen=gen, nevals=invalid_count, **record)
 
 
-def _get_offspring(parents, toolbox, cxpb, mutpb):
-    '''return the offsprint, use toolbox.variate if possible'''
+def _variate_streams(parents, toolbox, cxpb, mutpb, stream_key):
+    '''varAnd in which every offspring individual has its own random stream
+
+    The crossover of the pair of individuals (2k, 2k + 1) and the mutation
+    of individual i draw from random streams identified by stream_key and
+    the index, so that the offspring doesn't depend on the order in which
+    random numbers were drawn before. Every individual gets the stream
+    attribute stream_key + (index,)
+    '''
+    offspring = [toolbox.clone(ind) for ind in parents]
+
+    for index in range(1, len(offspring), 2):
+        with bluepyopt.tools.random_stream(*(stream_key + ('mate', index))):
+            if random.random() < cxpb:
+                offspring[index - 1], offspring[index] = toolbox.mate(
+                    offspring[index - 1], offspring[index])
+                del offspring[index - 1].fitness.values
+                del offspring[index].fitness.values
+
+    for index in range(len(offspring)):
+        with bluepyopt.tools.random_stream(*(stream_key + ('mutate', index))):
+            if random.random() < mutpb:
+                offspring[index], = toolbox.mutate(offspring[index])
+                del offspring[index].fitness.values
+        offspring[index].stream = stream_key + (index,)
+
+    return offspring
+
+
+def _get_offspring(
+        parents,
+        toolbox,
+        cxpb,
+        mutpb,
+        lambda_=None,
+        stream_key=None):
+    '''return the offsprint, use toolbox.variate if possible
+
+    If lambda_ is given, the offspring has lambda_ individuals, bred from
+    the parents repeated and randomly sampled to this size. If stream_key is
+    given, the individuals are bred with their own random streams
+    '''
+    if lambda_ is not None and lambda_ != len(parents):
+        with _stream(stream_key, 'sample'):
+            parents = parents * (lambda_ // len(parents)) + \
+                random.sample(parents, lambda_ % len(parents))
+    if stream_key is not None:
+        return _variate_streams(parents, toolbox, cxpb, mutpb, stream_key)
     if hasattr(toolbox, 'variate'):
         return toolbox.variate(parents, toolbox, cxpb, mutpb)
     return deap.algorithms.varAnd(parents, toolbox, cxpb, mutpb)
 
 
-def eaAlphaMuPlusLambdaCheckpoint(
+@contextlib.contextmanager
+def _stream(stream_key, *keys):
+    '''Context of the random stream stream_key + keys, if stream_key is set
+
+    Without stream_key, the context draws from the random module as is
+    '''
+    if stream_key is None:
+        yield
+    else:
+        with bluepyopt.tools.random_stream(*(stream_key + keys)):
+            yield
+
+
+def _select(toolbox, population, k, stream_key=None):
+    '''Select k individuals, in the random stream of stream_key if given
+
+    Individuals evaluated at different levels of fidelity are never
+    compared: the individuals of the highest level are selected first, and
+    the selection among the individuals of the next level completes them
+    '''
+    with _stream(stream_key, 'select'):
+        levels = sorted(set(_fidelity(ind) for ind in population),
+                        reverse=True)
+        if len(levels) < 2:
+            return toolbox.select(population, k)
+
+        selected = []
+        for level in levels:
+            stratum = [ind for ind in population if _fidelity(ind) == level]
+            if len(stratum) > k - len(selected):
+                stratum = toolbox.select(stratum, k - len(selected))
+            selected.extend(stratum)
+            if len(selected) == k:
+                break
+
+        return selected
+
+
+class Generation(object):
+
+    """State of the optimisation after a generation
+
+    The settings mu, lambda_, cxpb and mutpb can be changed by the caller
+    before the next generation is produced
+    """
+
+    def __init__(
+            self,
+            gen,
+            population,
+            parents,
+            halloffame,
+            logbook,
+            history,
+            mu,
+            lambda_,
+            cxpb,
+            mutpb,
+            nevals=0,
+            stream=None,
+            cp_filename=None,
+            checkpointed=False,
+            islands=None):
+        """Constructor
+
+        Args:
+            gen (int): generation number
+            population (list of Individuals): parents and offspring of the
+                generation
+            parents (list of Individuals): parents of the next generation
+            halloffame (deap.tools.HallOfFame): hall of fame
+            logbook (deap.tools.Logbook): statistics of the generations
+            history (deap.tools.History): history of the individuals
+            mu (int): number of parents
+            lambda_ (int): number of offspring individuals, None to use mu
+            cxpb (float): crossover probability
+            mutpb (float): mutation probability
+            nevals (int): number of evaluations of the generation
+            stream (str): logbook stream logged for this generation
+            cp_filename (str): path to the checkpoint
+            checkpointed (bool): whether a checkpoint was written after this
+                generation
+            islands (list of dicts): population, parents and logbook of
+                every island of an archipelago, None otherwise
+        """
+
+        self.gen = gen
+        self.population = population
+        self.parents = parents
+        self.halloffame = halloffame
+        self.logbook = logbook
+        self.history = history
+        self.mu = mu
+        self.lambda_ = lambda_
+        self.cxpb = cxpb
+        self.mutpb = mutpb
+        self.nevals = nevals
+        self.stream = stream
+        self.cp_filename = cp_filename
+        self.checkpointed = checkpointed
+        self.islands = islands
+
+    @property
+    def record(self):
+        """Statistics of this generation"""
+
+        return self.logbook[-1] if len(self.logbook) else {}
+
+
+def eaAlphaMuPlusLambdaGenerations(
         population,
         toolbox,
         mu,
@@ -80,26 +404,20 @@ def eaAlphaMuPlusLambdaCheckpoint(
         halloffame=None,
         cp_frequency=1,
         cp_filename=None,
-        continue_cp=False):
-    r"""This is the :math:`(~\alpha,\mu~,~\lambda)` evolutionary algorithm
-
-    Args:
-        population(list of deap Individuals)
-        toolbox(deap Toolbox)
-        mu(int): Total parent population size of EA
-        cxpb(float): Crossover probability
-        mutpb(float): Mutation probability
-        ngen(int): Total number of generation to run
-        stats(deap.tools.Statistics): generation of statistics
-        halloffame(deap.tools.HallOfFame): hall of fame
-        cp_frequency(int): generations between checkpoints
-        cp_filename(string): path to checkpoint filename
-        continue_cp(bool): whether to continue
+        continue_cp=False,
+        lambda_=None):
+    r"""Generator version of eaAlphaMuPlusLambdaCheckpoint
+
+    Takes the same arguments as eaAlphaMuPlusLambdaCheckpoint, and yields a
+    Generation after the first (or restored) generation and after every
+    generation that follows. The caller can stop the optimisation by not
+    asking for the next generation, and change the settings of the
+    Generation that is yielded for the next generations
     """
 
     if continue_cp:
         # A file name has been given, then load the data from the file
-        cp = pickle.load(open(cp_filename, "r"))
+        cp = pickle.load(open(cp_filename, "rb"))
         population = cp["population"]
         parents = cp["parents"]
         start_gen = cp["generation"]
@@ -107,36 +425,66 @@ def eaAlphaMuPlusLambdaCheckpoint(
         logbook = cp["logbook"]
         history = cp["history"]
         random.setstate(cp["rndstate"])
+        invalid_count = 0
     else:
         # Start a new evolution
         start_gen = 1
         parents = population[:]
         logbook = deap.tools.Logbook()
         logbook.header = ['gen', 'nevals'] + (stats.fields if stats else [])
+        if _top_fidelity(toolbox) is not None:
+            logbook.header.append('fidelity')
         history = deap.tools.History()
 
         # TODO this first loop should be not be repeated !
         invalid_count = _evaluate_invalid_fitness(toolbox, population)
-        _update_history_and_hof(halloffame, history, population)
-        _record_stats(stats, logbook, start_gen, population, invalid_count)
+        top_fidelity = _top_fidelity(toolbox)
+        _update_history_and_hof(
+            halloffame, history, population, top_fidelity)
+        _record_stats(stats, logbook, start_gen, population, invalid_count,
+                      top_fidelity)
+
+    generation = Generation(
+        start_gen, population, parents, halloffame, logbook, history,
+        mu, lambda_, cxpb, mutpb,
+        nevals=invalid_count, cp_filename=cp_filename)
+    yield generation
+
+    # With random streams, the random numbers drawn during a generation
+    # only depend on (rng_seed, gen)
+    rng_seed = getattr(toolbox, 'rng_seed', None)
 
     # Begin the generational process
     for gen in range(start_gen + 1, ngen + 1):
-        offspring = _get_offspring(parents, toolbox, cxpb, mutpb)
+        stream_key = (rng_seed, gen) if rng_seed is not None else None
+
+        offspring = _get_offspring(
+            parents,
+            toolbox,
+            generation.cxpb,
+            generation.mutpb,
+            generation.lambda_,
+            stream_key)
 
         population = parents + offspring
 
-        invalid_count = _evaluate_invalid_fitness(toolbox, offspring)
-        _update_history_and_hof(halloffame, history, population)
-        _record_stats(stats, logbook, gen, population, invalid_count)
+        # The parents are usually valid, unless a callback invalidated them
+        # (e.g. to evaluate them with another evaluator)
+        invalid_count = _evaluate_invalid_fitness(toolbox, population)
+        top_fidelity = _top_fidelity(toolbox)
+        _update_history_and_hof(
+            halloffame, history, population, top_fidelity)
+        _record_stats(stats, logbook, gen, population, invalid_count,
+                      top_fidelity)
 
         # Select the next generation parents
-        parents = toolbox.select(population, mu)
+        parents = _select(toolbox, population, generation.mu, stream_key)
         logbook_stream = logbook.stream
         logger.info(logbook_stream)
 
-        if(cp_filename and cp_frequency and
-           gen % cp_frequency == 0):
+        checkpointed = bool(cp_filename and cp_frequency and
+                            gen % cp_frequency == 0)
+        if checkpointed:
             cp = dict(population=population,
                       generation=gen,
                       parents=parents,
@@ -146,10 +494,93 @@ def eaAlphaMuPlusLambdaCheckpoint(
                       rndstate=random.getstate())
             pickle.dump(cp, open(cp_filename, "wb"))
             logger.debug('Wrote checkpoint to %s', cp_filename)
-            
-            # Writing the generation statistics in a file
-            f =  open('logbook_info.txt','a')
-            f.write('%s %s \n'%(logbook_stream, cp_filename.split('.')[0]))
-            f.close()
 
-    return population, halloffame, logbook, history
+            retry = getattr(toolbox, 'retry', None)
+            if retry is not None and retry.failures:
+                retry.write_report(failure_report_filename(cp_filename))
+
+        generation = Generation(
+            gen, population, parents, halloffame, logbook, history,
+            generation.mu, generation.lambda_, generation.cxpb,
+            generation.mutpb,
+            nevals=invalid_count,
+            stream=logbook_stream,
+            cp_filename=cp_filename,
+            checkpointed=checkpointed)
+        yield generation
+
+
+def run_callbacks(callbacks, generation):
+    """Call the callbacks with a generation, return True to stop
+
+    All the callbacks are called, the optimisation stops if one of them
+    returns True
+    """
+
+    stop = False
+    for callback in callbacks:
+        if callback(generation):
+            logger.info(
+                'Optimisation stopped after generation %d by %s',
+                generation.gen, callback)
+            stop = True
+
+    return stop
+
+
+def eaAlphaMuPlusLambdaCheckpoint(
+        population,
+        toolbox,
+        mu,
+        cxpb,
+        mutpb,
+        ngen,
+        stats=None,
+        halloffame=None,
+        cp_frequency=1,
+        cp_filename=None,
+        continue_cp=False,
+        lambda_=None,
+        callbacks=None):
+    r"""This is the :math:`(~\alpha,\mu~,~\lambda)` evolutionary algorithm
+
+    Args:
+        population(list of deap Individuals)
+        toolbox(deap Toolbox)
+        mu(int): Total parent population size of EA
+        cxpb(float): Crossover probability
+        mutpb(float): Mutation probability
+        ngen(int): Total number of generation to run
+        stats(deap.tools.Statistics): generation of statistics
+        halloffame(deap.tools.HallOfFame): hall of fame
+        cp_frequency(int): generations between checkpoints
+        cp_filename(string): path to checkpoint filename
+        continue_cp(bool): whether to continue
+        lambda_(int): Number of offspring individuals in each generation,
+            by default the number of parents
+        callbacks(list of callables): functions called with the Generation
+            after every generation, the optimisation stops when one of them
+            returns True. By default a LogbookInfoWriter
+    """
+
+    if callbacks is None:
+        callbacks = [bluepyopt.deapext.callbacks.LogbookInfoWriter()]
+
+    for generation in eaAlphaMuPlusLambdaGenerations(
+            population,
+            toolbox,
+            mu,
+            cxpb,
+            mutpb,
+            ngen,
+            stats=stats,
+            halloffame=halloffame,
+            cp_frequency=cp_frequency,
+            cp_filename=cp_filename,
+            continue_cp=continue_cp,
+            lambda_=lambda_):
+        if run_callbacks(callbacks, generation):
+            break
+
+    return generation.population, generation.halloffame, \
+        generation.logbook, generation.history
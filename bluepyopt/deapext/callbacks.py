@@ -0,0 +1,353 @@
+"""Callbacks called after every generation of an optimisation"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# A callback is called with the algorithms.Generation produced by every
+# generation (including the first one). Callbacks that return True stop the
+# optimisation, the others can write metrics or change the settings of the
+# generation.
+
+import os
+import abc
+import time
+import logging
+
+import numpy
+
+import deap.tools
+
+from . import tools
+
+logger = logging.getLogger(__name__)
+
+# Abstract base class, defined without the metaclass keyword of Python 3
+_AbstractBase = abc.ABCMeta('_AbstractBase', (object,), {})
+
+
+class Callback(_AbstractBase):
+
+    """Function called after every generation"""
+
+    @abc.abstractmethod
+    def __call__(self, generation):
+        """Process generation, return True to stop the optimisation"""
+
+    def __str__(self):
+        """String representation"""
+
+        return self.__class__.__name__
+
+
+class LogbookInfoWriter(Callback):
+
+    """Append the statistics of the checkpointed generations to a file"""
+
+    def __init__(self, filename=None):
+        """Constructor
+
+        Args:
+            filename (str): path of the file, by default logbook_info.txt in
+                the directory of the checkpoint
+        """
+
+        self.filename = filename
+
+    def __call__(self, generation):
+        """Write the statistics if a checkpoint was written"""
+
+        if not generation.checkpointed:
+            return False
+
+        filename = self.filename
+        if filename is None:
+            filename = os.path.join(
+                os.path.dirname(generation.cp_filename), 'logbook_info.txt')
+
+        with open(filename, 'a') as info_file:
+            info_file.write('%s %s \n' % (
+                generation.stream, generation.cp_filename.split('.')[0]))
+
+        return False
+
+
+class MaxNGen(Callback):
+
+    """Stop the optimisation after a number of generations"""
+
+    def __init__(self, max_ngen):
+        """Constructor
+
+        Args:
+            max_ngen (int): last generation of the optimisation
+        """
+
+        self.max_ngen = max_ngen
+
+    def __call__(self, generation):
+        """Return True if the last generation is reached"""
+
+        return generation.gen >= self.max_ngen
+
+    def __str__(self):
+        """String representation"""
+
+        return 'MaxNGen(%d)' % self.max_ngen
+
+
+class MaxWallTime(Callback):
+
+    """Stop the optimisation after a wall-clock time"""
+
+    def __init__(self, max_time):
+        """Constructor
+
+        Args:
+            max_time (float): time (s) after which no new generation is
+                started, counted from the first call
+        """
+
+        self.max_time = max_time
+        self.start_time = None
+
+    def __call__(self, generation):
+        """Return True if the time is up"""
+
+        if self.start_time is None:
+            self.start_time = time.time()
+
+        return time.time() - self.start_time >= self.max_time
+
+    def __str__(self):
+        """String representation"""
+
+        return 'MaxWallTime(%.6g s)' % self.max_time
+
+
+def _minimised_values(ind):
+    """Fitness values of an individual, as objectives to minimise"""
+
+    return -numpy.sign(ind.fitness.weights) * numpy.array(ind.fitness.values)
+
+
+class HypervolumeStagnation(Callback):
+
+    """Stop when the hypervolume of the front stops improving
+
+    The hypervolume of the non-dominated individuals of every generation is
+    approximated with tools.hypervolume(), which is fast enough for many
+    objectives. The optimisation stops when the relative improvement over
+    the last window generations is below epsilon.
+    """
+
+    def __init__(
+            self,
+            epsilon=1e-3,
+            window=10,
+            reference=None,
+            n_directions=1000,
+            seed=1):
+        """Constructor
+
+        Args:
+            epsilon (float): minimum relative improvement of the hypervolume
+            window (int): number of generations over which the improvement
+                is measured
+            reference (list of floats): reference point of the hypervolume,
+                in the space of the objectives to minimise. By default, the
+                worst values of the first generation plus 10%
+            n_directions (int): number of directions of the approximation
+            seed (int): seed of the directions
+        """
+
+        self.epsilon = epsilon
+        self.window = window
+        self.reference = reference
+        self.n_directions = n_directions
+        self.seed = seed
+
+        self.hypervolumes = []
+        self._directions = None
+
+    def hypervolume(self, population):
+        """Approximate hypervolume of the front of a population"""
+
+        front = deap.tools.sortNondominated(
+            population, len(population), first_front_only=True)[0]
+        points = numpy.array([_minimised_values(ind) for ind in front])
+
+        if self.reference is None:
+            worst = numpy.max(
+                [_minimised_values(ind) for ind in population], axis=0)
+            self.reference = worst + 0.1 * numpy.abs(worst) + 1e-9
+
+        reference = numpy.asarray(self.reference, dtype=float)
+        if self._directions is None:
+            self._directions = tools.direction_vectors(
+                len(reference), self.n_directions, self.seed)
+
+        # Scale the objectives, so that their units don't matter and the
+        # distances to the power of the number of objectives stay finite
+        scale = numpy.where(reference != 0, numpy.abs(reference), 1.0)
+
+        return tools.hypervolume(
+            points / scale, reference / scale, self._directions)
+
+    def __call__(self, generation):
+        """Return True if the hypervolume stagnates"""
+
+        self.hypervolumes.append(self.hypervolume(generation.population))
+        logger.debug(
+            'Generation %d: hypervolume %.6g',
+            generation.gen, self.hypervolumes[-1])
+
+        if len(self.hypervolumes) <= self.window:
+            return False
+
+        old, new = self.hypervolumes[-1 - self.window], self.hypervolumes[-1]
+        if old > 0:
+            improvement = (new - old) / old
+        else:
+            improvement = float('inf') if new > 0 else 0.0
+
+        return improvement < self.epsilon
+
+    def __str__(self):
+        """String representation"""
+
+        return 'HypervolumeStagnation(epsilon=%.6g, window=%d)' % (
+            self.epsilon, self.window)
+
+
+class HallOfFameStagnation(Callback):
+
+    """Stop when the hall of fame didn't change for a number of generations"""
+
+    def __init__(self, window=10):
+        """Constructor
+
+        Args:
+            window (int): number of generations without change of the hall
+                of fame after which the optimisation stops
+        """
+
+        self.window = window
+
+        self._last_members = None
+        self._last_change = None
+
+    def __call__(self, generation):
+        """Return True if the hall of fame stagnates"""
+
+        members = [tuple(ind) for ind in generation.halloffame]
+        if members != self._last_members:
+            self._last_members = members
+            self._last_change = generation.gen
+
+        return generation.gen - self._last_change >= self.window
+
+    def __str__(self):
+        """String representation"""
+
+        return 'HallOfFameStagnation(window=%d)' % self.window
+
+
+class TargetFitness(Callback):
+
+    """Stop when an individual reaches a target fitness"""
+
+    def __init__(self, target):
+        """Constructor
+
+        Args:
+            target (float or list of floats): target of the sum of the
+                objectives to minimise, or target of every objective
+        """
+
+        self.target = target
+
+    def reached(self, ind):
+        """Check if an individual reached the target"""
+
+        values = _minimised_values(ind)
+        if numpy.ndim(self.target) == 0:
+            return numpy.sum(values) <= self.target
+
+        return bool(numpy.all(values <= numpy.asarray(self.target)))
+
+    def __call__(self, generation):
+        """Return True if an individual reached the target"""
+
+        return any(self.reached(ind) for ind in generation.population)
+
+    def __str__(self):
+        """String representation"""
+
+        return 'TargetFitness(%s)' % (self.target,)
+
+
+class SwitchEvaluator(Callback):
+
+    """Switch the optimisation to another evaluator after a generation
+
+    E.g. to evaluate the first generations with a cheap model (like a
+    reduced morphology) and the next ones with the full model. The parents
+    are evaluated again with the new evaluator in the next generation, and
+    the hall of fame is cleared, so that the fitnesses of the two evaluators
+    are never compared
+    """
+
+    def __init__(self, optimisation, evaluator, after_gen):
+        """Constructor
+
+        Args:
+            optimisation (DEAPOptimisation): optimisation that is run
+            evaluator (Evaluator): evaluator of the next generations
+            after_gen (int): last generation evaluated with the current
+                evaluator
+        """
+
+        self.optimisation = optimisation
+        self.evaluator = evaluator
+        self.after_gen = after_gen
+        self.switched = False
+
+    def __call__(self, generation):
+        """Switch the evaluator after generation after_gen"""
+
+        if self.switched or generation.gen < self.after_gen:
+            return False
+
+        logger.info(
+            'Switching to evaluator %s after generation %d',
+            self.evaluator.__class__.__name__, generation.gen)
+
+        self.optimisation.set_evaluator(self.evaluator)
+        for ind in generation.parents:
+            del ind.fitness.values
+        if generation.halloffame is not None:
+            generation.halloffame.clear()
+        self.switched = True
+
+        return False
+
+    def __str__(self):
+        """String representation"""
+
+        return 'SwitchEvaluator(after_gen=%d)' % self.after_gen
@@ -0,0 +1,133 @@
+"""Cost model predicting the evaluation time of individuals"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# Evaluation times of individuals can differ by more than an order of
+# magnitude, and the individual that is evaluated last determines when a
+# generation ends. The cost model learns the time spent in every protocol
+# as a function of the parameters, so that the most expensive individuals
+# can be submitted first.
+
+import collections
+
+import numpy
+
+
+class CostModel(object):
+
+    """Predicts the evaluation time of individuals from their parameters
+
+    For every protocol (or other part of the evaluation timed by the
+    evaluator), a ridge regression of the logarithm of the duration on the
+    parameters is fitted to the most recent evaluations.
+    """
+
+    def __init__(self, max_samples=1000, regularisation=1e-3):
+        """Constructor
+
+        Args:
+            max_samples (int): number of most recent evaluations used to fit
+                the model of a protocol
+            regularisation (float): ridge regularisation of the regression
+        """
+
+        self.max_samples = max_samples
+        self.regularisation = regularisation
+
+        # Parameters and durations of the recent evaluations, per protocol
+        self.samples = collections.OrderedDict()
+        self._coefficients = {}
+
+    def update(self, params, timings):
+        """Add the durations of an evaluation
+
+        Args:
+            params (list of floats): parameter values of the individual
+            timings (dict): wall-clock time (s) spent in every protocol
+        """
+
+        for name, duration in timings.items():
+            params_list, durations = self.samples.setdefault(name, ([], []))
+            params_list.append(list(params))
+            durations.append(max(duration, 1e-9))
+
+            del params_list[:-self.max_samples]
+            del durations[:-self.max_samples]
+
+            self._coefficients.pop(name, None)
+
+    def _fit(self, name):
+        """Fit the regression of a protocol, return its coefficients"""
+
+        params_list, durations = self.samples[name]
+
+        params = numpy.array(params_list, dtype=float)
+        log_durations = numpy.log(durations)
+
+        # Normalise the parameters, so that the regularisation acts on all
+        # of them in the same way
+        mean = params.mean(axis=0)
+        std = params.std(axis=0)
+        std[std == 0] = 1.0
+
+        features = numpy.hstack([
+            numpy.ones((len(params), 1)),
+            (params - mean) / std])
+
+        penalty = self.regularisation * len(params) * \
+            numpy.eye(features.shape[1])
+        penalty[0, 0] = 0.0
+
+        weights = numpy.linalg.solve(
+            features.T.dot(features) + penalty,
+            features.T.dot(log_durations))
+
+        return mean, std, weights
+
+    def predict_protocol(self, name, params):
+        """Predicted duration (s) of a protocol, None if it has no samples"""
+
+        if name not in self.samples:
+            return None
+
+        if name not in self._coefficients:
+            self._coefficients[name] = self._fit(name)
+
+        mean, std, weights = self._coefficients[name]
+        features = numpy.hstack([[1.0], (numpy.array(params) - mean) / std])
+
+        return float(numpy.exp(features.dot(weights)))
+
+    def predict(self, params):
+        """Predicted duration (s) of an evaluation, None without samples"""
+
+        if not self.samples:
+            return None
+
+        return sum(self.predict_protocol(name, params)
+                   for name in self.samples)
+
+    def __str__(self):
+        """String representation"""
+
+        return 'Cost model of %d protocols with %s samples' % (
+            len(self.samples),
+            ', '.join('%s: %d' % (name, len(durations))
+                      for name, (_, durations) in self.samples.items()))
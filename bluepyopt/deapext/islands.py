@@ -0,0 +1,410 @@
+"""Island model optimisation"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# The islands of an archipelago are populations that evolve independently,
+# except that every migration_interval generations the elite individuals of
+# every island migrate to another island. The offspring of all the islands
+# is evaluated together, so that a generation of the archipelago has a
+# single barrier, and the islands share the workers of one executor.
+
+# pylint: disable=R0914
+
+import pickle
+import random
+import logging
+
+import numpy
+
+import deap.tools
+
+from . import algorithms
+from . import callbacks as deapext_callbacks
+from . import optimisations
+
+logger = logging.getLogger('__main__')
+
+TOPOLOGIES = ('ring', 'random')
+
+
+def migration_destinations(n_islands, topology='ring'):
+    """Return the destination island of the migrants of every island
+
+    Args:
+        n_islands (int): number of islands
+        topology (str): 'ring' sends the migrants of island i to island
+            i + 1, 'random' to a random other island, every island receiving
+            the migrants of exactly one island
+
+    Returns:
+        list with the index of the destination of every island
+    """
+
+    if topology not in TOPOLOGIES:
+        raise ValueError(
+            'migration_destinations: topology %s not in %s' %
+            (topology, ', '.join(TOPOLOGIES)))
+
+    if n_islands < 2:
+        return list(range(n_islands))
+
+    if topology == 'ring':
+        return [(index + 1) % n_islands for index in range(n_islands)]
+
+    # Random permutation without island sending to itself
+    while True:
+        destinations = random.sample(range(n_islands), n_islands)
+        if all(destination != index
+               for index, destination in enumerate(destinations)):
+            return destinations
+
+
+def migrate(islands_parents, toolbox, n_migrants, destinations):
+    """Exchange the elite individuals of the islands
+
+    On every island, the n_migrants individuals picked by toolbox.select
+    emigrate to their destination, where they replace the individuals that
+    toolbox.select leaves out. Individuals with different levels of
+    fidelity are selected like in the generations of the islands
+
+    Args:
+        islands_parents (list of lists): parents of every island
+        toolbox (deap Toolbox): toolbox with a select function
+        n_migrants (int): number of individuals leaving every island
+        destinations (list): destination island of every island
+
+    Returns:
+        list with the new parents of every island
+    """
+
+    # pylint: disable=W0212
+    emigrants = [
+        [toolbox.clone(ind) for ind in algorithms._select(
+            toolbox, parents, n_migrants)]
+        for parents in islands_parents]
+
+    new_islands_parents = []
+    for index, parents in enumerate(islands_parents):
+        immigrants = [
+            ind for source, destination in enumerate(destinations)
+            if destination == index for ind in emigrants[source]]
+        residents = algorithms._select(
+            toolbox, parents, len(parents) - len(immigrants))
+        new_islands_parents.append(list(residents) + immigrants)
+
+    return new_islands_parents
+
+
+class IslandDEAPOptimisation(optimisations.DEAPOptimisation):
+
+    """Optimisation of several populations (islands) with migration"""
+
+    def __init__(self, evaluator=None,
+                 n_islands=4,
+                 migration_interval=5,
+                 n_migrants=1,
+                 topology='ring',
+                 **kwargs):
+        """Constructor
+
+        Args:
+            evaluator (Evaluator): Evaluator object
+            n_islands (int): Number of islands
+            migration_interval (int): Generations between migrations
+            n_migrants (int): Number of individuals leaving every island at
+                every migration
+            topology (str): Destinations of the migrants, 'ring' or 'random'
+            kwargs: arguments of DEAPOptimisation, offspring_size is the
+                size of every island
+        """
+
+        if topology not in TOPOLOGIES:
+            raise ValueError(
+                'IslandDEAPOptimisation: topology argument only accepts %s' %
+                ', '.join('"%s"' % name for name in TOPOLOGIES))
+
+        super(IslandDEAPOptimisation, self).__init__(
+            evaluator=evaluator, **kwargs)
+
+        self.n_islands = n_islands
+        self.migration_interval = migration_interval
+        self.n_migrants = n_migrants
+        self.topology = topology
+
+    def _stream_key(self, island_index, gen):
+        """Key of the random streams of an island, None without streams"""
+
+        if not self.rng_streams:
+            return None
+
+        return (self.seed, 'island', island_index, gen)
+
+    @staticmethod
+    def _stats():
+        """Statistics recorded in the logbook of every island"""
+
+        stats = deap.tools.Statistics(key=lambda ind: ind.fitness.sum)
+        stats.register("avg", numpy.mean)
+        stats.register("std", numpy.std)
+        stats.register("min", numpy.min)
+        stats.register("max", numpy.max)
+
+        return stats
+
+    def _record(self, stats, islands, gen, invalid_counts):
+        """Record the statistics of every island"""
+
+        top_fidelity = algorithms._top_fidelity(  # pylint: disable=W0212
+            self.toolbox)
+        for index, island in enumerate(islands):
+            record = stats.compile(island['population'])
+            if top_fidelity is not None:
+                record['fidelity'] = \
+                    algorithms._fidelity_counts(  # pylint: disable=W0212
+                        island['population'], top_fidelity)
+            island['logbook'].record(
+                gen=gen, island=index, nevals=invalid_counts[index], **record)
+            logger.info(island['logbook'].stream)
+
+    def run_iter(self,
+                 max_ngen=10,
+                 offspring_size=None,
+                 continue_cp=False,
+                 cp_filename=None,
+                 cp_frequency=1):
+        """Run optimisation, yield the state after every generation
+
+        Takes the same arguments as run(). Yields an algorithms.Generation
+        of the whole archipelago after every generation: its population and
+        parents are those of all the islands, its logbook has the statistics
+        of the archipelago, and its islands the population, parents and
+        logbook of every island. The settings of the yielded Generation (mu
+        and lambda_ per island, cxpb, mutpb) can be changed for the next
+        generations
+        """
+
+        if offspring_size is None:
+            offspring_size = self.offspring_size
+
+        stats = self._stats()
+        top_fidelity = algorithms._top_fidelity(  # pylint: disable=W0212
+            self.toolbox)
+
+        if continue_cp:
+            with open(cp_filename, 'rb') as cp_file:
+                cp = pickle.load(cp_file)
+            islands = cp['islands']
+            start_gen = cp['generation']
+            self.hof = cp['halloffame']
+            history = cp['history']
+            # Checkpoints of older versions have no archipelago logbook
+            logbook = cp.get('logbook') or self._logbook(
+                stats, island_column=False)
+            random.setstate(cp['rndstate'])
+            nevals = 0
+        else:
+            start_gen = 1
+            history = deap.tools.History()
+            logbook = self._logbook(stats, island_column=False)
+            islands = []
+            for index in range(self.n_islands):
+                population = self.initial_population(
+                    offspring_size, stream_key=self._stream_key(index, 1))
+                islands.append(dict(
+                    population=population,
+                    parents=population[:],
+                    logbook=self._logbook(stats)))
+
+            nevals = self._evaluate(islands, start_gen, stats, history)
+            algorithms._record_stats(  # pylint: disable=W0212
+                stats, logbook, start_gen,
+                self._members(islands, 'population'), nevals, top_fidelity)
+
+        generation = self._generation(
+            start_gen, islands, logbook, history, offspring_size, None,
+            self.cxpb, self.mutpb, nevals, None, cp_filename, False)
+        yield generation
+
+        for gen in range(start_gen + 1, max_ngen + 1):
+            for index, island in enumerate(islands):
+                offspring = algorithms._get_offspring(  # pylint: disable=W0212
+                    island['parents'], self.toolbox, generation.cxpb,
+                    generation.mutpb, generation.lambda_,
+                    stream_key=self._stream_key(index, gen))
+                island['population'] = island['parents'] + offspring
+
+            nevals = self._evaluate(islands, gen, stats, history)
+            algorithms._record_stats(  # pylint: disable=W0212
+                stats, logbook, gen, self._members(islands, 'population'),
+                nevals, top_fidelity)
+
+            islands_parents = [
+                algorithms._select(  # pylint: disable=W0212
+                    self.toolbox,
+                    island['population'],
+                    generation.mu,
+                    self._stream_key(index, gen))
+                for index, island in enumerate(islands)]
+
+            if self.n_islands > 1 and self.migration_interval and \
+                    gen % self.migration_interval == 0:
+                with algorithms._stream(  # pylint: disable=W0212
+                        self._stream_key(None, gen), 'migration'):
+                    destinations = migration_destinations(
+                        self.n_islands, self.topology)
+                    logger.debug(
+                        'Migration of %d individuals per island to '
+                        'islands %s', self.n_migrants, destinations)
+                    islands_parents = migrate(
+                        islands_parents,
+                        self.toolbox,
+                        self.n_migrants,
+                        destinations)
+
+            for island, parents in zip(islands, islands_parents):
+                island['parents'] = parents
+
+            checkpointed = bool(cp_filename and cp_frequency and
+                                gen % cp_frequency == 0)
+            if checkpointed:
+                cp = dict(islands=islands,
+                          generation=gen,
+                          halloffame=self.hof,
+                          history=history,
+                          logbook=logbook,
+                          rndstate=random.getstate())
+                with open(cp_filename, 'wb') as cp_file:
+                    pickle.dump(cp, cp_file)
+                logger.debug('Wrote checkpoint to %s', cp_filename)
+
+                if self.retry is not None and self.retry.failures:
+                    self.retry.write_report(
+                        algorithms.failure_report_filename(cp_filename))
+
+            generation = self._generation(
+                gen, islands, logbook, history, generation.mu,
+                generation.lambda_, generation.cxpb, generation.mutpb,
+                nevals, logbook.stream, cp_filename, checkpointed)
+            yield generation
+
+    def run(self,
+            max_ngen=10,
+            offspring_size=None,
+            continue_cp=False,
+            cp_filename=None,
+            cp_frequency=1,
+            callbacks=None):
+        """Run optimisation
+
+        Args:
+            max_ngen (int): Total number of generations to run
+            offspring_size (int): Number of individuals of every island
+            continue_cp (bool): Whether to continue from checkpoint
+            cp_filename (str): Path to checkpoint filename
+            cp_frequency (int): Generations between checkpoints
+            callbacks (list of callables): functions called with the
+                algorithms.Generation of the archipelago after every
+                generation (see bluepyopt.deapext.callbacks), the
+                optimisation stops when one of them returns True. By default
+                a LogbookInfoWriter
+
+        Returns:
+            (populations, hof, logbooks, history) with the last population
+            and the logbook of every island, the hall of fame and the
+            history of all the islands
+        """
+
+        if callbacks is None:
+            callbacks = [deapext_callbacks.LogbookInfoWriter()]
+
+        for generation in self.run_iter(
+                max_ngen=max_ngen,
+                offspring_size=offspring_size,
+                continue_cp=continue_cp,
+                cp_filename=cp_filename,
+                cp_frequency=cp_frequency):
+            if algorithms.run_callbacks(callbacks, generation):
+                break
+
+        return [island['population'] for island in generation.islands], \
+            self.hof, \
+            [island['logbook'] for island in generation.islands], \
+            generation.history
+
+    def _logbook(self, stats, island_column=True):
+        """Empty logbook of an island, or of the archipelago"""
+
+        logbook = deap.tools.Logbook()
+        logbook.header = ['gen'] + (['island'] if island_column else []) + \
+            ['nevals'] + stats.fields
+        if algorithms._top_fidelity(  # pylint: disable=W0212
+                self.toolbox) is not None:
+            logbook.header.append('fidelity')
+
+        return logbook
+
+    @staticmethod
+    def _members(islands, key):
+        """Individuals of all the islands"""
+
+        return [ind for island in islands for ind in island[key]]
+
+    def _generation(self, gen, islands, logbook, history, mu, lambda_,
+                    cxpb, mutpb, nevals, stream, cp_filename, checkpointed):
+        """Generation of the archipelago"""
+
+        return algorithms.Generation(
+            gen,
+            self._members(islands, 'population'),
+            self._members(islands, 'parents'),
+            self.hof,
+            logbook,
+            history,
+            mu,
+            lambda_,
+            cxpb,
+            mutpb,
+            nevals=nevals,
+            stream=stream,
+            cp_filename=cp_filename,
+            checkpointed=checkpointed,
+            islands=islands)
+
+    def _evaluate(self, islands, gen, stats, history):
+        """Evaluate the new individuals of all the islands together"""
+
+        invalid_counts = [
+            len([ind for ind in island['population']
+                 if not ind.fitness.valid])
+            for island in islands]
+
+        algorithms._evaluate_invalid_fitness(  # pylint: disable=W0212
+            self.toolbox,
+            [ind for island in islands for ind in island['population']])
+
+        top_fidelity = algorithms._top_fidelity(  # pylint: disable=W0212
+            self.toolbox)
+        for island in islands:
+            algorithms._update_history_and_hof(  # pylint: disable=W0212
+                self.hof, history, island['population'], top_fidelity)
+
+        self._record(stats, islands, gen, invalid_counts)
+
+        return sum(invalid_counts)
@@ -32,9 +32,14 @@ import deap.algorithms
 import deap.tools
 
 from . import algorithms
+from . import callbacks as deapext_callbacks
+from . import costmodel
 from . import tools
 
 import bluepyopt.optimisations
+import bluepyopt.executors
+import bluepyopt.registry
+import bluepyopt.tools
 
 logger = logging.getLogger('__main__')
 
@@ -88,6 +93,40 @@ class WSListIndividual(list):
         super(WSListIndividual, self).__init__(*args, **kwargs)
 
 
+def wave_offspring_size(offspring_size, n_workers, bounds=None):
+    """Offspring size closest to offspring_size that fills whole waves
+
+    Args:
+        offspring_size (int): requested offspring size
+        n_workers (int): number of evaluations that run at the same time
+        bounds (tuple): (min, max) offspring size allowed, either can be
+            None. By default the offspring size can grow by at most one wave
+
+    Returns:
+        the multiple of n_workers closest to offspring_size that is within
+        the bounds, or the closest bound if there is no such multiple
+    """
+
+    lower, upper = bounds if bounds is not None else (None, None)
+    lower = 1 if lower is None else lower
+    upper = offspring_size + n_workers if upper is None else upper
+
+    if lower > upper:
+        raise ValueError(
+            'wave_offspring_size: lower bound %d larger than upper bound %d' %
+            (lower, upper))
+
+    waves = max(1, int(float(offspring_size) / n_workers + 0.5))
+    min_waves = max(1, -(-lower // n_workers))
+    candidates = [n_workers * waves_ for waves_ in
+                  range(min_waves, upper // n_workers + 1)]
+
+    if not candidates:
+        return min(max(offspring_size, lower), upper)
+
+    return min(candidates, key=lambda size: abs(size - n_workers * waves))
+
+
 class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
 
     """DEAP Optimisation class"""
@@ -101,7 +140,14 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
                  cxpb=1.0,
                  map_function=None,
                  hof=None,
-                 selector_name=None):
+                 selector_name=None,
+                 population_batch_size=None,
+                 evaluator_broadcast=None,
+                 executor=None,
+                 cost_model=None,
+                 speculation=None,
+                 retry=None,
+                 rng_streams=False):
         """Constructor
 
         Args:
@@ -118,6 +164,45 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
             hof (hof): Hall of Fame object
             selector_name (str): The selector used in the evolutionary
                 algorithm, possible values are 'IBEA' or 'NSGA2'
+            population_batch_size (int): Number of individuals evaluated
+                together with evaluator.evaluate_population, the batches
+                instead of the individuals are mapped. None evaluates the
+                individuals one by one
+            evaluator_broadcast (bluepyopt.registry.Broadcast): Broadcast
+                used to ship the evaluator once to the workers, after which
+                the mapped tasks only contain an evaluator id and parameter
+                values. True selects a ScoopBroadcast when use_scoop is set,
+                a LocalBroadcast when neither map_function nor executor is
+                set, and raises a ValueError otherwise. None pickles the
+                evaluator with every task
+            executor (bluepyopt.executors.Executor): Executor used to
+                evaluate the individuals, the fitnesses are assigned as soon
+                as the evaluations complete. Can't be combined with
+                use_scoop or map_function
+            cost_model (CostModel): model that learns the evaluation time
+                of the individuals, the individuals expected to take longest
+                are submitted first. True creates a CostModel. Not used when
+                population_batch_size is set
+            speculation (bluepyopt.executors.Speculation): re-execute the
+                evaluations that run much longer than the recent ones on
+                idle workers of the executor, keep the copy that finishes
+                first. True creates a Speculation. Requires an executor, and
+                an evaluator with use_params_for_seed set, so that both
+                copies give the same result
+            retry (bluepyopt.executors.RetryPolicy): resubmit the
+                evaluations of crashed workers, and give the max_score
+                objectives of the evaluator to the individuals that failed
+                after the retries, timed out, or raised a simulator
+                exception, instead of stopping the optimisation. The
+                failures are reported in a json file next to the
+                checkpoint. True creates a RetryPolicy. Requires an executor
+            rng_streams (bool): draw the random numbers used to create,
+                vary and select individuals from streams derived from
+                (seed, generation, individual index), and give every
+                individual a stream attribute from which the evaluator can
+                derive its own seed (e.g. CellEvaluator sets the Random123
+                global index with it). The results then don't depend on the
+                executor, the number of workers or the completion order
         """
 
         super(DEAPOptimisation, self).__init__(evaluator=evaluator)
@@ -129,6 +214,36 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
         self.cxpb = cxpb
         self.mutpb = mutpb
         self.map_function = map_function
+        self.population_batch_size = population_batch_size
+
+        if evaluator_broadcast is True:
+            if use_scoop:
+                evaluator_broadcast = bluepyopt.registry.ScoopBroadcast()
+            elif map_function is None and executor is None:
+                evaluator_broadcast = bluepyopt.registry.LocalBroadcast()
+            else:
+                # The tasks can run in other processes, in which a
+                # LocalBroadcast doesn't register the evaluator
+                raise ValueError(
+                    'DEAPOptimisation: evaluator_broadcast=True is only '
+                    'supported with use_scoop or the built-in map, pass a '
+                    'Broadcast (e.g. bluepyopt.registry.FileBroadcast) '
+                    'with a map_function or an executor')
+        self.evaluator_broadcast = evaluator_broadcast
+        self.executor = executor
+
+        if cost_model is True:
+            cost_model = costmodel.CostModel()
+        self.cost_model = cost_model
+
+        if speculation is True:
+            speculation = bluepyopt.executors.Speculation()
+        self.speculation = speculation
+
+        if retry is True:
+            retry = bluepyopt.executors.RetryPolicy()
+        self.retry = retry
+        self.rng_streams = rng_streams
 
         self.selector_name = selector_name
         if self.selector_name is None:
@@ -200,15 +315,7 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
             list,
             self.toolbox.Individual)
 
-        # Register the evaluation function for the individuals
-        # import deap_efel_eval1
-        self.toolbox.register("evaluate", self.evaluator.evaluate_with_lists)
-        
-        # Register the save simulation function with the individuals
-        self.toolbox.register("save_sim_response", self.evaluator.save_response_lists)
-        
-        # Register the evaluation function from the responses
-        self.toolbox.register("evaluate_response", self.evaluator.evaluate_from_responses)
+        self._register_evaluator()
 
         # Register the mate operator
         self.toolbox.register(
@@ -230,6 +337,9 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
         # Register the variate operator
         self.toolbox.register("variate", deap.algorithms.varAnd)
 
+        if self.rng_streams:
+            self.toolbox.rng_seed = self.seed
+
         # Register the selector (picks parents from population)
         if self.selector_name == 'IBEA':
             self.toolbox.register("select", tools.selIBEA)
@@ -246,7 +356,42 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
         import types
         copyreg.pickle(types.MethodType, _reduce_method)
 
-        if self.use_scoop:
+        if self.speculation is not None and self.executor is None:
+            raise Exception(
+                'DEAPOptimisation: speculation requires an executor')
+
+        if self.retry is not None and self.executor is None:
+            raise Exception(
+                'DEAPOptimisation: retry requires an executor')
+
+        if self.executor is not None:
+            if self.use_scoop or self.map_function:
+                raise Exception(
+                    'Impossible to use an executor and scoop or a self '
+                    'defined map function: %s' % self.executor)
+
+            self.toolbox.register("map", self.executor.map)
+            self.toolbox.executor = self.executor
+
+            if self.speculation is not None:
+                # Copies of an evaluation need to give the same result
+                if not (self.rng_streams or getattr(
+                        self.evaluator, 'use_params_for_seed', False)):
+                    raise Exception(
+                        'DEAPOptimisation: speculation requires rng_streams '
+                        'or an evaluator with use_params_for_seed set')
+                self.toolbox.speculation = self.speculation
+
+            if self.retry is not None:
+                max_score_objectives = self.evaluator.max_score_objectives()
+                if max_score_objectives is None:
+                    raise Exception(
+                        'DEAPOptimisation: retry requires an evaluator that '
+                        'defines max_score_objectives()')
+                self.toolbox.retry = self.retry
+                self.toolbox.max_score_objectives = max_score_objectives
+
+        elif self.use_scoop:
             if self.map_function:
                 raise Exception(
                     'Impossible to use scoop is providing self '
@@ -259,13 +404,119 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
         elif self.map_function:
             self.toolbox.register("map", self.map_function)
 
-    def run(self,
-            max_ngen=10,
-            offspring_size=None,
-            continue_cp=False,
-            cp_filename=None,
-            cp_frequency=1):
-        """Run optimisation"""
+    def _register_evaluator(self):
+        """Register the evaluation functions of the evaluator"""
+
+        # Register the evaluation function for the individuals
+        # import deap_efel_eval1
+        if self.evaluator_broadcast is not None:
+            evaluator_id = self.evaluator_broadcast.register(self.evaluator)
+
+            def evaluator_method(method_name):
+                """Task function calling a method of the evaluator"""
+                return bluepyopt.registry.RegisteredEvaluation(
+                    evaluator_id,
+                    method_name,
+                    loader=self.evaluator_broadcast.loader)
+        else:
+            def evaluator_method(method_name):
+                """Task function calling a method of the evaluator"""
+                return getattr(self.evaluator, method_name)
+
+        self.toolbox.register("evaluate", evaluator_method(
+            'evaluate_with_lists'))
+
+        # Register the timed evaluation function used by the cost model
+        if self.cost_model is not None:
+            self.toolbox.register("evaluate_timed", evaluator_method(
+                'evaluate_with_timings'))
+            self.toolbox.cost_model = self.cost_model
+
+        # Register the evaluation function of every level of fidelity,
+        # with the fraction of the individuals promoted to the next level
+        fidelity_levels = getattr(self.evaluator, 'fidelity_levels', None)
+        if fidelity_levels:
+            self.toolbox.fidelity_ladder = [
+                (functools.partial(
+                    evaluator_method('evaluate_at_fidelity'), index),
+                 fidelity.promote_fraction)
+                for index, fidelity in enumerate(fidelity_levels)]
+        elif hasattr(self.toolbox, 'fidelity_ladder'):
+            del self.toolbox.fidelity_ladder
+
+        # Register the evaluation function for batches of individuals
+        if self.population_batch_size:
+            self.toolbox.register(
+                "evaluate_population",
+                evaluator_method('evaluate_population'))
+            self.toolbox.population_batch_size = self.population_batch_size
+        
+        # Register the save simulation function with the individuals
+        self.toolbox.register("save_sim_response", self.evaluator.save_response_lists)
+        
+        # Register the evaluation function from the responses
+        self.toolbox.register("evaluate_response", self.evaluator.evaluate_from_responses)
+
+    def set_evaluator(self, evaluator):
+        """Evaluate the next individuals with another evaluator
+
+        E.g. to switch from the evaluator of a reduced model to the one of
+        the full model, see deapext.callbacks.SwitchEvaluator. The
+        evaluators need to have the same objectives
+        """
+
+        if len(evaluator.objectives) != len(self.evaluator.objectives):
+            raise ValueError(
+                'DEAPOptimisation: set_evaluator needs an evaluator with '
+                '%d objectives, not %d' %
+                (len(self.evaluator.objectives), len(evaluator.objectives)))
+
+        self.evaluator = evaluator
+        self._register_evaluator()
+
+        if self.retry is not None and self.executor is not None:
+            self.toolbox.max_score_objectives = \
+                self.evaluator.max_score_objectives()
+
+    def initial_population(self, size, stream_key=None):
+        """Create the individuals of the first generation
+
+        With rng_streams, individual i is drawn from the stream
+        stream_key + ('init', i), stream_key being (seed, 1) by default
+        """
+
+        if not self.rng_streams:
+            return self.toolbox.population(n=size)
+
+        if stream_key is None:
+            stream_key = (self.seed, 1)
+
+        population = []
+        for index in range(size):
+            with bluepyopt.tools.random_stream(
+                    *(stream_key + ('init', index))):
+                ind = self.toolbox.Individual()
+            ind.stream = stream_key + (index,)
+            population.append(ind)
+
+        return population
+
+    def run_iter(self,
+                 max_ngen=10,
+                 offspring_size=None,
+                 continue_cp=False,
+                 cp_filename=None,
+                 cp_frequency=1,
+                 fill_worker_waves=False,
+                 offspring_size_bounds=None):
+        """Run optimisation, yield the state after every generation
+
+        Takes the same arguments as run(). Yields an algorithms.Generation
+        with the population, hall of fame, logbook and history after every
+        generation. The optimisation stops when the caller stops asking for
+        generations, and the settings of the yielded Generation (mu,
+        lambda_, cxpb, mutpb) can be changed for the next generations
+        """
         # Allow run function to override offspring_size
         # TODO probably in the future this should not be an object field
         # anymore
@@ -273,8 +524,23 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
         if offspring_size is None:
             offspring_size = self.offspring_size
 
+        lambda_ = None
+        if fill_worker_waves:
+            n_workers = self.executor.n_workers \
+                if self.executor is not None else None
+            if n_workers:
+                lambda_ = wave_offspring_size(
+                    offspring_size, n_workers, offspring_size_bounds)
+                logger.info(
+                    'Using %d offspring individuals per generation for %d '
+                    'workers', lambda_, n_workers)
+            else:
+                logger.warning(
+                    'Number of workers unknown, not adapting the number of '
+                    'offspring individuals to it')
+
         # Generate the population object
-        pop = self.toolbox.population(n=offspring_size)
+        pop = self.initial_population(offspring_size)
 
         stats = deap.tools.Statistics(key=lambda ind: ind.fitness.sum)
         import numpy
@@ -283,23 +549,72 @@ class DEAPOptimisation(bluepyopt.optimisations.Optimisation):
         stats.register("min", numpy.min)
         stats.register("max", numpy.max)
 
-        pop, hof, log, history = algorithms.eaAlphaMuPlusLambdaCheckpoint(
-            pop,
-            self.toolbox,
-            offspring_size,
-            self.cxpb,
-            self.mutpb,
-            max_ngen,
-            stats=stats,
-            halloffame=self.hof,
-            cp_frequency=cp_frequency,
-            continue_cp=continue_cp,
-            cp_filename=cp_filename)
-
-        # Update hall of fame
-        self.hof = hof
+        for generation in algorithms.eaAlphaMuPlusLambdaGenerations(
+                pop,
+                self.toolbox,
+                offspring_size,
+                self.cxpb,
+                self.mutpb,
+                max_ngen,
+                stats=stats,
+                halloffame=self.hof,
+                cp_frequency=cp_frequency,
+                continue_cp=continue_cp,
+                cp_filename=cp_filename,
+                lambda_=lambda_):
+            # Update hall of fame
+            self.hof = generation.halloffame
+
+            yield generation
+
+    def run(self,
+            max_ngen=10,
+            offspring_size=None,
+            continue_cp=False,
+            cp_filename=None,
+            cp_frequency=1,
+            fill_worker_waves=False,
+            offspring_size_bounds=None,
+            callbacks=None):
+        """Run optimisation
+
+        Args:
+            max_ngen (int): Total number of generations to run
+            offspring_size (int): Number of parents, and by default of
+                offspring individuals, in each generation
+            continue_cp (bool): Whether to continue from checkpoint
+            cp_filename (str): Path to checkpoint filename
+            cp_frequency (int): Generations between checkpoints
+            fill_worker_waves (bool): Adapt the number of offspring
+                individuals of each generation to a multiple of the number
+                of workers of the executor, so that no worker is idle during
+                the last wave of evaluations. The worker count is queried
+                every time run is called, so a continued optimisation adapts
+                to the workers available at that moment
+            offspring_size_bounds (tuple): (min, max) number of offspring
+                individuals allowed when fill_worker_waves is set
+            callbacks (list of callables): functions called with the
+                algorithms.Generation after every generation (see
+                bluepyopt.deapext.callbacks), the optimisation stops when
+                one of them returns True. By default a LogbookInfoWriter
+        """
 
-        return pop, self.hof, log, history
+        if callbacks is None:
+            callbacks = [deapext_callbacks.LogbookInfoWriter()]
+
+        for generation in self.run_iter(
+                max_ngen=max_ngen,
+                offspring_size=offspring_size,
+                continue_cp=continue_cp,
+                cp_filename=cp_filename,
+                cp_frequency=cp_frequency,
+                fill_worker_waves=fill_worker_waves,
+                offspring_size_bounds=offspring_size_bounds):
+            if algorithms.run_callbacks(callbacks, generation):
+                break
+
+        return generation.population, self.hof, generation.logbook, \
+            generation.history
 
 
 class IBEADEAPOptimisation(DEAPOptimisation):
@@ -1,3 +1,4 @@
 """Init"""
 
 from .selIBEA import *  # NOQA
+from .hypervolume import *  # NOQA
@@ -0,0 +1,102 @@
+"""Hypervolume approximation"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+The approximation is the one of Deng and Zhang, "Approximating Hypervolume and
+Hypervolume Contributions Using Polar Coordinate", IEEE Transactions on
+Evolutionary Computation, 2019
+"""
+
+# The exact hypervolume is exponential in the number of objectives, and
+# uniform Monte Carlo sampling of the objective space fails with many
+# objectives, because the fraction of the space dominated by a front vanishes
+# (e.g. 0.5 ** 30 for a single point in the middle of 30 objectives). The
+# polar approximation instead averages, over random directions from the
+# reference point, the distance to the front to the power of the number of
+# objectives, which costs O(directions * points * objectives).
+
+import math
+
+import numpy
+
+
+def direction_vectors(n_objectives, n_directions=1000, seed=1):
+    """Return random unit vectors with positive components
+
+    Args:
+        n_objectives (int): number of objectives
+        n_directions (int): number of vectors
+        seed (int): seed of the random generator, fixed directions make the
+            hypervolumes of successive fronts comparable
+
+    Returns:
+        n_directions * n_objectives numpy array
+    """
+
+    rng = numpy.random.RandomState(seed)
+    directions = numpy.abs(rng.normal(size=(n_directions, n_objectives)))
+
+    # Avoid divisions by zero
+    directions = numpy.maximum(directions, 1e-12)
+
+    return directions / numpy.linalg.norm(directions, axis=1)[:, None]
+
+
+def hypervolume(points, reference, directions=None):
+    """Approximate hypervolume dominated by points, for minimisation
+
+    Args:
+        points (array-like): objective values, one row per point
+        reference (array-like): reference point, only the part of the space
+            between the points and the reference point counts
+        directions (numpy array): unit vectors returned by
+            direction_vectors(), by default 1000 vectors
+
+    Returns:
+        the approximation of the hypervolume
+    """
+
+    points = numpy.asarray(points, dtype=float)
+    if points.size == 0:
+        return 0.0
+
+    points = numpy.atleast_2d(points)
+    reference = numpy.asarray(reference, dtype=float)
+    n_objectives = len(reference)
+
+    if directions is None:
+        directions = direction_vectors(n_objectives)
+
+    # Distance from the reference point, along every direction, to the
+    # boundary of the region dominated by every point
+    distances = numpy.zeros(len(directions))
+    for point in points:
+        point_distances = numpy.min(
+            (reference - point) / directions, axis=1)
+        numpy.maximum(distances, point_distances, out=distances)
+
+    # Volume of the positive part of the unit ball, times the mean of the
+    # distances to the power of the dimension
+    constant = math.pi ** (n_objectives / 2.0) / \
+        (math.gamma(n_objectives / 2.0 + 1) * 2 ** n_objectives)
+
+    return constant * float(numpy.mean(distances ** n_objectives))
+
+
+__all__ = ['direction_vectors', 'hypervolume']
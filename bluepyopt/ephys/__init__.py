@@ -37,6 +37,9 @@ from . import responses  # NOQA
 from . import recordings  # NOQA
 from . import objectivescalculators  # NOQA
 from . import stimuli  # NOQA
+from . import sentinels  # NOQA
+from . import calibration  # NOQA
+from . import workers  # NOQA
 
 # TODO create all the necessary abstract methods
 # TODO check inheritance structure
@@ -0,0 +1,249 @@
+"""Calibration of the integrator settings of protocols"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# Every protocol of an evaluator is run for a few reference parameter sets
+# with its current integrator settings, and with every candidate setting.
+# The fastest candidate whose feature scores deviate by at most
+# max_deviation (in standard deviations of the features) from the scores of
+# the current settings is stored in the protocol.
+
+import copy
+import time
+import logging
+import collections
+
+from . import protocols
+
+logger = logging.getLogger(__name__)
+
+
+class IntegratorSettings(object):
+
+    """Integrator settings of a protocol"""
+
+    def __init__(self, cvode_active=None, dt=None, cvode_atol=None):
+        """Constructor
+
+        Args:
+            cvode_active (bool): whether to use variable time step, None to
+                use the setting of the simulator
+            dt (float): fixed time step, implies cvode_active=False
+            cvode_atol (float): absolute tolerance of cvode
+        """
+
+        self.cvode_active = False if dt is not None else cvode_active
+        self.dt = dt
+        self.cvode_atol = cvode_atol
+
+    def apply(self, protocol):
+        """Store the settings in the sweep protocols of a protocol"""
+
+        for subprotocol in protocol.subprotocols().values():
+            if isinstance(subprotocol, protocols.SweepProtocol):
+                subprotocol.cvode_active = self.cvode_active
+                subprotocol.dt = self.dt
+                subprotocol.cvode_atol = self.cvode_atol
+
+    def to_dict(self):
+        """Dictionary with the settings, e.g. to save them in json"""
+
+        return collections.OrderedDict([
+            ('cvode_active', self.cvode_active),
+            ('dt', self.dt),
+            ('cvode_atol', self.cvode_atol)])
+
+    def __str__(self):
+        """String representation"""
+
+        if self.dt is not None:
+            return 'dt=%g' % self.dt
+        elif self.cvode_active is None:
+            return 'simulator default'
+        elif not self.cvode_active:
+            return 'fixed dt of the simulator'
+        elif self.cvode_atol is None:
+            return 'cvode'
+
+        return 'cvode atol=%g' % self.cvode_atol
+
+
+def default_candidates():
+    """Candidate settings tried by calibrate_protocols by default"""
+
+    return [IntegratorSettings(cvode_active=True, cvode_atol=cvode_atol)
+            for cvode_atol in (1e-2, 1e-3, 1e-4)] + \
+        [IntegratorSettings(dt=dt) for dt in (0.1, 0.05, 0.025)]
+
+
+class Trial(object):
+
+    """Time and accuracy of the settings of a protocol"""
+
+    def __init__(self, settings, duration, deviation):
+        """Constructor
+
+        Args:
+            settings (IntegratorSettings): settings of the protocol
+            duration (float): wall-clock time (s) of the simulations of the
+                reference parameter sets
+            deviation (float): maximum absolute difference of the scores
+                with the ones of the current settings
+        """
+
+        self.settings = settings
+        self.duration = duration
+        self.deviation = deviation
+
+    def __str__(self):
+        """String representation"""
+
+        return '%s: %.3g s, deviation %.3g' % (
+            self.settings, self.duration, self.deviation)
+
+
+def _run_trial(evaluator, protocol, param_dicts, repeats):
+    """Best time and scores of a protocol for the parameter sets"""
+
+    durations = []
+    for _ in range(repeats):
+        start_time = time.time()
+        responses_list = [
+            evaluator.run_protocol(
+                protocol, param_values=param_dict, isolate=False)
+            for param_dict in param_dicts]
+        durations.append(time.time() - start_time)
+
+    scores_list = [evaluator.fitness_calculator.calculate_scores(responses)
+                   for responses in responses_list]
+
+    return min(durations), scores_list
+
+
+def _deviation(scores_list, reference_scores_list):
+    """Maximum absolute difference between lists of score dicts"""
+
+    return max(
+        abs(scores[name] - reference_scores[name])
+        for scores, reference_scores in zip(
+            scores_list, reference_scores_list)
+        for name in reference_scores)
+
+
+def calibrate_protocol(
+        evaluator,
+        protocol,
+        param_dicts,
+        candidates=None,
+        repeats=1):
+    """Time and accuracy of candidate integrator settings of a protocol
+
+    The protocol is not changed, the candidates are run on copies
+
+    Args:
+        evaluator (CellEvaluator): evaluator of the protocol
+        protocol (Protocol): protocol to calibrate
+        param_dicts (list of dicts): reference parameter sets
+        candidates (list of IntegratorSettings): settings to try, by
+            default the ones of default_candidates()
+        repeats (int): number of repetitions of the timings
+
+    Returns:
+        list of Trials, the first one with the current settings
+    """
+
+    if candidates is None:
+        candidates = default_candidates()
+
+    reference_duration, reference_scores_list = _run_trial(
+        evaluator, protocol, param_dicts, repeats)
+    trials = [Trial(None, reference_duration, 0.0)]
+
+    for settings in candidates:
+        candidate_protocol = copy.deepcopy(protocol)
+        settings.apply(candidate_protocol)
+
+        duration, scores_list = _run_trial(
+            evaluator, candidate_protocol, param_dicts, repeats)
+        trials.append(Trial(
+            settings,
+            duration,
+            _deviation(scores_list, reference_scores_list)))
+        logger.debug('Protocol %s: %s', protocol.name, trials[-1])
+
+    return trials
+
+
+def calibrate_protocols(
+        evaluator,
+        param_dicts,
+        candidates=None,
+        max_deviation=0.1,
+        repeats=1,
+        protocol_names=None):
+    """Store the fastest accurate integrator settings in every protocol
+
+    Every fitness protocol of the evaluator gets the fastest settings whose
+    scores deviate by at most max_deviation from the scores of its current
+    settings, for all the reference parameter sets. Protocols for which no
+    candidate is faster and accurate enough keep their settings.
+
+    Args:
+        evaluator (CellEvaluator): evaluator with the protocols to calibrate
+        param_dicts (list of dicts): reference parameter sets, e.g. a few
+            individuals of the hall of fame of a previous optimisation
+        candidates (list of IntegratorSettings): settings to try, by
+            default the ones of default_candidates()
+        max_deviation (float): maximum absolute difference of the scores of
+            the features (in standard deviations of the features)
+        repeats (int): number of repetitions of the timings
+        protocol_names (list of str): protocols to calibrate, by default
+            all the fitness protocols
+
+    Returns:
+        OrderedDict with the chosen IntegratorSettings of every calibrated
+        protocol, None for protocols that keep their settings
+    """
+
+    chosen = collections.OrderedDict()
+    for name, protocol in evaluator.fitness_protocols.items():
+        if protocol_names is not None and name not in protocol_names:
+            continue
+
+        trials = calibrate_protocol(
+            evaluator, protocol, param_dicts, candidates, repeats)
+
+        best = min(
+            (trial for trial in trials if trial.deviation <= max_deviation),
+            key=lambda trial: trial.duration)
+        chosen[name] = best.settings
+
+        if best.settings is not None:
+            best.settings.apply(protocol)
+
+        logger.info(
+            'Protocol %s: %s, %.3g s instead of %.3g s',
+            name,
+            best.settings if best.settings is not None else
+            'current settings',
+            best.duration,
+            trials[0].duration)
+
+    return chosen
@@ -2,13 +2,18 @@
 
 # pylint: disable=R0914
 
+import io
 import os
 import re
+import copy
+import json
+import time
+import tarfile
+import zipfile
 
 from collections import defaultdict, namedtuple, OrderedDict
 from datetime import datetime
 
-import jinja2
 import bluepyopt
 from . import mechanisms
 
@@ -22,6 +27,14 @@ from bluepyopt.ephys.parameterscalers import (NrnSegmentSomaDistanceScaler,
                                               FLOAT_FORMAT,
                                               format_float)
 
+DEFAULT_TEMPLATE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), 'templates'))
+
+# jinja2 environments by template directory. An environment keeps the
+# compiled templates of its directory, and only compiles them again when
+# their file changes
+_environments = {}
+
 Location = namedtuple('Location', 'name, value')
 Range = namedtuple('Range', 'location, param_name, value')
 DEFAULT_LOCATION_ORDER = [
@@ -60,30 +73,37 @@ def _generate_reinitrng(mechs):
     return reinitrng_content
 
 
-def _generate_parameters(parameters):
-    """Create a list of parameters that need to be added to the hoc template"""
+def _generate_param_locations(parameters):
+    """Parameters by section list, and order of the section lists"""
     param_locations = defaultdict(list)
-    global_params = {}
     for param in parameters:
-        if isinstance(param, NrnGlobalParameter):
-            global_params[param.name] = param.value
-        elif isinstance(param, MetaParameter):
-            pass
-        else:
+        if not isinstance(param, (NrnGlobalParameter, MetaParameter)):
             assert isinstance(
                 param.locations, (tuple, list)), 'Must have locations list'
             for location in param.locations:
                 param_locations[location.seclist_name].append(param)
 
-    section_params = defaultdict(list)
-    range_params = []
-
-    location_order = DEFAULT_LOCATION_ORDER
+    location_order = list(DEFAULT_LOCATION_ORDER)
 
     for loc in param_locations:
         if loc not in location_order:
             location_order.append(loc)
 
+    return param_locations, location_order
+
+
+def _generate_parameters(parameters):
+    """Create a list of parameters that need to be added to the hoc template"""
+    global_params = {}
+    for param in parameters:
+        if isinstance(param, NrnGlobalParameter):
+            global_params[param.name] = param.value
+
+    param_locations, location_order = _generate_param_locations(parameters)
+
+    section_params = defaultdict(list)
+    range_params = []
+
     for loc in location_order:
         if loc not in param_locations:
             continue
@@ -112,6 +132,31 @@ def _generate_parameters(parameters):
     return global_params, ordered_section_params, range_params, location_order
 
 
+def _get_environment(template_dir):
+    """Return the jinja2 environment of the templates of a directory"""
+
+    template_dir = os.path.abspath(template_dir)
+    if template_dir not in _environments:
+        # jinja2 is only imported when hoc is created, not by the processes
+        # that only evaluate models
+        import jinja2
+
+        _environments[template_dir] = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(template_dir))
+
+    return _environments[template_dir]
+
+
+def _generate_banner(disable_banner):
+    """Banner of the hoc code, None if disabled"""
+
+    if disable_banner:
+        return None
+
+    return 'Created by BluePyOpt(%s) at %s' % (
+        bluepyopt.__version__, datetime.now())
+
+
 def create_hoc(
         mechs,
         parameters,
@@ -121,7 +166,10 @@ def create_hoc(
         template_name='CCell',
         template_filename='cell_template.jinja2',
         disable_banner=None,
-        template_dir=None):
+        template_dir=None,
+        nseg_frequency=None,
+        d_lambda=0.1,
+        template_vars=None):
     '''return a string containing the hoc template
 
     Args:
@@ -136,18 +184,17 @@ def create_hoc(
         Must include 'proc replace_axon(){ ... }
         template (str): file name of the jinja2 template
         template_dir (str): dir name of the jinja2 template
+        nseg_frequency (float): If not None, frequency (Hz) of the d_lambda
+        rule that sets nseg after biophys(), instead of 1 + 2*int(L/40)
+        d_lambda (float): Maximum length of the segments, as a fraction of
+        the AC length constant at nseg_frequency
+        template_vars (dict): additional variables of the template
     '''
 
     if template_dir is None:
-        template_dir = os.path.abspath(
-            os.path.join(
-                os.path.dirname(__file__),
-                'templates'))
+        template_dir = DEFAULT_TEMPLATE_DIR
 
-    template_path = os.path.join(template_dir, template_filename)
-    with open(template_path) as template_file:
-        template = template_file.read()
-        template = jinja2.Template(template)
+    template = _get_environment(template_dir).get_template(template_filename)
 
     global_params, section_params, range_params, location_order = \
         _generate_parameters(parameters)
@@ -160,16 +207,10 @@ def create_hoc(
                 ignored_global] = global_params[ignored_global]
             del global_params[ignored_global]
 
-    if not disable_banner:
-        banner = 'Created by BluePyOpt(%s) at %s' % (
-            bluepyopt.__version__, datetime.now())
-    else:
-        banner = None
-
     re_init_rng = _generate_reinitrng(mechs)
 
     return template.render(template_name=template_name,
-                           banner=banner,
+                           banner=_generate_banner(disable_banner),
                            channels=channels,
                            morphology=morphology,
                            section_params=section_params,
@@ -177,4 +218,212 @@ def create_hoc(
                            global_params=global_params,
                            re_init_rng=re_init_rng,
                            replace_axon=replace_axon,
-                           ignored_global_params=ignored_global_params)
+                           ignored_global_params=ignored_global_params,
+                           nseg_frequency=nseg_frequency,
+                           d_lambda=d_lambda,
+                           **(template_vars or {}))
+
+
+def create_shared_hoc(
+        mechs,
+        parameters,
+        shared_name,
+        template_filename='cell_template_shared.jinja2',
+        disable_banner=None,
+        template_dir=None):
+    '''return a string containing the hoc code shared by a population
+
+    The code loads the morphologies and inserts the mechanisms, and doesn't
+    depend on the values of the parameters. The templates created by
+    create_hoc() with template_filename='cell_template_population.jinja2'
+    load it.
+
+    Args:
+        mechs (): All the mechs of the models
+        parameters (): All the parameters of the models, their values are
+            not used
+        shared_name (str): prefix of the procedures of the shared code
+        template_filename (str): file name of the jinja2 template
+        disable_banner (bool): don't add the banner
+        template_dir (str): dir name of the jinja2 template
+    '''
+
+    if template_dir is None:
+        template_dir = DEFAULT_TEMPLATE_DIR
+
+    template = _get_environment(template_dir).get_template(template_filename)
+
+    _, location_order = _generate_param_locations(parameters)
+
+    return template.render(
+        shared_name=shared_name,
+        banner=_generate_banner(disable_banner),
+        channels=_generate_channels_by_location(mechs, location_order))
+
+
+def _create_hoc_chunk(args):
+    """Hoc code of a chunk of parameter sets, on a copy of the model"""
+
+    cell_model, param_values_list, template_names, kwargs = args
+
+    # The parameters are frozen on a copy, the model of the caller isn't
+    # changed, and chunks can run at the same time
+    cell_model = copy.deepcopy(cell_model)
+
+    return [cell_model.create_hoc(
+        param_values, template_name=template_name, **kwargs)
+        for param_values, template_name in zip(
+            param_values_list, template_names)]
+
+
+def create_hocs(
+        cell_model,
+        param_values_list,
+        template_names=None,
+        shared_filename=None,
+        map_function=None,
+        chunk_size=100,
+        **kwargs):
+    '''return the hoc templates of a population of parameter sets
+
+    The cell model isn't changed, so that the templates can be created in
+    parallel by map_function
+
+    Args:
+        cell_model (CellModel): model of the population
+        param_values_list (list of dicts): parameter sets
+        template_names (list of str): names of the templates, by default
+            the name of the model followed by the index of the set
+        shared_filename (str): if set, the templates load the code shared by
+            all the models from this file, which contains the code returned
+            by create_shared_hoc() with cell_model.name as shared_name
+        map_function (map): function used to map the chunks of parameter
+            sets, e.g. the map of an executor, by default the builtin map
+        chunk_size (int): number of parameter sets of a chunk
+        kwargs: arguments of CellModel.create_hoc
+
+    Returns:
+        list of str, the hoc code of every parameter set
+    '''
+
+    if template_names is None:
+        template_names = ['%s_%d' % (cell_model.name, index)
+                          for index in range(len(param_values_list))]
+
+    if shared_filename is not None:
+        kwargs.setdefault('template', 'cell_template_population.jinja2')
+        kwargs['template_vars'] = dict(
+            kwargs.get('template_vars') or {},
+            shared_name=cell_model.name,
+            shared_filename=shared_filename)
+
+    chunks = [
+        (cell_model,
+         param_values_list[start:start + chunk_size],
+         template_names[start:start + chunk_size],
+         kwargs)
+        for start in range(0, len(param_values_list), chunk_size)]
+
+    if map_function is None:
+        map_function = map
+
+    return [hoc for chunk_hocs in map_function(_create_hoc_chunk, chunks)
+            for hoc in chunk_hocs]
+
+
+def _write_files(output, files):
+    """Write (name, content) pairs to a directory or an archive"""
+
+    if output.endswith('.zip'):
+        with zipfile.ZipFile(
+                output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files:
+                archive.writestr(name, content)
+    elif output.endswith(('.tar', '.tar.gz', '.tgz')):
+        mode = 'w' if output.endswith('.tar') else 'w:gz'
+        with tarfile.open(output, mode) as archive:
+            for name, content in files:
+                data = content.encode('utf-8')
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = time.time()
+                archive.addfile(info, io.BytesIO(data))
+    else:
+        if not os.path.isdir(output):
+            os.makedirs(output)
+        for name, content in files:
+            with open(os.path.join(output, name), 'w') as output_file:
+                output_file.write(content)
+
+
+def write_hocs(
+        cell_model,
+        param_values_list,
+        output,
+        template_names=None,
+        shared=True,
+        map_function=None,
+        chunk_size=100,
+        **kwargs):
+    '''write the hoc templates of a population to files or an archive
+
+    Every template is written to the file <template name>.hoc, the parameter
+    sets to <model name>_parameters.json.
+
+    Args:
+        cell_model (CellModel): model of the population
+        param_values_list (list of dicts): parameter sets, e.g. the
+            individuals of a hall of fame as dicts
+        output (str): directory, or path of a .zip, .tar, .tar.gz or .tgz
+            archive
+        template_names (list of str): names of the templates, by default
+            the name of the model followed by the index of the set
+        shared (bool): write the code that doesn't depend on the parameters
+            (morphology loading, mechanism insertion, ...) once, to
+            <model name>_shared.hoc, which is loaded by the templates.
+            Otherwise every template is self-contained
+        map_function (map): function used to map the chunks of parameter
+            sets, see create_hocs()
+        chunk_size (int): number of parameter sets of a chunk
+        kwargs: arguments of CellModel.create_hoc
+
+    Returns:
+        list of str, the names of the written files
+    '''
+
+    if template_names is None:
+        template_names = ['%s_%d' % (cell_model.name, index)
+                          for index in range(len(param_values_list))]
+
+    files = []
+    shared_filename = None
+    if shared:
+        shared_filename = '%s_shared.hoc' % cell_model.name
+        files.append((shared_filename, create_shared_hoc(
+            cell_model.mechanisms,
+            cell_model.params.values(),
+            cell_model.name,
+            disable_banner=kwargs.get('disable_banner'))))
+
+    hocs = create_hocs(
+        cell_model,
+        param_values_list,
+        template_names=template_names,
+        shared_filename=shared_filename,
+        map_function=map_function,
+        chunk_size=chunk_size,
+        **kwargs)
+    files += [('%s.hoc' % template_name, hoc)
+              for template_name, hoc in zip(template_names, hocs)]
+
+    parameters = OrderedDict(
+        (template_name, dict((name, float(value))
+                             for name, value in param_values.items()))
+        for template_name, param_values in zip(
+            template_names, param_values_list))
+    files.append(('%s_parameters.json' % cell_model.name,
+                  json.dumps(parameters, indent=2)))
+
+    _write_files(output, files)
+
+    return [name for name, _ in files]
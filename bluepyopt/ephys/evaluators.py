@@ -22,6 +22,8 @@ Copyright (c) 2016, EPFL/Blue Brain Project
 
 # pylint: disable=W0511
 
+import copy
+import collections
 import logging
 
 #from IPython.config import Application
@@ -34,6 +36,8 @@ logger = logging.getLogger(__name__)
 import bluepyopt as bpopt
 import bluepyopt.tools
 
+from .protocols import SnapshotSequenceProtocol
+
 import time
 
 
@@ -49,7 +53,8 @@ class CellEvaluator(bpopt.evaluators.Evaluator):
             fitness_calculator=None,
             isolate_protocols=None,
             sim=None,
-            use_params_for_seed=False):
+            use_params_for_seed=False,
+            prefix_snapshots=False):
         """Constructor
 
         Args:
@@ -62,13 +67,19 @@ class CellEvaluator(bpopt.evaluators.Evaluator):
                 ObjectivesCalculator object used for the transformation of
                 Responses into Objective objects
             isolate_protocols (bool): whether to use multiprocessing to
-                isolate the simulations
+                isolate the simulations, can be a workers.WorkerTemplate to
+                fork the processes from a pre-warmed forkserver
                 (disabling this could lead to unexpected behavior, and might
                 hinder the reproducability of the simulations)
             sim (ephys.simulators.NrnSimulator): simulator to use for the cell
                 evaluation
             use_params_for_seed (bool): use a hashed version of the parameter
                 dictionary as a seed for the simulator
+            prefix_snapshots (bool): simulate the periods during which
+                sweep protocols inject the same currents only once per
+                parameter set, and continue the protocols from snapshots of
+                the state at the end of these periods (all these protocols
+                are run in the same process)
         """
 
         super(CellEvaluator, self).__init__(
@@ -90,6 +101,10 @@ class CellEvaluator(bpopt.evaluators.Evaluator):
 
         self.isolate_protocols = isolate_protocols
         self.use_params_for_seed = use_params_for_seed
+        self.prefix_snapshots = prefix_snapshots
+
+        # Wall-clock time spent in every protocol during the last evaluation
+        self.protocol_durations = collections.OrderedDict()
 
     def param_dict(self, param_array):
         """Convert param_array in param_dict"""
@@ -145,34 +160,73 @@ class CellEvaluator(bpopt.evaluators.Evaluator):
             param_values,
             isolate=None,
             cell_model=None,
-            sim=None):
-        """Run protocol"""
+            sim=None,
+            random123_globalindex=None):
+        """Run protocol
+
+        The Random123 global index is derived from the parameter values with
+        use_params_for_seed, otherwise random123_globalindex is used if given.
+        The global index of the simulator is restored after the run
+        """
 
         sim = self.sim if sim is None else sim
 
         if self.use_params_for_seed:
-            sim.random123_globalindex = self.seed_from_param_dict(param_values)
-
-        return protocol.run(
-            self.cell_model if cell_model is None else cell_model,
+            random123_globalindex = self.seed_from_param_dict(param_values)
+
+        old_random123_globalindex = sim.random123_globalindex
+        if random123_globalindex is not None:
+            sim.random123_globalindex = random123_globalindex
+
+        try:
+            return protocol.run(
+                self.cell_model if cell_model is None else cell_model,
+                param_values,
+                sim=sim,
+                isolate=isolate)
+        finally:
+            sim.random123_globalindex = old_random123_globalindex
+
+    def run_protocols(
+            self,
+            protocols,
             param_values,
-            sim=sim,
-            isolate=isolate)
+            random123_globalindex=None):
+        """Run a set of protocols
 
-    def run_protocols(self, protocols, param_values):
-        """Run a set of protocols"""
+        The wall-clock time (s) spent in every protocol is stored in
+        protocol_durations
+        """
 
         responses = {}
+        self.protocol_durations = collections.OrderedDict()
+
+        if self.prefix_snapshots:
+            protocols = list(protocols)
+            shared_protocols = [
+                protocol for protocol in protocols
+                if SnapshotSequenceProtocol.can_share_prefix(protocol)]
+
+            if len(shared_protocols) > 1:
+                protocols = [protocol for protocol in protocols
+                             if protocol not in shared_protocols]
+                protocols.insert(0, SnapshotSequenceProtocol(
+                    name='prefix_snapshots',
+                    protocols=shared_protocols))
 
         for protocol in protocols:
+            start_time = time.time()
             responses.update(self.run_protocol(
                 protocol,
                 param_values=param_values,
-                isolate=self.isolate_protocols))
+                isolate=self.isolate_protocols,
+                random123_globalindex=random123_globalindex))
+            self.protocol_durations[protocol.name] = \
+                time.time() - start_time
 
         return responses
 
-    def evaluate_with_dicts(self, param_dict=None):
+    def evaluate_with_dicts(self, param_dict=None, random123_globalindex=None):
         """Run evaluation with dict as input and output"""
 
         if self.fitness_calculator is None:
@@ -183,7 +237,8 @@ class CellEvaluator(bpopt.evaluators.Evaluator):
 
         responses = self.run_protocols(
             self.fitness_protocols.values(),
-            param_dict)
+            param_dict,
+            random123_globalindex=random123_globalindex)
 
         return self.fitness_calculator.calculate_scores(responses)
     
@@ -204,22 +259,109 @@ class CellEvaluator(bpopt.evaluators.Evaluator):
         response_dict = response_list[0]
         return self.fitness_calculator.calculate_scores(response_dict)
 
-    
-    
+    def evaluate_population(self, param_lists):
+        """Run evaluation of several parameter sets in one simulation
+
+        For every protocol, a copy of the cell is instantiated for every
+        parameter set, and all the copies are simulated together. Protocols
+        that can't be run like this, and the evaluation with
+        use_params_for_seed or of individuals with random streams, fall back
+        to one simulation per parameter set.
+        """
+
+        if self.fitness_calculator is None:
+            raise Exception(
+                'CellEvaluator: need fitness_calculator to evaluate')
+
+        param_dicts = [self.param_dict(param_list)
+                       for param_list in param_lists]
+
+        if self.use_params_for_seed or any(
+                self.stream_globalindex(param_list) is not None
+                for param_list in param_lists):
+            # The Random123 global index is shared by all the cells
+            return [self.evaluate_with_lists(param_list)
+                    for param_list in param_lists]
+
+        logger.debug(
+            'Evaluating %d parameter sets of %s',
+            len(param_dicts),
+            self.cell_model.name)
+
+        responses_list = [{} for _ in param_dicts]
+        for protocol in self.fitness_protocols.values():
+            if hasattr(protocol, 'run_population'):
+                protocol_responses_list = protocol.run_population(
+                    self.cell_model,
+                    param_dicts,
+                    sim=self.sim,
+                    isolate=self.isolate_protocols)
+            else:
+                protocol_responses_list = [
+                    self.run_protocol(
+                        protocol,
+                        param_values=param_dict,
+                        isolate=self.isolate_protocols)
+                    for param_dict in param_dicts]
+
+            for responses, protocol_responses in zip(
+                    responses_list, protocol_responses_list):
+                responses.update(protocol_responses)
+
+        return [self.objective_list(
+            self.fitness_calculator.calculate_scores(responses))
+            for responses in responses_list]
+
+    @staticmethod
+    def stream_globalindex(param_list):
+        """Random123 global index of the random stream of an individual
+
+        Individuals created with random streams have a stream attribute
+        (seed, generation, index), None is returned for other parameter lists
+        """
+
+        stream = getattr(param_list, 'stream', None)
+
+        return bluepyopt.tools.stream_seed(*stream) \
+            if stream is not None else None
+
     def evaluate_with_lists(self, param_list=None):
         """Run evaluation with lists as input and outputs"""
 
         param_dict = self.param_dict(param_list)
 
-        obj_dict = self.evaluate_with_dicts(param_dict=param_dict)
+        obj_dict = self.evaluate_with_dicts(
+            param_dict=param_dict,
+            random123_globalindex=self.stream_globalindex(param_list))
 
         return self.objective_list(obj_dict)
 
+    def max_score_objectives(self):
+        """Objectives of a parameter set without responses
+
+        These are the objectives of a parameter set for which no protocol
+        could be run, every feature gets its max_score
+        """
+
+        if self.fitness_calculator is None:
+            raise Exception(
+                'CellEvaluator: need fitness_calculator to evaluate')
+
+        return self.objective_list(
+            self.fitness_calculator.calculate_scores({}))
+
     def evaluate(self, param_list=None):
         """Run evaluation with lists as input and outputs"""
 
         return self.evaluate_with_lists(param_list)
 
+    def evaluate_with_timings(self, param_list=None):
+        """Run evaluation, return objectives and time spent per protocol"""
+
+        objectives = self.evaluate_with_lists(param_list)
+
+        return objectives, dict(self.protocol_durations)
+
     def __str__(self):
 
         content = 'cell evaluator:\n'
@@ -246,12 +388,17 @@ class CellEvaluatorTimed(CellEvaluator):
     def __init__(self, **kwargs):
         super(CellEvaluatorTimed, self).__init__(**kwargs)
 
-    def evaluate_with_dicts(self, param_dict=None):
-        """Run evaluation with dict as input and output"""
+    def evaluate_with_dicts(self, param_dict=None, random123_globalindex=None):
+        """Run evaluation with dict as input and output
+
+        The wall-clock time (s) spent in every protocol is stored in
+        protocol_durations
+        """
 
         logger.debug('Evaluating %s', self.cell_model.name)
 
         responses = {}
+        self.protocol_durations = collections.OrderedDict()
         
         for protocol in self.fitness_protocols.values():
 
@@ -259,13 +406,201 @@ class CellEvaluatorTimed(CellEvaluator):
             results = self.run_protocol(
                 protocol,
                 param_values=param_dict,
-                isolate=self.isolate_protocols)
+                isolate=self.isolate_protocols,
+                random123_globalindex=random123_globalindex)
             responses.update(results)
                 
             end_time = time.time()
             sim_dur = end_time - start_time
+            self.protocol_durations[protocol.name] = sim_dur
             if sim_dur > 300:
                 logger.debug('Simulation cut-off')
                 break
         return self.fitness_calculator.calculate_scores(responses)
 
+
+class FidelityLevel(object):
+
+    """Cheaper settings of the evaluation of a CellEvaluator"""
+
+    def __init__(
+            self,
+            name,
+            dt=None,
+            cvode_atol=None,
+            total_duration=None,
+            protocol_names=None,
+            promote_fraction=0.5):
+        """Constructor
+
+        Args:
+            name (str): name of the level
+            dt (float): fixed time step of the simulations, the protocols
+                are run without cvode
+            cvode_atol (float): absolute tolerance of cvode
+            total_duration (float): maximum duration (ms) of the stimuli,
+                the protocols are truncated to this duration
+            protocol_names (list of str): names of the protocols that are
+                run, the features of the other protocols get their
+                max_score. By default all the protocols are run
+            promote_fraction (float): fraction of the individuals evaluated
+                at this level, with the best objectives, that are evaluated
+                at the next level
+        """
+
+        self.name = name
+        self.dt = dt
+        self.cvode_atol = cvode_atol
+        self.total_duration = total_duration
+        self.protocol_names = protocol_names
+        self.promote_fraction = promote_fraction
+
+    def apply(self, protocol):
+        """Change the settings of a (copied) protocol"""
+
+        if hasattr(protocol, 'protocols'):
+            protocols = protocol.protocols
+            if hasattr(protocols, 'values'):
+                protocols = protocols.values()
+            for sub_protocol in protocols:
+                self.apply(sub_protocol)
+
+        if hasattr(protocol, 'integrator_settings'):
+            if self.dt is not None:
+                protocol.cvode_active = False
+                protocol.dt = self.dt
+            if self.cvode_atol is not None:
+                protocol.cvode_atol = self.cvode_atol
+
+        if self.total_duration is not None:
+            for stimulus in getattr(protocol, 'stimuli', []):
+                if getattr(stimulus, 'total_duration', None) is not None:
+                    stimulus.total_duration = min(
+                        stimulus.total_duration, self.total_duration)
+
+    def __str__(self):
+
+        return '%s: dt=%s, cvode_atol=%s, total_duration=%s, ' \
+            'protocols=%s, promote_fraction=%g' % (
+                self.name, self.dt, self.cvode_atol, self.total_duration,
+                self.protocol_names, self.promote_fraction)
+
+
+class MultiFidelityEvaluator(bpopt.evaluators.Evaluator):
+
+    """Evaluator with cheaper levels of fidelity of a CellEvaluator
+
+    The evaluations of an optimisation start at the cheapest level, and only
+    the best individuals of every level are evaluated at the next one. The
+    last level is the evaluation of the wrapped CellEvaluator, which is also
+    used by evaluate_with_lists. DEAPOptimisation registers a fidelity ladder
+    for evaluators with fidelity_levels, and records the level of every
+    individual in its fidelity attribute.
+    """
+
+    def __init__(self, evaluator=None, fidelity_levels=None):
+        """Constructor
+
+        Args:
+            evaluator (CellEvaluator): evaluator of the full fidelity
+            fidelity_levels (list of FidelityLevel): cheaper levels, from
+                the cheapest to the most accurate one
+        """
+
+        super(MultiFidelityEvaluator, self).__init__(
+            evaluator.objectives, evaluator.params)
+
+        self.evaluator = evaluator
+        self.fidelity_levels = fidelity_levels \
+            if fidelity_levels is not None else []
+
+        self._level_evaluators = {}
+
+    @property
+    def use_params_for_seed(self):
+        """Whether the wrapped evaluator seeds from the parameters"""
+
+        return self.evaluator.use_params_for_seed
+
+    def level_evaluator(self, level):
+        """CellEvaluator with the settings of a level of fidelity"""
+
+        if level not in self._level_evaluators:
+            fidelity = self.fidelity_levels[level]
+
+            evaluator = copy.copy(self.evaluator)
+            evaluator.fitness_protocols = collections.OrderedDict()
+            for name, protocol in self.evaluator.fitness_protocols.items():
+                if fidelity.protocol_names is None or \
+                        name in fidelity.protocol_names:
+                    protocol = copy.deepcopy(protocol)
+                    fidelity.apply(protocol)
+                    evaluator.fitness_protocols[name] = protocol
+
+            self._level_evaluators[level] = evaluator
+
+        return self._level_evaluators[level]
+
+    def evaluate_at_fidelity(self, level, param_list=None):
+        """Evaluate a parameter list at a level of fidelity
+
+        Levels beyond the fidelity_levels are the full evaluation
+        """
+
+        if level >= len(self.fidelity_levels):
+            return self.evaluator.evaluate_with_lists(param_list)
+
+        return self.level_evaluator(level).evaluate_with_lists(param_list)
+
+    def evaluate_with_dicts(self, param_dict=None, random123_globalindex=None):
+        """Run the full evaluation with dict as input and output"""
+
+        return self.evaluator.evaluate_with_dicts(
+            param_dict, random123_globalindex=random123_globalindex)
+
+    def evaluate_with_lists(self, param_list=None):
+        """Run the full evaluation with lists as input and outputs"""
+
+        return self.evaluator.evaluate_with_lists(param_list)
+
+    def evaluate(self, param_list=None):
+        """Run the full evaluation with lists as input and outputs"""
+
+        return self.evaluator.evaluate_with_lists(param_list)
+
+    def evaluate_with_timings(self, param_list=None):
+        """Run the full evaluation, return objectives and protocol times"""
+
+        return self.evaluator.evaluate_with_timings(param_list)
+
+    def evaluate_population(self, param_lists):
+        """Run the full evaluation of several parameter sets"""
+
+        return self.evaluator.evaluate_population(param_lists)
+
+    def save_response_lists(self, param_list=None):
+        """Run the simulations of the full evaluation"""
+
+        return self.evaluator.save_response_lists(param_list)
+
+    def evaluate_from_responses(self, response_list=None):
+        """Run evaluation with response dictionary as input"""
+
+        return self.evaluator.evaluate_from_responses(response_list)
+
+    def max_score_objectives(self):
+        """Objectives of a parameter set without responses"""
+
+        return self.evaluator.max_score_objectives()
+
+    def __str__(self):
+
+        content = 'multi-fidelity evaluator:\n'
+
+        content += '  fidelity levels:\n'
+        for fidelity in self.fidelity_levels:
+            content += '    %s\n' % str(fidelity)
+
+        content += str(self.evaluator)
+
+        return content
@@ -37,6 +37,35 @@ from . import morphologies
 import logging
 logger = logging.getLogger(__name__)
 
+# Hoc code of the templates defined in NEURON by this process, by template
+# name. NEURON can't redefine a template, the code of a name is only
+# executed once
+_defined_templates = {}
+
+# Template names of the hoc strings of HocCellModels
+_template_names = {}
+
+# Hoc code of the empty templates of CellModels, by name and section names
+_empty_templates = {}
+
+
+def _define_template(sim, template_name, hoc_template):
+    """Define a hoc template in NEURON, unless it is already defined
+
+    Raises a ValueError if the template was defined with other hoc code,
+    NEURON would keep the old template
+    """
+
+    defined_template = _defined_templates.get(template_name)
+    if defined_template is None:
+        if not hasattr(sim.neuron.h, template_name):
+            sim.neuron.h(hoc_template)
+        _defined_templates[template_name] = hoc_template
+    elif defined_template != hoc_template:
+        raise ValueError(
+            'Template %s is already defined in NEURON with other hoc code, '
+            'it can not be redefined' % template_name)
+
 
 class Model(object):
 
@@ -68,7 +97,8 @@ class CellModel(Model):
             morph=None,
             mechs=None,
             params=None,
-            gid=0):
+            gid=0,
+            builder='hoc'):
         """Constructor
 
         Args:
@@ -81,9 +111,23 @@ class CellModel(Model):
                 Mechanisms associated with the cell
             params (list of Parameters):
                 Parameters of the cell model
+            builder (str): how the cell is instantiated. With 'hoc', the
+                morphology is imported by the hoc code of NEURON every time
+                and the parameters are scaled segment by segment. With
+                'python', the morphology is only imported the first time,
+                the next times its sections are created from its
+                NrnTopology with the Python API of NEURON, and the range
+                parameters are scaled at the cached soma distances of the
+                segments. The protocols load the morphology before they
+                run in isolated processes, see load_topology()
         """
         super(CellModel, self).__init__(name)
         self.check_name()
+        if builder not in ('hoc', 'python'):
+            raise ValueError(
+                'CellModel: unknown builder %s, expected hoc or python' %
+                builder)
+        self.builder = builder
         self.morphology = morph
         self.mechanisms = mechs
         self.params = collections.OrderedDict()
@@ -145,6 +189,13 @@ class CellModel(Model):
             secarray_names=None):
         '''create an hoc template named template_name for an empty cell'''
 
+        key = (
+            template_name,
+            tuple(seclist_names) if seclist_names else (),
+            tuple(secarray_names) if secarray_names else ())
+        if key in _empty_templates:
+            return _empty_templates[key]
+
         objref_str = 'objref this, CellRef'
         newseclist_str = ''
 
@@ -182,6 +233,8 @@ class CellModel(Model):
                           newseclist_str=newseclist_str,
                           create_str=create_str)
 
+        _empty_templates[key] = template
+
         return template
 
     @staticmethod
@@ -198,33 +251,95 @@ class CellModel(Model):
             name,
             seclist_names,
             secarray_names)
-        sim.neuron.h(hoc_template)
+        _define_template(sim, name, hoc_template)
 
         template_function = getattr(sim.neuron.h, name)
 
         return template_function()
 
-    def instantiate(self, sim=None):
-        """Instantiate model in simulator"""
+    def _create_icell(self, sim):
+        """Create an empty cell from the template of the model"""
 
         # TODO replace this with the real template name
         if not hasattr(sim.neuron.h, self.name):
-            self.icell = self.create_empty_cell(
+            return self.create_empty_cell(
                 self.name,
                 sim=sim,
                 seclist_names=self.seclist_names,
                 secarray_names=self.secarray_names)
-        else:
-            self.icell = getattr(sim.neuron.h, self.name)()
 
+        return getattr(sim.neuron.h, self.name)()
+
+    def load_topology(self, sim=None):
+        """Describe the sections of the morphology for the python builder
+
+        The NrnTopology is kept by the morphology, and the model is pickled
+        with it. The isolated processes of the protocols then create the
+        sections from it, instead of each importing the morphology file.
+        The soma distances of the segments are still computed in every
+        process
+        """
+
+        if self.builder != 'python' or \
+                not hasattr(self.morphology, 'instantiate_topology') or \
+                self.morphology.topology is not None:
+            return
+
+        icell = self._create_icell(sim)
+        self.morphology.instantiate_topology(sim=sim, icell=icell)
+        self.morphology.destroy(sim=sim)
+        icell.destroy()
+        sim.neuron.h.Vector().size()
+
+    def instantiate(self, sim=None):
+        """Instantiate model in simulator"""
+
+        self.icell = self._create_icell(sim)
         self.icell.gid = self.gid
 
-        self.morphology.instantiate(sim=sim, icell=self.icell)
+        if self.builder == 'python' and \
+                hasattr(self.morphology, 'instantiate_topology'):
+            topology = self.morphology.instantiate_topology(
+                sim=sim, icell=self.icell)
+        else:
+            topology = None
+            self.morphology.instantiate(sim=sim, icell=self.icell)
+
+        self._instantiate_biophysics(sim, topology)
+
+        # The discretisation can depend on parameters like Ra and cm. If it
+        # changes, the mechanisms are destroyed and instantiated again with
+        # the parameters on the new segments, so that no point process of
+        # the old segments is left behind
+        if self.morphology.update_nseg(sim=sim, icell=self.icell):
+            for mechanism in self.mechanisms:
+                mechanism.destroy(sim=sim)
+            self._instantiate_biophysics(sim, topology)
+
+    def _instantiate_biophysics(self, sim, topology=None):
+        """Insert the mechanisms and set the parameters
+
+        With a topology, the range parameters are set with the soma
+        distances of the segments computed once for all the parameters
+        """
 
         for mechanism in self.mechanisms:
             mechanism.instantiate(sim=sim, icell=self.icell)
+
+        segment_distances = None
         for param in self.params.values():
-            param.instantiate(sim=sim, icell=self.icell)
+            if topology is None or \
+                    not hasattr(param, 'instantiate_distances'):
+                param.instantiate(sim=sim, icell=self.icell)
+                continue
+
+            if segment_distances is None:
+                segment_distances = topology.segment_distances(
+                    sim=sim, isections=topology.cell_sections(self.icell))
+            param.instantiate_distances(
+                sim=sim,
+                icell=self.icell,
+                segment_distances=segment_distances)
 
     def destroy(self, sim=None):  # pylint: disable=W0613
         """Destroy instantiated model in simulator"""
@@ -261,8 +376,13 @@ class CellModel(Model):
     def create_hoc(self, param_values,
                    ignored_globals=(), template='cell_template.jinja2',
                    disable_banner=False,
-                   template_dir=None):
-        """Create hoc code for this model"""
+                   template_dir=None,
+                   template_name=None,
+                   template_vars=None):
+        """Create hoc code for this model
+
+        The name of the template is the name of the model by default
+        """
 
         to_unfreeze = []
         for param in self.params.values():
@@ -270,7 +390,8 @@ class CellModel(Model):
                 param.freeze(param_values[param.name])
                 to_unfreeze.append(param.name)
 
-        template_name = self.name
+        if template_name is None:
+            template_name = self.name
         morphology = os.path.basename(self.morphology.morphology_path)
         if self.morphology.do_replace_axon:
             replace_axon = self.morphology.replace_axon_hoc
@@ -285,12 +406,28 @@ class CellModel(Model):
                                     template_name=template_name,
                                     template_filename=template,
                                     template_dir=template_dir,
-                                    disable_banner=disable_banner)
+                                    disable_banner=disable_banner,
+                                    nseg_frequency=getattr(
+                                        self.morphology, 'nseg_frequency',
+                                        None),
+                                    d_lambda=getattr(
+                                        self.morphology, 'd_lambda', 0.1),
+                                    template_vars=template_vars)
 
         self.unfreeze(to_unfreeze)
 
         return ret
 
+    def write_hocs(self, param_values_list, output, **kwargs):
+        """Write the hoc code of parameter sets to files or an archive
+
+        The model isn't changed, see create_hoc.write_hocs() for the
+        arguments
+        """
+
+        return create_hoc.write_hocs(
+            self, param_values_list, output, **kwargs)
+
     def __str__(self):
         """Return string representation"""
 
@@ -413,6 +550,9 @@ class HocCellModel(CellModel):
         Note: this will fail if there is a begintemplate in a /* */ style
         comment before the real begintemplate
         """
+        if hoc_string in _template_names:
+            return _template_names[hoc_string]
+
         for i, line in enumerate(hoc_string.split('\n')):
             if 'begintemplate' in line:
                 line = line.strip().split()
@@ -420,6 +560,7 @@ class HocCellModel(CellModel):
                     'begintemplate must come first, line %d' % i
                 template_name = line[1]
                 logger.info('Found template %s on line %d', template_name, i)
+                _template_names[hoc_string] = template_name
                 return template_name
         else:  # pylint: disable=W0120
             raise Exception('Could not find begintemplate in hoc file')
@@ -435,9 +576,8 @@ class HocCellModel(CellModel):
             `Import3d_GUI(...).instantiate()`
         """
         template_name = HocCellModel.get_template_name(hoc_string)
-        if not hasattr(sim.neuron.h, template_name):
-            sim.neuron.h(hoc_string)
-            assert hasattr(sim.neuron.h, template_name), \
-                'NEURON does not have template: ' + template_name
+        _define_template(sim, template_name, hoc_string)
+        assert hasattr(sim.neuron.h, template_name), \
+            'NEURON does not have template: ' + template_name
 
         return template_name
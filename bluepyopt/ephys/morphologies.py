@@ -22,6 +22,7 @@ Copyright (c) 2016, EPFL/Blue Brain Project
 # pylint: disable=W0511
 
 import os
+import math
 import platform
 import logging
 from bluepyopt.ephys.base import BaseEPhys
@@ -35,14 +36,24 @@ logger = logging.getLogger(__name__)
 class Morphology(BaseEPhys):
 
     """Morphology class"""
-    pass
+
+    def update_nseg(self, sim=None, icell=None):  # pylint: disable=W0613
+        """Discretise the sections once the parameters are set
+
+        Returns:
+            True if the nseg of a section changed
+        """
+
+        return False
 
 
 class NrnFileMorphology(Morphology, DictMixin):
 
     """Morphology loaded from a file"""
     SERIALIZED_FIELDS = ('morphology_path', 'do_replace_axon', 'do_replace_axon_swc',
-                         'do_set_nseg', 'replace_axon_hoc', )
+                         'do_set_nseg', 'replace_axon_hoc',
+                         'nseg_frequency', 'd_lambda', 'collapse_distance',
+                         'collapse_bin_length', )
 
     def __init__(
             self,
@@ -51,7 +62,12 @@ class NrnFileMorphology(Morphology, DictMixin):
             stub_axon = False,
             do_set_nseg=True,
             comment='',
-            replace_axon_hoc=None):
+            replace_axon_hoc=None,
+            nseg_frequency=None,
+            d_lambda=0.1,
+            collapse_distance=None,
+            collapse_bin_length=10.0,
+            reduced_seclist_names=('basal', 'apical')):
         """Constructor
 
         Args:
@@ -62,6 +78,20 @@ class NrnFileMorphology(Morphology, DictMixin):
             replace_axon_hoc(str): String replacement for the 'replace_axon'
             command in hoc  Must include 'proc replace_axon(){ ... }  If None,
             the default replace_axon is used in any created hoc files
+            nseg_frequency(float): If not None, the nseg of the sections is
+            set with the d_lambda rule at this frequency (Hz) once the
+            parameters are set, instead of 1 + 2*int(L/40)
+            d_lambda(float): Maximum length of the segments, as a fraction
+            of the AC length constant at nseg_frequency
+            collapse_distance(float): If not None, the morphology is reduced:
+            the unbranched section chains are merged, and the subtrees
+            starting further than this distance (um) from the soma are
+            collapsed into equivalent cables, see collapse_subtrees()
+            collapse_bin_length(float): Length (um) of the distance bins in
+            which the membrane area of the collapsed subtrees is preserved
+            reduced_seclist_names(list of str): Section lists that are
+            reduced. Locations that refer to sections by index can't be
+            used in these section lists of a reduced morphology
         """
         name = os.path.basename(morphology_path)
         super(NrnFileMorphology, self).__init__(name=name, comment=comment)
@@ -77,6 +107,21 @@ class NrnFileMorphology(Morphology, DictMixin):
         else:
             self.replace_axon_hoc = replace_axon_hoc
 
+        self.nseg_frequency = nseg_frequency
+        self.d_lambda = d_lambda
+
+        self.collapse_distance = collapse_distance
+        self.collapse_bin_length = collapse_bin_length
+        self.reduced_seclist_names = reduced_seclist_names
+
+        # nseg of the sections computed with the d_lambda rule, per Ra and
+        # cm of the sections
+        self._nseg_cache = {}
+        self._last_nseg = None
+
+        # Sections of the morphology, see instantiate_topology()
+        self._topology = None
+
     def __str__(self):
         """Return string representation"""
 
@@ -122,10 +167,12 @@ class NrnFileMorphology(Morphology, DictMixin):
 
         morphology_importer.instantiate(icell)
 
-        # TODO Set nseg should be called after all the parameters have been
-        # set
-        # (in case e.g. Ra was changed)
-        if self.do_set_nseg:
+        if self.collapse_distance is not None:
+            self.reduce(sim=sim, icell=icell)
+
+        # With the d_lambda rule, nseg is set by update_nseg() after the
+        # parameters (in case e.g. Ra was changed)
+        if self.do_set_nseg and self.nseg_frequency is None:
             self.set_nseg(icell)
 
         # TODO replace these two functions with general function users can
@@ -135,6 +182,52 @@ class NrnFileMorphology(Morphology, DictMixin):
         elif self.stub_axon:
             self.replace_axon_with_stub(sim=sim, icell=icell)
 
+        self._set_last_nseg(icell)
+
+    @property
+    def topology(self):
+        """NrnTopology of the morphology, None until it is instantiated"""
+
+        return self._topology
+
+    def instantiate_topology(self, sim=None, icell=None):
+        """Create the sections from the topology of the morphology
+
+        The first time, the morphology is loaded by instantiate() and the
+        resulting sections are described in an NrnTopology. The next times,
+        the sections are created from the topology with the Python API of
+        NEURON, without reading and importing the morphology file
+
+        Returns:
+            the NrnTopology of the morphology
+        """
+
+        if self._topology is None:
+            self.instantiate(sim=sim, icell=icell)
+            self._topology = NrnTopology.from_icell(sim=sim, icell=icell)
+            logger.debug(
+                'Created topology of %s: %d sections', self.name,
+                len(self._topology.sections))
+        else:
+            self._topology.instantiate(sim=sim, icell=icell)
+            self._set_last_nseg(icell)
+
+        return self._topology
+
+    def _set_last_nseg(self, icell):
+        """Start from the last d_lambda discretisation
+
+        It is usually the one of the new parameters, so that update_nseg()
+        has nothing to change
+        """
+
+        if self.do_set_nseg and self.nseg_frequency is not None and \
+                self._last_nseg is not None:
+            sections = list(icell.all)
+            if len(sections) == len(self._last_nseg):
+                for section, nseg in zip(sections, self._last_nseg):
+                    section.nseg = nseg
+
     def destroy(self, sim=None):
         """Destroy morphology instantiation"""
         pass
@@ -145,8 +238,197 @@ class NrnFileMorphology(Morphology, DictMixin):
 
         for section in icell.all:
             section.nseg = 1 + 2 * int(section.L / 40)
-            
-            
+
+    def reduce(self, sim=None, icell=None):
+        """Merge the section chains and collapse the distal subtrees"""
+
+        n_sections = len(list(icell.all))
+
+        self.merge_chains(
+            sim=sim, icell=icell, seclist_names=self.reduced_seclist_names)
+        self.collapse_subtrees(
+            sim=sim,
+            icell=icell,
+            collapse_distance=self.collapse_distance,
+            bin_length=self.collapse_bin_length,
+            seclist_names=self.reduced_seclist_names)
+
+        logger.debug(
+            'Reduced morphology %s from %d to %d sections',
+            self.name, n_sections, len(list(icell.all)))
+
+    @staticmethod
+    def merge_chains(sim=None, icell=None, seclist_names=('basal', 'apical')):
+        """Merge the sections that are the only child of their parent
+
+        The 3d points of the child are appended to the parent, so that the
+        geometry and the distances from the soma don't change
+        """
+
+        for seclist_name in seclist_names:
+            merged = True
+            while merged:
+                merged = False
+                sections = list(getattr(icell, seclist_name))
+                names = set(section.name() for section in sections)
+                for section in sections:
+                    children = section.children()
+                    if len(children) != 1:
+                        continue
+                    child = children[0]
+                    if child.name() not in names or \
+                            child.parentseg().x != 1.0 or \
+                            child.orientation() != 0.0 or \
+                            section.n3d() < 2 or child.n3d() < 2:
+                        continue
+
+                    NrnFileMorphology._merge_child(sim, section, child)
+                    merged = True
+                    break
+
+    @staticmethod
+    def _merge_child(sim, section, child):
+        """Append child to section, and delete it
+
+        The first point of the child is skipped when it is the last point of
+        section
+        """
+
+        last = int(section.n3d()) - 1
+        if (child.x3d(0), child.y3d(0), child.z3d(0)) != \
+                (section.x3d(last), section.y3d(last), section.z3d(last)):
+            sim.neuron.h.pt3dadd(
+                child.x3d(0), child.y3d(0), child.z3d(0), child.diam3d(0),
+                sec=section)
+
+        offset = section.L
+        for index in range(1, int(child.n3d())):
+            sim.neuron.h.pt3dadd(
+                child.x3d(index), child.y3d(index), child.z3d(index),
+                child.diam3d(index), sec=section)
+
+        for grandchild in child.children():
+            x = (offset + grandchild.parentseg().x * child.L) / section.L
+            sim.neuron.h.disconnect(sec=grandchild)
+            grandchild.connect(section(x), 0.0)
+
+        sim.neuron.h.delete_section(sec=child)
+
+    @staticmethod
+    def collapse_subtrees(
+            sim=None,
+            icell=None,
+            collapse_distance=200.0,
+            bin_length=10.0,
+            seclist_names=('basal', 'apical')):
+        """Collapse the distal subtrees into equivalent cables
+
+        Every subtree that starts further than collapse_distance from the
+        soma is replaced by its first section, reshaped into a tapered
+        cable as long as the subtree is deep. The diameter of the cable at a
+        distance from the soma is such that it has the membrane area of the
+        whole subtree at that distance (within bins of bin_length), so that
+        the soma distance profile of the area, and thus of the conductances
+        distributed with NrnSegmentSomaDistanceScaler, is preserved. The
+        axial resistance is lower than the one of the subtree.
+        """
+
+        sim.neuron.h.distance(0, 0.5, sec=icell.soma[0])
+
+        # Measure the subtrees first, the distances change when they are
+        # reshaped
+        collapsed = []
+        for seclist_name in seclist_names:
+            sections = list(getattr(icell, seclist_name))
+            names = set(section.name() for section in sections)
+            for section in sections:
+                start = sim.neuron.h.distance(1, 0.0, sec=section)
+                parent = section.parentseg()
+                if start < collapse_distance or (
+                        parent is not None and
+                        parent.sec.name() in names and
+                        sim.neuron.h.distance(1, 0.0, sec=parent.sec) >=
+                        collapse_distance):
+                    continue
+
+                subtree = section.subtree()
+                if len(subtree) > 1:
+                    collapsed.append((section, subtree, _area_profile(
+                        sim, subtree, start, bin_length)))
+
+        for section, subtree, diams in collapsed:
+            _reshape_cable(sim, section, diams)
+            for descendant in subtree:
+                if descendant != section:
+                    sim.neuron.h.delete_section(sec=descendant)
+
+    @staticmethod
+    def lambda_f(section, frequency):
+        """AC length constant (um) of a section at a frequency (Hz)
+
+        Follows lambda_f() of fixnseg.hoc in NEURON, which takes the 3d
+        points of the section into account
+        """
+
+        ra_cm = section.Ra * section(0.5).cm
+        n3d = int(section.n3d())
+        if n3d < 2:
+            return 1e5 * math.sqrt(
+                section.diam / (4 * math.pi * frequency * ra_cm))
+
+        length = 0.0
+        arc, diam = section.arc3d(0), section.diam3d(0)
+        for index in range(1, n3d):
+            next_arc, next_diam = section.arc3d(index), section.diam3d(index)
+            length += (next_arc - arc) / math.sqrt(diam + next_diam)
+            arc, diam = next_arc, next_diam
+
+        # Length of the section in units of lambda
+        length *= math.sqrt(2) * 1e-5 * math.sqrt(
+            4 * math.pi * frequency * ra_cm)
+
+        return section.L / length
+
+    def d_lambda_nseg(self, section):
+        """Odd nseg of a section with the d_lambda rule"""
+
+        return int(
+            (section.L / (self.d_lambda *
+                          self.lambda_f(section, self.nseg_frequency)) +
+             0.9) / 2) * 2 + 1
+
+    def update_nseg(self, sim=None, icell=None):
+        """Set the nseg of every section with the d_lambda rule
+
+        The result is cached per Ra and cm of the sections
+
+        Returns:
+            True if the nseg of a section changed
+        """
+
+        if not self.do_set_nseg or self.nseg_frequency is None:
+            return False
+
+        sections = list(icell.all)
+        key = tuple((section.Ra, section(0.5).cm) for section in sections)
+
+        if key not in self._nseg_cache:
+            self._nseg_cache[key] = [
+                self.d_lambda_nseg(section) for section in sections]
+            logger.debug(
+                'Computed d_lambda nseg of %s: %d segments',
+                self.name, sum(self._nseg_cache[key]))
+        nsegs = self._nseg_cache[key]
+        self._last_nseg = nsegs
+
+        changed = False
+        for section, nseg in zip(sections, nsegs):
+            if section.nseg != nseg:
+                section.nseg = nseg
+                changed = True
+
+        return changed
+
     @staticmethod
     def replace_axon(sim=None, icell=None):
         """Read the AIS diameters from the swc file"""
@@ -261,3 +543,278 @@ proc replace_axon(){ local nSec, D1, D2
   axon[0] connect axon[1](0), 1
 }
         '''
+
+
+class NrnTopology(object):
+
+    """Sections of an instantiated morphology
+
+    Describes the sections that a morphology created in a cell: their
+    section array and index, 3d points (or length and diameter if they have
+    none), parent, nseg and section lists. The same sections can be created
+    again in other cells with the Python API of NEURON
+    """
+
+    def __init__(self, secarrays, sections, seclists):
+        """Constructor
+
+        Args:
+            secarrays (list): (name, size) of the section arrays
+            sections (list of dict): description of every section, with its
+                'array' and 'index', its 3d 'points' (array with the x, y, z
+                and diam rows) or its 'L' and 'diam' if points is None,
+                the index of its 'parent' in sections (None for the root),
+                'parent_x', 'child_x' and 'nseg'
+            seclists (dict): indices in sections of the sections of every
+                section list, in the order of the list
+        """
+
+        self.secarrays = secarrays
+        self.sections = sections
+        self.seclists = seclists
+
+        # Soma distances of the segments, per nseg and length of the sections
+        self._distances = {}
+
+        # NEURON vectors of the 3d points, they are not pickled
+        self._point_vectors = None
+
+    def __getstate__(self):
+        """Pickle without the NEURON vectors"""
+
+        state = self.__dict__.copy()
+        state['_point_vectors'] = None
+
+        return state
+
+    @classmethod
+    def from_icell(
+            cls,
+            sim=None,
+            icell=None,
+            seclist_names=(
+                'all', 'somatic', 'basal', 'apical', 'axonal',
+                'myelinated')):
+        """Describe the sections of an instantiated cell"""
+
+        import numpy
+
+        isections = [isection for isection in sim.neuron.h.allsec()
+                     if isection.cell() == icell]
+        indices = dict((isection.name(), index)
+                       for index, isection in enumerate(isections))
+
+        arrays = []
+        sizes = {}
+        sections = []
+        for isection in isections:
+            array, index = isection.name().split('.')[-1][:-1].split('[')
+            index = int(index)
+            if array not in sizes:
+                arrays.append(array)
+            sizes[array] = max(sizes.get(array, 0), index + 1)
+
+            parent = isection.parentseg()
+            section = {
+                'array': array,
+                'index': index,
+                'parent': indices[parent.sec.name()]
+                if parent is not None else None,
+                'parent_x': parent.x if parent is not None else None,
+                'child_x': isection.orientation(),
+                'nseg': isection.nseg,
+                'points': None}
+
+            n3d = int(isection.n3d())
+            if n3d > 0:
+                section['points'] = numpy.array(
+                    [[getattr(isection, coordinate)(point)
+                      for point in range(n3d)]
+                     for coordinate in ('x3d', 'y3d', 'z3d', 'diam3d')])
+            else:
+                section['L'] = isection.L
+                section['diam'] = isection.diam
+            sections.append(section)
+
+        secarrays = [(array, sizes[array]) for array in arrays]
+
+        seclists = dict(
+            (seclist_name, [indices[isection.name()]
+                            for isection in getattr(icell, seclist_name)])
+            for seclist_name in seclist_names
+            if hasattr(icell, seclist_name))
+
+        return cls(secarrays, sections, seclists)
+
+    def cell_sections(self, icell):
+        """Sections of an instantiated cell, in the order of sections"""
+
+        return [getattr(icell, section['array'])[section['index']]
+                for section in self.sections]
+
+    def instantiate(self, sim=None, icell=None):
+        """Create the sections in a cell
+
+        Returns:
+            the created sections, in the order of sections
+        """
+
+        described = set((section['array'], section['index'])
+                        for section in self.sections)
+        for array, size in self.secarrays:
+            sim.neuron.h.execute('~create %s[%d]\n' % (array, size), icell)
+            # Sections deleted from the array after the import
+            for index in range(size):
+                if (array, index) not in described:
+                    sim.neuron.h.delete_section(
+                        sec=getattr(icell, array)[index])
+
+        isections = self.cell_sections(icell)
+
+        if self._point_vectors is None:
+            self._point_vectors = [
+                [sim.neuron.h.Vector(row) for row in section['points']]
+                if section['points'] is not None else None
+                for section in self.sections]
+
+        for isection, section, point_vectors in zip(
+                isections, self.sections, self._point_vectors):
+            if point_vectors is None:
+                isection.L = section['L']
+                isection.diam = section['diam']
+            else:
+                sim.neuron.h.pt3dadd(*point_vectors, sec=isection)
+
+            if section['parent'] is not None:
+                isection.connect(
+                    isections[section['parent']](section['parent_x']),
+                    section['child_x'])
+
+            isection.nseg = section['nseg']
+
+        for seclist_name, indices in self.seclists.items():
+            iseclist = getattr(icell, seclist_name)
+            for index in indices:
+                iseclist.append(sec=isections[index])
+
+        return isections
+
+    def segment_distances(self, sim=None, isections=None):
+        """Soma distances of the segments of the sections of a cell
+
+        The distances are computed as NrnSegmentSomaDistanceScaler does, and
+        are cached per nseg and length of the sections
+
+        Args:
+            isections (list): the sections of the cell, in the order of
+                sections
+
+        Returns:
+            dict with the list of the distances of the segments of every
+            section
+        """
+
+        key = tuple((isection.nseg, isection.L) for isection in isections)
+        if key not in self._distances:
+            soma = isections[0].cell().soma[0]
+            sim.neuron.h.distance(0, 0.5, sec=soma)
+            self._distances[key] = [
+                [sim.neuron.h.distance(1, segment.x, sec=isection)
+                 for segment in isection]
+                for isection in isections]
+
+        return dict(zip(isections, self._distances[key]))
+
+
+def _area_profile(sim, sections, start, bin_length):
+    """Equivalent diameters of sections as a function of the soma distance
+
+    Args:
+        sections (list): sections of a subtree
+        start (float): soma distance of the start of the subtree
+        bin_length (float): approximate length of the bins
+
+    Returns:
+        (length, diams), with the length of the subtree from its start to
+        its furthest tip, and the diameter of a cylinder with the membrane
+        area of the sections in every bin of soma distance
+    """
+
+    # Frusta of the 3d points: (begin, end, area), begin and end relative
+    # to the start of the subtree
+    frusta = []
+    for section in sections:
+        begin = sim.neuron.h.distance(1, 0.0, sec=section) - start
+        n3d = int(section.n3d())
+        if n3d < 2:
+            frusta.append((begin, begin + section.L,
+                           math.pi * section.diam * section.L))
+            continue
+
+        # Distances follow L, which can differ from the arc of the points
+        scale = section.L / section.arc3d(n3d - 1) \
+            if section.arc3d(n3d - 1) > 0 else 1.0
+        for index in range(n3d - 1):
+            arc0, arc1 = section.arc3d(index), section.arc3d(index + 1)
+            radius0 = section.diam3d(index) / 2.0
+            radius1 = section.diam3d(index + 1) / 2.0
+            area = math.pi * (radius0 + radius1) * math.sqrt(
+                (radius0 - radius1) ** 2 + (arc1 - arc0) ** 2)
+            frusta.append((begin + scale * arc0, begin + scale * arc1, area))
+
+    length = max(end for _, end, _ in frusta)
+    n_bins = max(1, int(math.ceil(length / bin_length)))
+    bin_length = length / n_bins
+
+    areas = [0.0] * n_bins
+    for begin, end, area in frusta:
+        first = min(int(begin / bin_length), n_bins - 1)
+        last = min(int(end / bin_length), n_bins - 1)
+        if end <= begin or first == last:
+            areas[first] += area
+            continue
+        # Spread the area uniformly over the bins the frustum overlaps
+        for index in range(first, last + 1):
+            overlap = min(end, (index + 1) * bin_length) - \
+                max(begin, index * bin_length)
+            areas[index] += area * max(overlap, 0.0) / (end - begin)
+
+    return length, [area / (math.pi * bin_length) for area in areas]
+
+
+def _reshape_cable(sim, section, profile):
+    """Replace the 3d points of section by a cable with a diameter profile
+
+    The diameters are set at the middle of the bins, the cable keeps the
+    first point and the direction of the section
+    """
+
+    length, diams = profile
+    bin_length = length / len(diams)
+
+    n3d = int(section.n3d())
+    if n3d >= 2:
+        origin = [section.x3d(0), section.y3d(0), section.z3d(0)]
+        direction = [section.x3d(n3d - 1) - origin[0],
+                     section.y3d(n3d - 1) - origin[1],
+                     section.z3d(n3d - 1) - origin[2]]
+    else:
+        origin = [0.0, 0.0, 0.0]
+        direction = [1.0, 0.0, 0.0]
+    norm = math.sqrt(sum(coord ** 2 for coord in direction))
+    if norm == 0:
+        direction, norm = [1.0, 0.0, 0.0], 1.0
+    direction = [coord / norm for coord in direction]
+
+    arcs = [0.0] + [(index + 0.5) * bin_length
+                    for index in range(len(diams))] + [length]
+    diams = [diams[0]] + list(diams) + [diams[-1]]
+
+    sim.neuron.h.pt3dclear(sec=section)
+    for arc, diam in zip(arcs, diams):
+        sim.neuron.h.pt3dadd(
+            origin[0] + arc * direction[0],
+            origin[1] + arc * direction[1],
+            origin[2] + arc * direction[2],
+            diam,
+            sec=section)
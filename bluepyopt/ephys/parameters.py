@@ -360,6 +360,39 @@ class NrnRangeParameter(NrnParameter, DictMixin):
             self.value,
             self.value_scaler)
 
+    def instantiate_distances(
+            self, sim=None, icell=None, segment_distances=None):
+        """Instantiate with the soma distances of the segments
+
+        The scaler computes the values of all the segments of a section at
+        once, see NrnTopology.segment_distances()
+
+        Args:
+            segment_distances (dict): soma distances of the segments of
+                every section
+        """
+
+        if not hasattr(self.value_scaler, 'scale_distances'):
+            self.instantiate(sim=sim, icell=icell)
+            return
+
+        if self.value is None:
+            raise Exception(
+                'NrnRangeParameter: impossible to instantiate parameter "%s" '
+                'without value' % self.name)
+
+        for location in self.locations:
+            for isection in location.instantiate(sim=sim, icell=icell):
+                distances = segment_distances.get(isection)
+                if distances is None:
+                    values = [self.value_scale_func(self.value, seg, sim=sim)
+                              for seg in isection]
+                else:
+                    values = self.value_scaler.scale_distances(
+                        self.value, distances)
+                for seg, value in zip(isection, values):
+                    setattr(seg, self.param_name, value)
+
     def __str__(self):
         """String representation"""
         return '%s: %s %s = %s' % (self.name,
@@ -21,6 +21,7 @@ Copyright (c) 2016, EPFL/Blue Brain Project
 
 # pylint: disable=W0511
 
+import math
 import string
 
 from bluepyopt.ephys.base import BaseEPhys
@@ -29,6 +30,23 @@ from bluepyopt.ephys.serializer import DictMixin
 
 FLOAT_FORMAT = '%.17g'
 
+# Functions of the distance and value compiled from the instantiated
+# distributions, by instantiated distribution
+_distance_functions = {}
+
+
+def _distance_function(inst_distribution):
+    """Function of the distance and value of an instantiated distribution"""
+
+    if inst_distribution not in _distance_functions:
+        source = 'lambda distance, value: ' + inst_distribution.format(
+            distance='distance', value='value')
+        # pylint: disable=W0123
+        _distance_functions[inst_distribution] = eval(
+            source, dict(globals(), math=math))
+
+    return _distance_functions[inst_distribution]
+
 
 def format_float(value):
     """Return formatted float string"""
@@ -80,6 +98,11 @@ class NrnSegmentLinearScaler(ParameterScaler, DictMixin):
 
         return self.multiplier * value + self.offset
 
+    def scale_distances(self, value, distances):
+        """Scale a value for segments at soma distances"""
+
+        return [self.scale(value)] * len(distances)
+
     def __str__(self):
         """String representation"""
 
@@ -171,6 +194,24 @@ class NrnSegmentSomaDistanceScaler(ParameterScaler, DictMixin):
         # pylint: disable=W0123
         return eval(self.eval_dist(value, distance))
 
+    def scale_distances(self, value, distances):
+        """Scale a value for segments at soma distances
+
+        Gives the same values as scale(), but the distribution is compiled
+        once into a function of the distance and value
+        """
+
+        if not value >= 0:
+            # The formatted negative value could change the precedence of
+            # the operators of the distribution, the string is evaluated
+            # (pylint: disable=W0123)
+            return [eval(self.eval_dist(value, distance))
+                    for distance in distances]
+
+        distance_function = _distance_function(self.inst_distribution)
+
+        return [distance_function(distance, value) for distance in distances]
+
     def __str__(self):
         """String representation"""
 
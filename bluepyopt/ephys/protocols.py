@@ -22,13 +22,59 @@ Copyright (c) 2016, EPFL/Blue Brain Project
 # pylint: disable=W0511
 
 import collections
+import copy
 
 # TODO: maybe find a better name ? -> sweep ?
 import logging
 logger = logging.getLogger(__name__)
 
 from . import locations
+from . import responses as ephys_responses
 from . import simulators
+from . import workers
+
+
+def _run_isolated(run_func, isolate=None, **kwargs):
+    """Call run_func with kwargs, in a separate process if isolate is True
+
+    If isolate is a WorkerTemplate, the process is forked from its
+    pre-warmed forkserver
+    """
+
+    if isolate is None:
+        isolate = True
+
+    if isolate:
+        # The cell model is pickled to the process, with the topology of
+        # its morphology once it is loaded here
+        cell_model = kwargs.get('cell_model')
+        if kwargs.get('sim') is not None and \
+                hasattr(cell_model, 'load_topology'):
+            cell_model.load_topology(sim=kwargs['sim'])
+
+        def _reduce_method(meth):
+            """Overwrite reduce"""
+            return (getattr, (meth.__self__, meth.__func__.__name__))
+
+        import copyreg
+        import types
+        copyreg.pickle(types.MethodType, _reduce_method)
+
+        import multiprocessing
+
+        if isinstance(isolate, workers.WorkerTemplate):
+            pool = isolate.pool(1, maxtasksperchild=1)
+        else:
+            pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        responses = pool.apply(run_func, kwds=kwargs)
+
+        pool.terminate()
+        pool.join()
+        del pool
+    else:
+        responses = run_func(**kwargs)
+
+    return responses
 
 
 class Protocol(object):
@@ -115,7 +161,10 @@ class SweepProtocol(Protocol):
             name=None,
             stimuli=None,
             recordings=None,
-            cvode_active=None):
+            cvode_active=None,
+            sentinels=None,
+            dt=None,
+            cvode_atol=None):
         """Constructor
 
         Args:
@@ -124,12 +173,27 @@ class SweepProtocol(Protocol):
             recordings (list of Recordings): Recording objects used in the
                 protocol
             cvode_active (bool): whether to use variable time step
+            sentinels (list of Sentinels): Sentinel objects that stop the
+                simulation early, all recordings return None when one of
+                them is triggered
+            dt (float): fixed time step of the protocol, instead of the one
+                of the simulator. Implies cvode_active=False
+            cvode_atol (float): absolute tolerance of cvode, when the
+                protocol uses variable time step
         """
 
+        if dt is not None and cvode_active:
+            raise ValueError(
+                'SweepProtocol: impossible to combine dt and cvode_active '
+                'in protocol %s' % name)
+
         super(SweepProtocol, self).__init__(name)
         self.stimuli = stimuli
         self.recordings = recordings
         self.cvode_active = cvode_active
+        self.sentinels = sentinels if sentinels is not None else []
+        self.dt = dt
+        self.cvode_atol = cvode_atol
 
     @property
     def total_duration(self):
@@ -142,21 +206,80 @@ class SweepProtocol(Protocol):
 
         return collections.OrderedDict({self.name: self})
 
-    def _run_func(self, cell_model, param_values, sim=None):
-        """Run protocols"""
+    def integrator_settings(self):
+        """Integrator arguments of NrnSimulator.run for this protocol
 
-        try:
-            cell_model.freeze(param_values)
-            cell_model.instantiate(sim=sim)
+        dt and cvode_atol are only given when they are set
+        """
 
-            self.instantiate(sim=sim, icell=cell_model.icell)
+        settings = dict(cvode_active=self.cvode_active)
+        if self.dt is not None:
+            settings.update(cvode_active=False, dt=self.dt)
+        if self.cvode_atol is not None:
+            settings.update(cvode_atol=self.cvode_atol)
 
-            try:
-                sim.run(self.total_duration, cvode_active=self.cvode_active)
-            except (RuntimeError, simulators.NrnSimulatorException):
+        return settings
+
+    def continue_settings(self):
+        """Integrator arguments of NrnSimulator.continue_run"""
+
+        settings = self.integrator_settings()
+        del settings['cvode_active']
+
+        return settings
+
+    def timeline(self):
+        """Injected currents as a function of time
+
+        Returns:
+            list of (key, segments) tuples sorted by key, with key the
+            stimulus class name and location and segments the timeline of
+            the stimulus. None if the protocol can't share the start of its
+            simulation with other protocols
+        """
+
+        if self.sentinels:
+            return None
+
+        timelines = []
+        for stimulus in self.stimuli:
+            segments = stimulus.timeline()
+            if segments is None:
+                return None
+            timelines.append((
+                (stimulus.__class__.__name__, str(stimulus.location)),
+                segments))
+
+        return sorted(timelines, key=lambda timeline: timeline[0])
+
+    def _simulate(self, sim, param_values, state=None, continue_run=False):
+        """Simulate the instantiated protocol, return responses"""
+
+        try:
+            if continue_run:
+                sim.continue_run(
+                    self.total_duration, **self.continue_settings())
+            elif state is not None:
+                sim.run(
+                    self.total_duration,
+                    state=state,
+                    **self.integrator_settings())
+            else:
+                sim.run(self.total_duration, **self.integrator_settings())
+        except (RuntimeError, simulators.NrnSimulatorException):
+            logger.debug(
+                'SweepProtocol: Running of parameter set {%s} generated '
+                'an exception, returning None in responses',
+                str(param_values))
+            responses = {recording.name:
+                         None for recording in self.recordings}
+        else:
+            if self.triggered_sentinels:
                 logger.debug(
-                    'SweepProtocol: Running of parameter set {%s} generated '
-                    'an exception, returning None in responses',
+                    'SweepProtocol: Sentinels %s stopped parameter set '
+                    '{%s}, returning None in responses',
+                    ', '.join(sentinel.name for sentinel in
+                              self.triggered_sentinels),
                     str(param_values))
                 responses = {recording.name:
                              None for recording in self.recordings}
@@ -165,6 +288,19 @@ class SweepProtocol(Protocol):
                     recording.name: recording.response
                     for recording in self.recordings}
 
+        return responses
+
+    def _run_func(self, cell_model, param_values, sim=None):
+        """Run protocols"""
+
+        try:
+            cell_model.freeze(param_values)
+            cell_model.instantiate(sim=sim)
+
+            self.instantiate(sim=sim, icell=cell_model.icell)
+
+            responses = self._simulate(sim, param_values)
+
             self.destroy(sim=sim)
 
             cell_model.destroy(sim=sim)
@@ -182,38 +318,96 @@ class SweepProtocol(Protocol):
     def run(self, cell_model, param_values, sim=None, isolate=None):
         """Instantiate protocol"""
 
-        if isolate is None:
-            isolate = True
+        return _run_isolated(
+            self._run_func,
+            isolate=isolate,
+            cell_model=cell_model,
+            param_values=param_values,
+            sim=sim)
 
-        if isolate:
-            def _reduce_method(meth):
-                """Overwrite reduce"""
-                return (getattr, (meth.__self__, meth.__func__.__name__))
+    def _run_population_func(self, cell_model, param_values_list, sim=None):
+        """Run protocol for several parameter sets in one simulation"""
 
-            import copyreg
-            import types
-            copyreg.pickle(types.MethodType, _reduce_method)
+        try:
+            # Every parameter set gets its own copy of the cell and of the
+            # stimuli and recordings that are attached to it
+            copies = []
+            for param_values in param_values_list:
+                cell_copy = copy.deepcopy(cell_model)
+                protocol_copy = copy.deepcopy(self)
 
-            import multiprocessing
+                cell_copy.freeze(param_values)
+                cell_copy.instantiate(sim=sim)
+                protocol_copy.instantiate(sim=sim, icell=cell_copy.icell)
 
-            pool = multiprocessing.Pool(1, maxtasksperchild=1)
-            responses = pool.apply(
-                self._run_func,
-                kwds={
-                    'cell_model': cell_model,
-                    'param_values': param_values,
-                    'sim': sim})
-
-            pool.terminate()
-            pool.join()
-            del pool
-        else:
-            responses = self._run_func(
-                cell_model=cell_model,
-                param_values=param_values,
-                sim=sim)
+                copies.append((cell_copy, protocol_copy))
 
-        return responses
+            settings = self.integrator_settings()
+            try:
+                sim.run(
+                    self.total_duration,
+                    use_local_dt=len(copies) > 1,
+                    **settings)
+            except (RuntimeError, simulators.NrnSimulatorException):
+                logger.debug(
+                    'SweepProtocol: Running of %d parameter sets generated '
+                    'an exception, returning None in responses',
+                    len(copies))
+                responses_list = [
+                    {recording.name: None for recording in self.recordings}
+                    for _ in copies]
+            else:
+                responses_list = [
+                    {recording.name: recording.response
+                     for recording in protocol_copy.recordings}
+                    for _, protocol_copy in copies]
+
+            for cell_copy, protocol_copy in copies:
+                protocol_copy.destroy(sim=sim)
+                cell_copy.destroy(sim=sim)
+
+            return responses_list
+        except BaseException:
+            import sys
+            import traceback
+            raise Exception(
+                "".join(
+                    traceback.format_exception(*sys.exc_info())))
+
+    def can_run_population(self):
+        """Check if run_population() can simulate parameter sets together"""
+
+        # Sentinels stop the simulation of all the cells, and protocols that
+        # override run() have custom behavior that would be bypassed
+        return type(self).run == SweepProtocol.run and not self.sentinels
+
+    def run_population(
+            self,
+            cell_model,
+            param_values_list,
+            sim=None,
+            isolate=None):
+        """Run protocol for several parameter sets in one simulation
+
+        A copy of the cell is instantiated for every parameter set, and all
+        the copies are simulated together. With cvode every cell gets its
+        own variable time step.
+
+        Returns:
+            list of responses, one for every parameter set
+        """
+
+        if not self.can_run_population():
+            return [self.run(cell_model, param_values, sim=sim,
+                             isolate=isolate)
+                    for param_values in param_values_list]
+
+        return _run_isolated(
+            self._run_population_func,
+            isolate=isolate,
+            cell_model=cell_model,
+            param_values_list=param_values_list,
+            sim=sim)
 
     def instantiate(self, sim=None, icell=None):
         """Instantiate"""
@@ -230,6 +424,16 @@ class SweepProtocol(Protocol):
                     'location exception, will return empty response for '
                     'this recording')
 
+        for sentinel in self.sentinels:
+            sentinel.instantiate(sim=sim, icell=icell)
+
+    @property
+    def triggered_sentinels(self):
+        """Sentinels that stopped the last run"""
+
+        return [sentinel for sentinel in self.sentinels
+                if sentinel.triggered]
+
     def destroy(self, sim=None):
         """Destroy protocol"""
 
@@ -239,6 +443,9 @@ class SweepProtocol(Protocol):
         for recording in self.recordings:
             recording.destroy(sim=sim)
 
+        for sentinel in self.sentinels:
+            sentinel.destroy(sim=sim)
+
     def __str__(self):
         """String representation"""
 
@@ -252,6 +459,11 @@ class SweepProtocol(Protocol):
         for recording in self.recordings:
             content += '    %s\n' % str(recording)
 
+        if self.sentinels:
+            content += '  sentinels:\n'
+            for sentinel in self.sentinels:
+                content += '    %s\n' % str(sentinel)
+
         return content
 
 
@@ -265,7 +477,10 @@ class StepProtocol(SweepProtocol):
             step_stimulus=None,
             holding_stimulus=None,
             recordings=None,
-            cvode_active=None):
+            cvode_active=None,
+            sentinels=None,
+            dt=None,
+            cvode_atol=None):
         """Constructor
 
         Args:
@@ -274,6 +489,10 @@ class StepProtocol(SweepProtocol):
             recordings (list of Recordings): Recording objects used in the
                 protocol
             cvode_active (bool): whether to use variable time step
+            sentinels (list of Sentinels): Sentinel objects that stop the
+                simulation early
+            dt (float): fixed time step of the protocol
+            cvode_atol (float): absolute tolerance of cvode
         """
 
         super(StepProtocol, self).__init__(
@@ -283,7 +502,10 @@ class StepProtocol(SweepProtocol):
                 holding_stimulus]
             if holding_stimulus is not None else [step_stimulus],
             recordings=recordings,
-            cvode_active=cvode_active)
+            cvode_active=cvode_active,
+            sentinels=sentinels,
+            dt=dt,
+            cvode_atol=cvode_atol)
 
         self.step_stimulus = step_stimulus
         self.holding_stimulus = holding_stimulus
@@ -297,3 +519,403 @@ class StepProtocol(SweepProtocol):
     def step_duration(self):
         """Time stimulus starts"""
         return self.step_stimulus.step_duration
+
+
+def _segments_current(segments, start, end):
+    """Current at start and end of an interval inside one of the segments"""
+
+    for seg_start, seg_end, amp_start, amp_end in segments:
+        if seg_start <= start and end <= seg_end:
+            slope = (amp_end - amp_start) / (seg_end - seg_start)
+            return (amp_start + slope * (start - seg_start),
+                    amp_start + slope * (end - seg_start))
+
+    return None
+
+
+def _segments_agreement(segments, other_segments, tolerance=1e-12):
+    """Time until which two stimulus timelines inject the same current"""
+
+    breakpoints = sorted(set(
+        [segment[0] for segment in segments + other_segments] +
+        [segment[1] for segment in segments + other_segments]))
+
+    for start, end in zip(breakpoints[:-1], breakpoints[1:]):
+        current = _segments_current(segments, start, end)
+        other_current = _segments_current(other_segments, start, end)
+        if current is None or other_current is None or \
+                abs(current[0] - other_current[0]) > tolerance or \
+                abs(current[1] - other_current[1]) > tolerance:
+            return start
+
+    return breakpoints[-1] if breakpoints else 0.0
+
+
+def _timelines_agreement(timeline, other_timeline):
+    """Time until which two protocol timelines inject the same currents"""
+
+    if [key for key, _ in timeline] != [key for key, _ in other_timeline]:
+        return 0.0
+
+    return min(
+        _segments_agreement(segments, other_segments)
+        for (_, segments), (_, other_segments)
+        in zip(timeline, other_timeline))
+
+
+class ProtocolTreeNode(object):
+
+    """Node of a tree of protocols that share the start of their simulation
+
+    The node simulates the period from start to end, that all its protocols
+    have in common. The children of a node start at the end of their parent.
+    A leaf has a single protocol, and ends at the total duration of it.
+    """
+
+    def __init__(self, protocols=None, start=None, end=None, children=None):
+        """Constructor
+
+        Args:
+            protocols (list of SweepProtocols): protocols in this subtree
+            start (float): time (ms) at which the node starts
+            end (float): time (ms) at which the node ends
+            children (list of ProtocolTreeNodes): subtrees starting at end
+        """
+
+        self.protocols = protocols
+        self.start = start
+        self.end = end
+        self.children = children if children is not None else []
+
+    @property
+    def is_leaf(self):
+        """Return True if the node has no children"""
+
+        return len(self.children) == 0
+
+    @property
+    def simulated_duration(self):
+        """Time (ms) simulated to run all the protocols of this subtree"""
+
+        return (self.end - self.start) + sum(
+            child.simulated_duration for child in self.children)
+
+    def __str__(self):
+        """String representation"""
+
+        content = '[%.6g, %.6g] ms: %s\n' % (
+            self.start,
+            self.end,
+            ', '.join(protocol.name for protocol in self.protocols))
+        for child in self.children:
+            content += ''.join(
+                '  %s\n' % line for line in str(child).splitlines())
+
+        return content
+
+
+class SnapshotSequenceProtocol(SequenceProtocol):
+
+    """Sequence of sweep protocols sharing the start of their simulation
+
+    All the protocols are run in the same cell instance. The protocols are
+    arranged in a tree based on the timelines of their stimuli: the period
+    during which a set of protocols inject the same currents is simulated
+    only once, its final state is saved with a Neuron SaveState, and
+    restored at the start of every branch. The recordings of the shared
+    periods are prepended to the recordings of the branches.
+    """
+
+    def __init__(self, name=None, protocols=None):
+        """Constructor
+
+        Args:
+            name (str): name of this object
+            protocols (list of SweepProtocols): subprotocols this protocol
+                consists of
+        """
+
+        super(SnapshotSequenceProtocol, self).__init__(name, protocols)
+
+    @staticmethod
+    def can_share_prefix(protocol):
+        """Check if protocol can be run from a snapshot of another one"""
+
+        # Protocols that override run() have custom behavior that would be
+        # bypassed
+        return isinstance(protocol, SweepProtocol) and \
+            type(protocol).run == SweepProtocol.run and \
+            protocol.timeline() is not None
+
+    def plan(self):
+        """Arrange the protocols in trees of shared simulation periods
+
+        Returns:
+            list of ProtocolTreeNodes starting at time 0, protocols that
+            don't share anything with other protocols are single leaves
+        """
+
+        shared = [protocol for protocol in self.protocols
+                  if self.can_share_prefix(protocol)]
+        timelines = {id(protocol): protocol.timeline()
+                     for protocol in shared}
+
+        def agreement(protocol, other):
+            """Time until which two protocols can share their simulation"""
+            if protocol.integrator_settings() != \
+                    other.integrator_settings():
+                return 0.0
+            return min(
+                _timelines_agreement(
+                    timelines[id(protocol)], timelines[id(other)]),
+                protocol.total_duration,
+                other.total_duration)
+
+        def partition(protocols, time):
+            """Split protocols in sets that agree beyond time"""
+            classes = []
+            for protocol in protocols:
+                for protocol_class in classes:
+                    if agreement(protocol_class[0], protocol) > time:
+                        protocol_class.append(protocol)
+                        break
+                else:
+                    classes.append([protocol])
+            return classes
+
+        def build(protocols, start):
+            """Build the subtree of protocols that agree until start"""
+            if len(protocols) == 1:
+                return ProtocolTreeNode(
+                    protocols, start, protocols[0].total_duration)
+
+            end = min(agreement(protocols[0], protocol)
+                      for protocol in protocols[1:])
+            return ProtocolTreeNode(
+                protocols,
+                start,
+                end,
+                [build(protocol_class, end)
+                 for protocol_class in partition(protocols, end)])
+
+        roots = [build(protocol_class, 0.0)
+                 for protocol_class in partition(shared, 0.0)]
+        roots.extend(
+            ProtocolTreeNode([protocol], 0.0, protocol.total_duration)
+            for protocol in self.protocols if protocol not in shared)
+
+        return roots
+
+    @property
+    def saved_duration(self):
+        """Time (ms) of simulation saved per run by sharing periods"""
+
+        return sum(protocol.total_duration for protocol in self.protocols) - \
+            sum(root.simulated_duration for root in self.plan())
+
+    @staticmethod
+    def _extend_prefix(prefix, recording):
+        """Append the points recorded after prefix to it"""
+
+        time = recording.tvector.to_python()
+        voltage = recording.varvector.to_python()
+
+        if prefix is None:
+            return time, voltage
+
+        prefix_time, prefix_voltage = prefix
+        new_points = [
+            index for index, point_time in enumerate(time)
+            if point_time > prefix_time[-1]]
+
+        return (prefix_time + [time[index] for index in new_points],
+                prefix_voltage + [voltage[index] for index in new_points])
+
+    @staticmethod
+    def _prepend_recording(recording, prefix):
+        """Prepend the recording of the shared periods to a response"""
+
+        response = recording.response
+        if response is None or prefix is None:
+            return None
+
+        prefix_time, prefix_voltage = prefix
+        time = response['time']
+        voltage = response['voltage']
+        after_prefix = time > prefix_time[-1]
+
+        return ephys_responses.TimeVoltageResponse(
+            recording.name,
+            prefix_time + list(time[after_prefix]),
+            prefix_voltage + list(voltage[after_prefix]))
+
+    @staticmethod
+    def _instantiate_tree(sim, icell, protocol, recordings):
+        """Instantiate the stimuli of protocol and all the tree recordings
+
+        All the recordings of the tree are instantiated for every protocol,
+        since a SaveState can only be restored when the number of recorded
+        vectors is the same as when it was saved
+        """
+
+        for stimulus in protocol.stimuli:
+            stimulus.instantiate(sim=sim, icell=icell)
+
+        for recording in recordings:
+            try:
+                recording.instantiate(sim=sim, icell=icell)
+            except locations.EPhysLocInstantiateException:
+                logger.debug(
+                    'SnapshotSequenceProtocol: Instantiating recording '
+                    'generated location exception, will return empty '
+                    'response for this recording')
+
+    @staticmethod
+    def _destroy_tree(sim, protocol, recordings):
+        """Destroy the stimuli of protocol and all the tree recordings"""
+
+        for stimulus in protocol.stimuli:
+            stimulus.destroy(sim=sim)
+
+        for recording in recordings:
+            recording.destroy(sim=sim)
+
+    def _run_node(
+            self,
+            sim,
+            icell,
+            param_values,
+            node,
+            recordings,
+            state=None,
+            prefixes=None,
+            running=False):
+        """Run the protocols of a subtree
+
+        Args:
+            node (ProtocolTreeNode): subtree to run
+            recordings (list of Recordings): all the recordings of the tree
+            state (SaveState): state at the start of the node, None to start
+                from the initial state
+            prefixes (dict): recordings of the periods before the node
+            running (bool): the stimuli of the first protocol of the node
+                are instantiated, and the simulation is at the start of the
+                node, so it can be continued without restoring state
+        """
+
+        protocol = node.protocols[0]
+        if not running:
+            self._instantiate_tree(sim, icell, protocol, recordings)
+
+        if node.is_leaf:
+            responses = protocol._simulate(
+                sim, param_values, state=state, continue_run=running)
+            if prefixes is not None:
+                for recording in protocol.recordings:
+                    if responses[recording.name] is not None:
+                        responses[recording.name] = self._prepend_recording(
+                            recording, prefixes.get(recording.name))
+            self._destroy_tree(sim, protocol, recordings)
+            return responses
+
+        try:
+            if running:
+                sim.continue_run(node.end, **protocol.continue_settings())
+            elif state is not None:
+                sim.run(
+                    node.end,
+                    state=state,
+                    **protocol.integrator_settings())
+            else:
+                sim.run(node.end, **protocol.integrator_settings())
+        except (RuntimeError, simulators.NrnSimulatorException):
+            logger.debug(
+                'SnapshotSequenceProtocol: Running shared period of '
+                'parameter set {%s} generated an exception, returning None '
+                'in responses', str(param_values))
+            self._destroy_tree(sim, protocol, recordings)
+            return {recording.name: None
+                    for subprotocol in node.protocols
+                    for recording in subprotocol.recordings}
+
+        node_state = sim.save_state()
+        prefixes = prefixes if prefixes is not None else {}
+        node_prefixes = {
+            recording.name: self._extend_prefix(
+                prefixes.get(recording.name), recording)
+            for recording in recordings if recording.instantiated}
+
+        responses = {}
+        for index, child in enumerate(node.children):
+            # The first child starts with the protocol of this node
+            responses.update(self._run_node(
+                sim,
+                icell,
+                param_values,
+                child,
+                recordings,
+                state=node_state,
+                prefixes=node_prefixes,
+                running=index == 0))
+
+        return responses
+
+    def _run_func(self, cell_model, param_values, sim=None):
+        """Run protocols"""
+
+        try:
+            cell_model.freeze(param_values)
+            cell_model.instantiate(sim=sim)
+
+            roots = self.plan()
+            logger.debug(
+                'SnapshotSequenceProtocol: Sharing simulation periods saves '
+                '%.6g ms of simulation', self.saved_duration)
+
+            responses = collections.OrderedDict()
+            for root in roots:
+                if root.is_leaf:
+                    protocol = root.protocols[0]
+                    protocol.instantiate(sim=sim, icell=cell_model.icell)
+                    root_responses = protocol._simulate(sim, param_values)
+                    protocol.destroy(sim=sim)
+                else:
+                    root_responses = self._run_node(
+                        sim,
+                        cell_model.icell,
+                        param_values,
+                        root,
+                        [recording for protocol in root.protocols
+                         for recording in protocol.recordings])
+
+                key_intersect = set(
+                    root_responses.keys()).intersection(
+                        set(responses.keys()))
+                if len(key_intersect) != 0:
+                    raise Exception(
+                        'SnapshotSequenceProtocol: one of the protocols is '
+                        'trying to add already existing keys to the '
+                        'response: %s' % key_intersect)
+                responses.update(root_responses)
+
+            cell_model.destroy(sim=sim)
+
+            cell_model.unfreeze(param_values.keys())
+
+            return responses
+        except BaseException:
+            import sys
+            import traceback
+            raise Exception(
+                "".join(
+                    traceback.format_exception(*sys.exc_info())))
+
+    def run(self, cell_model, param_values, sim=None, isolate=None):
+        """Instantiate protocol"""
+
+        return _run_isolated(
+            self._run_func,
+            isolate=isolate,
+            cell_model=cell_model,
+            param_values=param_values,
+            sim=sim)
@@ -19,8 +19,8 @@ Copyright (c) 2016, EPFL/Blue Brain Project
  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
-
-import pandas
+# pandas is imported by the methods that use it, importing bluepyopt.ephys
+# doesn't import it
 
 
 class Response(object):
@@ -56,6 +56,8 @@ class TimeVoltageResponse(Response):
 
         super(TimeVoltageResponse, self).__init__(name)
 
+        import pandas
+
         self.response = pandas.DataFrame()
         self.response['time'] = pandas.Series(time)
         self.response['voltage'] = pandas.Series(voltage)
@@ -63,6 +65,8 @@ class TimeVoltageResponse(Response):
     def read_csv(self, filename):
         """Load response from csv file"""
 
+        import pandas
+
         self.response = pandas.read_csv(filename)
 
     def to_csv(self, filename):
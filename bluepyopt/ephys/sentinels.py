@@ -0,0 +1,252 @@
+"""Sentinel classes"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# Sentinels are conditions on a location of the cell that are checked while
+# the simulation is running. When the condition is met the run is stopped
+# early, and the protocol returns None for its recordings, so that all the
+# features depending on them get their max_score.
+
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Sentinel(object):
+
+    """Condition that stops a simulation early when it is met"""
+
+    def __init__(self, name=None, location=None):
+        """Constructor
+
+        Args:
+            name (str): name of this object
+            location (Location): location in the model that is watched
+        """
+
+        self.name = name
+        self.location = location
+
+        self.triggered_reason = None
+
+    @property
+    def triggered(self):
+        """Return True if the sentinel stopped the last run"""
+
+        return self.triggered_reason is not None
+
+    def trigger(self, sim, reason):
+        """Stop the running simulation"""
+
+        if self.triggered:
+            return
+
+        self.triggered_reason = reason
+        logger.debug(
+            'Sentinel %s stopped the simulation at t=%.6g ms: %s',
+            self.name, sim.neuron.h.t, reason)
+
+        sim.neuron.h.stoprun = 1
+
+    def instantiate(self, sim=None, icell=None):
+        """Instantiate sentinel"""
+
+        self.triggered_reason = None
+
+    def destroy(self, sim=None):
+        """Destroy sentinel"""
+        pass
+
+    def __str__(self):
+        """String representation"""
+
+        return '%s: %s at %s' % (
+            self.__class__.__name__, self.name, self.location)
+
+
+class SpikeCountSentinel(Sentinel):
+
+    """Stop the simulation when the number of spikes exceeds a maximum"""
+
+    def __init__(
+            self,
+            name=None,
+            location=None,
+            max_spikes=None,
+            threshold=-20.0):
+        """Constructor
+
+        Args:
+            name (str): name of this object
+            location (Location): location in the model that is watched
+            max_spikes (int): maximum number of spikes allowed
+            threshold (float): spike detection threshold (mV)
+        """
+
+        super(SpikeCountSentinel, self).__init__(name, location)
+        self.max_spikes = max_spikes
+        self.threshold = threshold
+
+        self.spike_count = 0
+        self.netcon = None
+
+    def instantiate(self, sim=None, icell=None):
+        """Instantiate sentinel"""
+
+        super(SpikeCountSentinel, self).instantiate(sim=sim, icell=icell)
+
+        seg = self.location.instantiate(sim=sim, icell=icell)
+
+        self.spike_count = 0
+        self.netcon = sim.neuron.h.NetCon(
+            seg._ref_v,  # pylint: disable=W0212
+            None,
+            sec=seg.sec)
+        self.netcon.threshold = self.threshold
+
+        def _spike():
+            """Count spike"""
+            self.spike_count += 1
+            if self.spike_count > self.max_spikes:
+                self.trigger(
+                    sim, 'spike count above %d' % self.max_spikes)
+
+        self.netcon.record(_spike)
+
+    def destroy(self, sim=None):
+        """Destroy sentinel"""
+
+        self.netcon = None
+
+
+class DepolarisationBlockSentinel(Sentinel):
+
+    """Stop the simulation when the voltage stays above a threshold"""
+
+    def __init__(
+            self,
+            name=None,
+            location=None,
+            voltage_threshold=-30.0,
+            max_duration=None):
+        """Constructor
+
+        Args:
+            name (str): name of this object
+            location (Location): location in the model that is watched
+            voltage_threshold (float): voltage (mV) above which the cell
+                is considered to be depolarised
+            max_duration (float): maximum time (ms) the voltage is allowed
+                to stay above voltage_threshold
+        """
+
+        super(DepolarisationBlockSentinel, self).__init__(name, location)
+        self.voltage_threshold = voltage_threshold
+        self.max_duration = max_duration
+
+        self.netcon = None
+
+    def instantiate(self, sim=None, icell=None):
+        """Instantiate sentinel"""
+
+        super(DepolarisationBlockSentinel, self).instantiate(
+            sim=sim, icell=icell)
+
+        seg = self.location.instantiate(sim=sim, icell=icell)
+
+        self.netcon = sim.neuron.h.NetCon(
+            seg._ref_v,  # pylint: disable=W0212
+            None,
+            sec=seg.sec)
+        self.netcon.threshold = self.voltage_threshold
+
+        # Time of the last upward crossing of the threshold
+        crossing = {'time': None}
+
+        def _check(crossing_time):
+            """Check if voltage stayed above threshold since crossing_time"""
+            if crossing['time'] == crossing_time and \
+                    seg.v > self.voltage_threshold:
+                self.trigger(
+                    sim,
+                    'voltage above %.6g mV for more than %.6g ms' %
+                    (self.voltage_threshold, self.max_duration))
+
+        def _crossing():
+            """Schedule check after max_duration"""
+            crossing_time = sim.neuron.h.t
+            crossing['time'] = crossing_time
+            sim.cvode.event(
+                crossing_time + self.max_duration,
+                lambda: _check(crossing_time))
+
+        self.netcon.record(_crossing)
+
+    def destroy(self, sim=None):
+        """Destroy sentinel"""
+
+        self.netcon = None
+
+
+class NaNSentinel(Sentinel):
+
+    """Stop the simulation when the voltage becomes NaN"""
+
+    def __init__(
+            self,
+            name=None,
+            location=None,
+            check_interval=5.0):
+        """Constructor
+
+        Args:
+            name (str): name of this object
+            location (Location): location in the model that is watched
+            check_interval (float): time (ms) between two checks
+        """
+
+        super(NaNSentinel, self).__init__(name, location)
+        self.check_interval = check_interval
+
+        self.fih = None
+
+    def instantiate(self, sim=None, icell=None):
+        """Instantiate sentinel"""
+
+        super(NaNSentinel, self).instantiate(sim=sim, icell=icell)
+
+        seg = self.location.instantiate(sim=sim, icell=icell)
+
+        def _check():
+            """Check voltage, and schedule next check"""
+            if math.isnan(seg.v):
+                self.trigger(sim, 'voltage is NaN')
+            else:
+                sim.cvode.event(
+                    sim.neuron.h.t + self.check_interval, _check)
+
+        self.fih = sim.neuron.h.FInitializeHandler(
+            1, lambda: sim.cvode.event(self.check_interval, _check))
+
+    def destroy(self, sim=None):
+        """Destroy sentinel"""
+
+        self.fih = None
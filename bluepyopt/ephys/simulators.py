@@ -3,22 +3,110 @@
 # pylint: disable=W0511
 
 import os
+import sys
 import logging
-import imp
 import ctypes
 import platform
 import warnings
+import contextlib
+import collections
+
+if sys.version_info[0] < 3:
+    import imp
+else:
+    import importlib.util
 
 logger = logging.getLogger(__name__)
 
+# Watchdog of the runs, checked after every integration step by the advance()
+# procedure of stdrun.hoc, or by bluepyopt_watchdog_solve() with local time
+# steps. It isn't a Python callback registered with extra_scatter_gather,
+# after which NEURON refuses to use several threads for the rest of the
+# process
+_WATCHDOG_HOC = '''
+bluepyopt_watchdog_active = 0
+bluepyopt_watchdog_steps = 0
+bluepyopt_watchdog_max_steps = 1e300
+bluepyopt_watchdog_deadline = 1e300
+bluepyopt_watchdog_interval = 100
+bluepyopt_watchdog_reason = 0
+
+proc bluepyopt_watchdog_check() {
+    bluepyopt_watchdog_steps += 1
+    if (bluepyopt_watchdog_steps % bluepyopt_watchdog_interval == 0) {
+        if (startsw() >= bluepyopt_watchdog_deadline) {
+            bluepyopt_watchdog_reason = 2
+        }
+    }
+    if (bluepyopt_watchdog_steps > bluepyopt_watchdog_max_steps) {
+        bluepyopt_watchdog_reason = 1
+    }
+    if (bluepyopt_watchdog_reason) {
+        stoprun = 1
+    }
+}
+
+proc advance() {
+    fadvance()
+    if (bluepyopt_watchdog_active) {
+        bluepyopt_watchdog_check()
+    }
+}
+
+// continuerun() integrates local time steps in a single cvode.solve()
+proc bluepyopt_watchdog_solve() {
+    stoprun = 0
+    cvode.event($1)
+    while (t < $1 && stoprun == 0) {
+        cvode.solve()
+        bluepyopt_watchdog_check()
+    }
+    if (stoprun == 0) {
+        cvode.solve($1)
+    }
+}
+'''
+
+# Abort reasons of the watchdog, by their value in hoc
+_WATCHDOG_REASONS = {1: 'max_steps', 2: 'max_wallclock'}
+
 
 class NrnSimulator(object):
 
     """Neuron simulator"""
 
+    # The banner only needs to be disabled once per process
+    _process_banner_disabled = False
+
     def __init__(self, dt=None, cvode_active=True, cvode_minstep=None,
-                 random123_globalindex=None):
-        """Constructor"""
+                 random123_globalindex=None, max_wallclock=None,
+                 max_steps=None, watchdog_interval=100, nthread=1,
+                 cache_efficient=None, multisplit=False):
+        """Constructor
+
+        Args:
+            dt (float): fixed time step of the simulator
+            cvode_active (bool): whether to use variable time step
+            cvode_minstep (float): minimal time step of cvode
+            random123_globalindex (int): global index of Random123
+            max_wallclock (float): wall-clock budget (in s) of a single run,
+                the run is aborted when it is exceeded
+            max_steps (int): maximum number of integration steps of a single
+                run, the run is aborted when it is exceeded
+            watchdog_interval (int): number of integration steps between
+                two checks of the wall-clock budget
+            nthread (int): number of threads of the simulations
+            cache_efficient (bool): whether NEURON orders the memory of the
+                nodes for cache efficiency, by default NEURON's setting is
+                kept
+            multisplit (bool): split the cells, so that the threads share
+                the integration of a single cell. Only used with nthread > 1
+        """
+
+        if nthread < 1:
+            raise ValueError(
+                'NrnSimulator: nthread needs to be at least 1, not %d' %
+                nthread)
 
         if platform.system() == 'Windows':
             # hoc.so does not exist on NEURON Windows
@@ -43,6 +131,26 @@ class NrnSimulator(object):
 
         self.random123_globalindex = random123_globalindex
 
+        self.max_wallclock = max_wallclock
+        self.max_steps = max_steps
+        self.watchdog_interval = watchdog_interval
+
+        self.nthread = nthread
+        self.cache_efficient = cache_efficient
+        self.multisplit = multisplit
+
+        # Number of aborted runs per abort reason, for monitoring
+        self.abort_counts = collections.Counter()
+        self.last_abort_reason = None
+
+        self._watchdog = None
+
+    @property
+    def watchdog_enabled(self):
+        """Return True if a wall-clock or step budget is set"""
+
+        return self.max_wallclock is not None or self.max_steps is not None
+
     @property
     def cvode(self):
         """Return cvode instance"""
@@ -65,7 +173,11 @@ class NrnSimulator(object):
     def _nrn_disable_banner():
         """Disable Neuron banner"""
 
-        nrnpy_path = os.path.join(imp.find_module('neuron')[1])
+        if sys.version_info[0] < 3:
+            nrnpy_path = imp.find_module('neuron')[1]
+        else:
+            nrnpy_path = importlib.util.find_spec(
+                'neuron').submodule_search_locations[0]
         import glob
         hoc_so_list = \
             glob.glob(os.path.join(nrnpy_path, 'hoc*.so'))
@@ -86,7 +198,9 @@ class NrnSimulator(object):
         """Return neuron module"""
 
         if self.disable_banner and not self.banner_disabled:
-            NrnSimulator._nrn_disable_banner()
+            if not NrnSimulator._process_banner_disabled:
+                NrnSimulator._nrn_disable_banner()
+                NrnSimulator._process_banner_disabled = True
             self.banner_disabled = True
 
         import neuron  # NOQA
@@ -98,8 +212,27 @@ class NrnSimulator(object):
             tstop=None,
             dt=None,
             cvode_active=None,
-            random123_globalindex=None):
-        """Run protocol"""
+            random123_globalindex=None,
+            state=None,
+            use_local_dt=False,
+            cvode_atol=None):
+        """Run protocol
+
+        Args:
+            tstop (float): end time of the simulation (ms)
+            dt (float): fixed time step, only when cvode is not active
+            cvode_active (bool): whether to use variable time step
+            random123_globalindex (int): global index of Random123
+            state (SaveState): simulator state returned by save_state(),
+                if set the simulation continues from this state instead of
+                starting at t=0
+            use_local_dt (bool): give every cell its own variable time step,
+                only when cvode is active
+            cvode_atol (float): absolute tolerance of cvode during this run,
+                only when cvode is active
+
+        The time step and tolerance of NEURON are restored after the run
+        """
 
         self.neuron.h.tstop = tstop
 
@@ -124,10 +257,11 @@ class NrnSimulator(object):
         self.neuron.h.cvode_active(1 if cvode_active else 0)
 
         if cvode_active:
+            self.cvode.use_local_dt(1 if use_local_dt else 0)
+            dt = None
             logger.debug('Running Neuron simulator %.6g ms, with cvode', tstop)
         else:
-            self.neuron.h.dt = dt
-            self.neuron.h.steps_per_ms = 1.0 / dt
+            cvode_atol = None
             logger.debug(
                 'Running Neuron simulator %.6g ms, with dt=%r',
                 tstop,
@@ -140,12 +274,196 @@ class NrnSimulator(object):
             rng = self.neuron.h.Random()
             rng.Random123_globalindex(random123_globalindex)
 
+        self._set_threads()
+        split_tool = self._split_cells() \
+            if self.multisplit and self.nthread > 1 else None
+
+        try:
+            with self._integrator_settings(dt=dt, cvode_atol=cvode_atol):
+                if state is None:
+                    def _run():
+                        """Initialise and run, as run() of stdrun.hoc"""
+                        self.neuron.h.stdinit()
+                        self._continuerun(tstop)
+
+                    self._integrate(_run)
+                else:
+                    def _restore_and_run():
+                        """Initialise, restore state and continue run"""
+                        self.neuron.h.stdinit()
+                        state.restore()
+                        if cvode_active:
+                            self.cvode.re_init()
+                        self._continuerun(tstop)
+
+                    self._integrate(_restore_and_run)
+        finally:
+            if split_tool is not None:
+                # Reconnect the sections, the cells can then be changed or
+                # destroyed
+                split_tool.multisplit(0)
+
+        logger.debug('Neuron simulation finished')
+
+    def _set_threads(self):
+        """Set the number of threads and the cache efficiency of NEURON
+
+        These are global settings of NEURON, they are set before every run
+        since other simulators can change them
+        """
+
+        parallel_context = self.neuron.h.ParallelContext()
+        if parallel_context.nthread() != self.nthread:
+            parallel_context.nthread(self.nthread)
+            logger.debug('Using %d threads', self.nthread)
+
+        if self.cache_efficient is not None:
+            self.cvode.cache_efficient(1 if self.cache_efficient else 0)
+
+    def _split_cells(self):
+        """Split the cells in pieces of similar complexity
+
+        Returns NEURON's ParallelComputeTool that did the split, its
+        multisplit(0) reconnects the sections
+        """
+
+        self.neuron.h.load_file('parcom.hoc')
+        split_tool = self.neuron.h.ParallelComputeTool()
+        split_tool.multisplit(1)
+
+        return split_tool
+
+    @contextlib.contextmanager
+    def _integrator_settings(self, dt=None, cvode_atol=None):
+        """Use a fixed time step or a cvode tolerance in this context"""
+
+        old_dt = self.neuron.h.dt
+        old_steps_per_ms = self.neuron.h.steps_per_ms
+        old_atol = self.cvode.atol()
+
+        if dt is not None:
+            self.neuron.h.dt = dt
+            self.neuron.h.steps_per_ms = 1.0 / dt
+        if cvode_atol is not None:
+            self.cvode.atol(cvode_atol)
+
+        try:
+            yield
+        finally:
+            self.neuron.h.dt = old_dt
+            self.neuron.h.steps_per_ms = old_steps_per_ms
+            self.cvode.atol(old_atol)
+
+    def continue_run(self, tstop=None, dt=None, cvode_atol=None):
+        """Continue the current simulation until tstop
+
+        This doesn't reinitialise the simulator, and keeps the integration
+        method of the previous run. The time step and cvode tolerance of a
+        run need to be given again, they are restored after every run
+        """
+
+        self.neuron.h.tstop = tstop
+        logger.debug(
+            'Continuing Neuron simulator from %.6g ms to %.6g ms',
+            self.neuron.h.t, tstop)
+
+        with self._integrator_settings(dt=dt, cvode_atol=cvode_atol):
+            self._integrate(lambda: self._continuerun(tstop))
+
+        logger.debug('Neuron simulation finished')
+
+    def save_state(self):
+        """Save the current state of the simulation
+
+        Returns a Neuron SaveState object that can be passed as state
+        argument to run(). The state can only be restored in the same cell
+        instance, the stimuli and mechanisms need to have the same structure.
+        """
+
+        state = self.neuron.h.SaveState()
+        state.save()
+
+        return state
+
+    def _continuerun(self, tstop):
+        """Integrate until tstop with continuerun() of stdrun.hoc
+
+        Under the watchdog, the local time steps are integrated step by step
+        """
+
+        if self._watchdog is not None and self.cvode.use_local_dt():
+            self.neuron.h.bluepyopt_watchdog_solve(tstop)
+        else:
+            self.neuron.h.continuerun(tstop)
+
+    def _integrate(self, integrate_func):
+        """Call integrate_func under the watchdog"""
+
+        self._start_watchdog()
         try:
-            self.neuron.h.run()
+            integrate_func()
         except Exception as e:
             raise NrnSimulatorException('Neuron simulator error', e)
+        finally:
+            abort_reason = self._stop_watchdog()
 
-        logger.debug('Neuron simulation finished')
+        if abort_reason is not None:
+            self.abort_counts[abort_reason] += 1
+            self.last_abort_reason = abort_reason
+            logger.warning(
+                'NrnSimulator: run aborted at t=%.6g ms: %s',
+                self.neuron.h.t, abort_reason)
+            raise NrnSimulatorAbortException(
+                'Neuron simulation aborted: %s' % abort_reason,
+                abort_reason)
+
+    def _start_watchdog(self):
+        """Install the step / wall-clock watchdog for the next run
+
+        An FInitializeHandler resets the budget at finitialize, the advance()
+        procedure of stdrun.hoc counts the steps and checks the wall clock
+        every watchdog_interval steps. When a budget is exceeded stoprun is
+        raised, so that the run returns at the end of the current step.
+        advance() is redefined the first time a watchdog is used in the
+        process.
+        """
+
+        if not self.watchdog_enabled:
+            return
+
+        h = self.neuron.h
+        if not hasattr(h, 'bluepyopt_watchdog_active'):
+            h(_WATCHDOG_HOC)
+
+        h.bluepyopt_watchdog_max_steps = \
+            self.max_steps if self.max_steps is not None else 1e300
+        h.bluepyopt_watchdog_interval = self.watchdog_interval
+
+        def _init():
+            """Reset budget at finitialize"""
+            h.bluepyopt_watchdog_steps = 0
+            h.bluepyopt_watchdog_deadline = \
+                h.startsw() + self.max_wallclock \
+                if self.max_wallclock is not None else 1e300
+            h.bluepyopt_watchdog_reason = 0
+
+        _init()
+        fih = h.FInitializeHandler(1, _init)
+        h.bluepyopt_watchdog_active = 1
+
+        self._watchdog = fih
+
+    def _stop_watchdog(self):
+        """Remove the watchdog, return the abort reason (or None)"""
+
+        if self._watchdog is None:
+            return None
+
+        h = self.neuron.h
+        h.bluepyopt_watchdog_active = 0
+        self._watchdog = None
+
+        return _WATCHDOG_REASONS.get(int(h.bluepyopt_watchdog_reason))
 
 
 class NrnSimulatorException(Exception):
@@ -157,3 +475,19 @@ class NrnSimulatorException(Exception):
 
         super(NrnSimulatorException, self).__init__(message)
         self.original = original
+
+
+class NrnSimulatorAbortException(NrnSimulatorException):
+
+    """Exception generated when the simulator watchdog aborts a run"""
+
+    def __init__(self, message, reason):
+        """Constructor
+
+        Args:
+            message (str): exception message
+            reason (str): abort reason, 'max_steps' or 'max_wallclock'
+        """
+
+        super(NrnSimulatorAbortException, self).__init__(message, None)
+        self.reason = reason
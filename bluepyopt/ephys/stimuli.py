@@ -28,7 +28,17 @@ logger = logging.getLogger(__name__)
 class Stimulus(object):
 
     """Stimulus protocol"""
-    pass
+
+    def timeline(self):
+        """Injected current as a function of time
+
+        Returns:
+            list of (start, end, amplitude_start, amplitude_end) tuples,
+            the current is linearly interpolated during every segment.
+            None if the current can't be described in this way
+        """
+
+        return None
 
 
 class NrnCurrentPlayStimulus(Stimulus):
@@ -76,6 +86,27 @@ class NrnCurrentPlayStimulus(Stimulus):
             1,
             sec=icomp.sec)
 
+    def timeline(self):
+        """Injected current as a function of time"""
+
+        segments = []
+        if self.time_points[0] > 0:
+            segments.append((
+                0.0,
+                self.time_points[0],
+                self.current_points[0],
+                self.current_points[0]))
+
+        for index in range(len(self.time_points) - 1):
+            if self.time_points[index + 1] > self.time_points[index]:
+                segments.append((
+                    self.time_points[index],
+                    self.time_points[index + 1],
+                    self.current_points[index],
+                    self.current_points[index + 1]))
+
+        return segments
+
     def destroy(self, sim=None):
         """Destroy stimulus"""
 
@@ -206,6 +237,21 @@ class NrnSquarePulse(Stimulus):
         self.iclamp.amp = self.step_amplitude
         self.iclamp.delay = self.step_delay
 
+    def timeline(self):
+        """Injected current as a function of time"""
+
+        step_start = min(self.step_delay, self.total_duration)
+        step_end = min(
+            self.step_delay + self.step_duration, self.total_duration)
+
+        segments = [
+            (0.0, step_start, 0.0, 0.0),
+            (step_start, step_end,
+             self.step_amplitude, self.step_amplitude),
+            (step_end, self.total_duration, 0.0, 0.0)]
+
+        return [segment for segment in segments if segment[1] > segment[0]]
+
     def destroy(self, sim=None):
         """Destroy stimulus"""
 
@@ -309,6 +355,19 @@ class NrnRampPulse(Stimulus):
         self.persistent.append(times)
         self.persistent.append(amps)
 
+    def timeline(self):
+        """Injected current as a function of time"""
+
+        ramp_end = self.ramp_delay + self.ramp_duration
+
+        segments = [
+            (0.0, self.ramp_delay, 0.0, 0.0),
+            (self.ramp_delay, ramp_end,
+             self.ramp_amplitude_start, self.ramp_amplitude_end),
+            (ramp_end, self.total_duration, 0.0, 0.0)]
+
+        return [segment for segment in segments if segment[1] > segment[0]]
+
     def destroy(self, sim=None):
         """Destroy stimulus"""
 
@@ -0,0 +1,247 @@
+"""Pre-warmed worker processes"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# Every new worker process pays for importing NEURON, disabling its banner,
+# loading stdrun.hoc and import3d.hoc and loading the compiled mechanisms.
+# A WorkerTemplate starts a multiprocessing forkserver that does all of
+# this once, the worker processes are forked from it and start with
+# everything loaded.
+# The forkserver can only import modules by name before forking, it imports
+# the _workers_preload module, which calls prewarm_from_environment(). The
+# settings of the template are passed to it by an environment variable.
+
+import os
+import sys
+import json
+import logging
+import multiprocessing
+import concurrent.futures
+
+try:
+    import multiprocessing.forkserver
+except ImportError:
+    # Python 2 has no forkserver, WorkerTemplate can't be used
+    pass
+
+from . import simulators
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOC_FILES = ('stdrun.hoc', 'import3d.hoc')
+
+_PREWARM_ENV = 'BLUEPYOPT_WORKER_PREWARM'
+
+_PRELOAD_MODULE = 'bluepyopt.ephys._workers_preload'
+
+# (pid, settings, modules) of the forkserver started by a WorkerTemplate in
+# this process, None if no template started it
+_started_forkserver = None
+
+
+def _forkserver_pid():
+    """Pid of the forkserver of this process, None if it isn't running
+
+    multiprocessing has no public API for this, the forkserver is considered
+    as not running if its private attributes can't be read
+    """
+
+    forkserver = getattr(
+        getattr(multiprocessing, 'forkserver', None), '_forkserver', None)
+    pid = getattr(forkserver, '_forkserver_pid', None)
+
+    return pid if isinstance(pid, int) else None
+
+
+def prewarm(mechanisms_dir=None, hoc_files=DEFAULT_HOC_FILES):
+    """Load NEURON, hoc files and mechanisms in the current process
+
+    Args:
+        mechanisms_dir (str): directory with the compiled mechanisms
+            (containing the x86_64 directory created by nrnivmodl), the
+            mechanisms of the current directory are loaded by NEURON
+            anyway
+        hoc_files (list of str): hoc files to load
+
+    Returns:
+        NrnSimulator of the process
+    """
+
+    sim = simulators.NrnSimulator()
+
+    for hoc_file in hoc_files:
+        sim.neuron.h.load_file(hoc_file)
+
+    if mechanisms_dir is not None:
+        sim.neuron.load_mechanisms(mechanisms_dir)
+
+    return sim
+
+
+def prewarm_from_environment():
+    """Pre-warm the process with the settings of a WorkerTemplate
+
+    Called in the forkserver started by a template, does nothing in the
+    processes in which the settings aren't set
+
+    Returns:
+        NrnSimulator of the process, None if it wasn't pre-warmed
+    """
+
+    if _PREWARM_ENV not in os.environ:
+        return None
+
+    return prewarm(**json.loads(os.environ.pop(_PREWARM_ENV)))
+
+
+class WorkerTemplate(object):
+
+    """Forkserver from which pre-warmed worker processes are forked
+
+    A process has a single forkserver, which is started by the first
+    template that is used. Using a template with other settings later in
+    the same process raises a ValueError
+    """
+
+    def __init__(
+            self,
+            mechanisms_dir=None,
+            hoc_files=DEFAULT_HOC_FILES,
+            modules=('bluepyopt.ephys',)):
+        """Constructor
+
+        Args:
+            mechanisms_dir (str): directory with the compiled mechanisms,
+                see prewarm()
+            hoc_files (list of str): hoc files loaded by the forkserver
+            modules (list of str): additional modules imported by the
+                forkserver, e.g. the module that creates the cell model
+        """
+
+        if sys.version_info[0] < 3 or \
+                'forkserver' not in multiprocessing.get_all_start_methods():
+            raise ValueError(
+                'WorkerTemplate: the forkserver start method is not '
+                'available on this platform')
+
+        self.mechanisms_dir = mechanisms_dir
+        self.hoc_files = list(hoc_files)
+        self.modules = list(modules)
+
+    @property
+    def settings(self):
+        """Settings of the prewarm() call of the forkserver"""
+
+        return {
+            'mechanisms_dir': self.mechanisms_dir,
+            'hoc_files': self.hoc_files}
+
+    @property
+    def running(self):
+        """Return True if the forkserver runs with these settings"""
+
+        return _forkserver_pid() is not None and \
+            _started_forkserver == (
+                _forkserver_pid(), self.settings, self.modules)
+
+    def start(self):
+        """Start the forkserver and wait until it is pre-warmed
+
+        Raises:
+            ValueError if the forkserver was started by a template with
+            other settings
+        """
+
+        global _started_forkserver  # pylint: disable=W0603
+
+        if self.running:
+            return
+
+        if _forkserver_pid() is not None:
+            if _started_forkserver is not None and \
+                    _started_forkserver[0] == _forkserver_pid():
+                raise ValueError(
+                    'WorkerTemplate: the forkserver of this process was '
+                    'started with %s and modules %s, it can\'t be started '
+                    'with %s and modules %s' % (
+                        _started_forkserver[1], _started_forkserver[2],
+                        self.settings, self.modules))
+            logger.warning(
+                'WorkerTemplate: the forkserver of this process was not '
+                'started by a WorkerTemplate, its workers are not '
+                'pre-warmed')
+            return
+
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(self.modules + [_PRELOAD_MODULE])
+
+        # The forkserver inherits the environment of this process when it
+        # is launched
+        os.environ[_PREWARM_ENV] = json.dumps(self.settings)
+        try:
+            multiprocessing.forkserver.ensure_running()
+        finally:
+            del os.environ[_PREWARM_ENV]
+
+        # The forkserver only forks processes after loading everything, the
+        # first worker doesn't need to wait for it
+        process = context.Process(target=int)
+        process.start()
+        process.join()
+
+        _started_forkserver = (
+            _forkserver_pid(), self.settings, self.modules)
+
+        logger.debug('WorkerTemplate: started forkserver with %s',
+                     self.settings)
+
+    @property
+    def context(self):
+        """Multiprocessing context of the pre-warmed workers"""
+
+        self.start()
+
+        return multiprocessing.get_context('forkserver')
+
+    def pool(self, processes=None, **kwargs):
+        """Create a multiprocessing.Pool with pre-warmed workers"""
+
+        return self.context.Pool(processes, **kwargs)
+
+    def executor(self, max_workers=None):
+        """Create a ProcessPoolExecutor with pre-warmed workers
+
+        Needs Python 3.7, use pool() with older versions
+        """
+
+        if sys.version_info < (3, 7):
+            raise ValueError(
+                'WorkerTemplate: executor() needs Python 3.7, the '
+                'ProcessPoolExecutor of older versions can\'t use the '
+                'forkserver')
+
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=self.context)
+
+    def __str__(self):
+        """String representation"""
+
+        return 'WorkerTemplate(mechanisms_dir=%s, hoc_files=%s)' % (
+            self.mechanisms_dir, ', '.join(self.hoc_files))
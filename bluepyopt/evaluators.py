@@ -19,6 +19,8 @@ Copyright (c) 2016, EPFL/Blue Brain Project
  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
+import time
+
 from abc import abstractmethod
 
 
@@ -72,3 +74,50 @@ class Evaluator(object):
                 List of Objectives with values calculated by the Evaluator.
 
         """
+
+    def evaluate_population(self, param_lists):
+        """Evaluate several parameter sets
+
+        Evaluators that can simulate several parameter sets at once can
+        override this, by default the parameter sets are evaluated one by one
+
+        Args:
+            param_lists (list of lists of Parameters):
+                The parameter sets to be evaluated.
+
+        Returns:
+            list of objectives lists, one for every parameter set
+        """
+
+        return [self.evaluate_with_lists(param_list)
+                for param_list in param_lists]
+
+    def evaluate_with_timings(self, param_list):
+        """Evaluate a parameter set, and time the evaluation
+
+        Evaluators that consist of several parts (e.g. protocols) can
+        override this to time every part separately
+
+        Args:
+            param_list (list of Parameters):
+                The parameter values to be evaluated.
+
+        Returns:
+            (objectives, timings) tuple, with timings a dict with the
+            wall-clock time (s) spent in every part of the evaluation
+        """
+
+        start_time = time.time()
+        objectives = self.evaluate_with_lists(param_list)
+
+        return objectives, {'evaluation': time.time() - start_time}
+
+    def max_score_objectives(self):
+        """Objectives assigned to parameter sets that can't be evaluated
+
+        Returns:
+            list of objective values, None if the evaluator doesn't define
+            them
+        """
+
+        return None
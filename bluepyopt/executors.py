@@ -0,0 +1,751 @@
+"""Executor classes"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# Executors run tasks, possibly in parallel, and return a Task handle for
+# every submitted task. Completed tasks can be processed as soon as they are
+# finished with as_completed(), which also implements timeouts per task in
+# the same way for all the backends.
+# as_completed() can also re-execute speculatively the tasks that run much
+# longer than the recent ones (stragglers, e.g. on a slow or hanging worker)
+# on idle workers, and keep the first copy that finishes successfully. This
+# is only safe for tasks that give the same result every time they are run.
+# Failed tasks are classified as worker crashes, timeouts or simulator
+# exceptions. With a RetryPolicy, as_completed() resubmits the tasks of
+# crashed workers, and keeps a record of all the failures.
+
+import json
+import time
+import logging
+import collections
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+
+class TaskTimeoutError(Exception):
+
+    """Exception raised by the result of a task that timed out"""
+
+
+# Kinds of failures
+CRASH = 'crash'
+TIMEOUT = 'timeout'
+SIMULATOR = 'simulator'
+
+# Names of the exceptions raised when a worker died
+_CRASH_EXCEPTIONS = (
+    'BrokenExecutor',
+    'BrokenProcessPool',
+    'EngineError',
+    'ProcessExpired')
+
+_TIMEOUT_EXCEPTIONS = (
+    'TaskTimeoutError',
+    'TimeoutError')
+
+# Names of the exceptions raised by the simulator classes
+_SIMULATOR_EXCEPTIONS = (
+    'NrnSimulatorException',
+    'NrnSimulatorAbortException')
+
+
+def _is_hoc_error(name, message):
+    """Check if an exception is a RuntimeError raised by hoc
+
+    The messages of these errors start with hoc, e.g. 'hoc error' or
+    'hocobj_call error: hoc_execerror: ...'
+    """
+
+    return name == 'RuntimeError' and message.strip().startswith('hoc')
+
+
+def classify_failure(exception):
+    """Return the kind of failure of a task exception, None if unknown
+
+    The exceptions are recognised by name, so that the exceptions of all the
+    backends can be classified without importing them. Remote exceptions
+    (e.g. ipyparallel RemoteError) are classified by the name of the
+    original exception, and exceptions re-raised with the traceback as
+    message by the protocols by the last line of the traceback.
+    RuntimeErrors are only simulator failures when they are raised by hoc,
+    the others are programming errors.
+    """
+
+    if exception is None:
+        return None
+
+    # (name, message) of the exception and of the exceptions it wraps
+    names = [(cls.__name__, str(exception))
+             for cls in type(exception).__mro__]
+
+    remote_name = getattr(exception, 'ename', None)
+    if remote_name is not None:
+        names.insert(0, (
+            remote_name, str(getattr(exception, 'evalue', exception))))
+
+    lines = str(exception).strip().splitlines()
+    if lines and ':' in lines[-1]:
+        name, message = lines[-1].split(':', 1)
+        names.append((name.split('.')[-1].strip(), message))
+
+    for name, message in names:
+        if name in _CRASH_EXCEPTIONS:
+            return CRASH
+        elif name in _TIMEOUT_EXCEPTIONS:
+            return TIMEOUT
+        elif name in _SIMULATOR_EXCEPTIONS or _is_hoc_error(name, message):
+            return SIMULATOR
+
+    return None
+
+
+def _succeeded(future):
+    """Return True if a finished future has a result"""
+
+    try:
+        future.result(0)
+    except BaseException:  # pylint: disable=W0703
+        return False
+
+    return True
+
+
+class Task(object):
+
+    """Handle of a task submitted to an Executor"""
+
+    def __init__(self, future, func, args):
+        """Constructor
+
+        Args:
+            future: future returned by the backend, should have the done(),
+                result(timeout) and cancel() methods of
+                concurrent.futures.Future
+            func (callable): function that is called
+            args (tuple): arguments of the function
+        """
+
+        self.future = future
+        self.func = func
+        self.args = args
+
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.timed_out = False
+
+        # Futures of the speculative copies of the task
+        self.copies = []
+
+        # Number of times the task was submitted
+        self.attempts = 1
+
+    def _resubmit(self, future):
+        """Replace the future of a failed task by a new one"""
+
+        self.future = future
+        self.copies = []
+        self.attempts += 1
+
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+
+    def done(self):
+        """Return True if the task timed out, or if the task or a copy
+        finished successfully, or if the task and all its copies failed"""
+
+        if self.timed_out:
+            return True
+
+        futures = [self.future] + self.copies
+        finished = [future for future in futures if future.done()]
+
+        return len(finished) == len(futures) or \
+            any(_succeeded(future) for future in finished)
+
+    def running(self):
+        """Return True if the backend reports that the task is running"""
+
+        running = getattr(self.future, 'running', None)
+
+        return running() if running is not None else False
+
+    def cancel(self):
+        """Try to cancel the task, return True if it was cancelled"""
+
+        for copy in self.copies:
+            copy.cancel()
+
+        return self.future.cancel()
+
+    def _keep_first_finished(self):
+        """Keep the future of a successful copy, cancel the others
+
+        The future of the task is kept if all the copies failed.
+
+        Returns:
+            list of the futures that were cancelled
+        """
+
+        if not self.copies:
+            return []
+
+        futures = [self.future] + self.copies
+        winner = next(
+            (future for future in futures
+             if future.done() and _succeeded(future)),
+            self.future)
+        losers = [future for future in futures if future is not winner]
+        for future in losers:
+            future.cancel()
+
+        if winner is not self.future:
+            logger.debug(
+                'Executor: speculative copy of task %s finished first',
+                self.func)
+
+        self.future = winner
+        self.copies = []
+
+        return losers
+
+    def result(self, timeout=None):
+        """Return the result of the task
+
+        Raises TaskTimeoutError if the task timed out, and the exception
+        raised by the task if it failed
+        """
+
+        if self.timed_out:
+            raise TaskTimeoutError(
+                'Task %s timed out after %.6g s' %
+                (self.func, self.duration))
+
+        return self.future.result(timeout)
+
+    def exception(self):
+        """Return the exception raised by a finished task, or None"""
+
+        try:
+            self.result()
+        except BaseException as exception:  # pylint: disable=W0703
+            return exception
+
+        return None
+
+    @property
+    def duration(self):
+        """Time (s) from the start (or the submission) to the end"""
+
+        end_time = self.end_time if self.end_time is not None \
+            else time.time()
+        start_time = self.start_time if self.start_time is not None \
+            else self.submit_time
+
+        return end_time - start_time
+
+
+class Speculation(object):
+
+    """Policy for the speculative re-execution of straggler tasks
+
+    A task is a straggler when it has been running longer than a percentile
+    of the durations of the recently completed tasks. Copies of stragglers
+    are only submitted when workers are idle, i.e. when there are fewer
+    unfinished tasks and copies than workers. Cancelled copies that were
+    already running keep their worker busy until they finish.
+    """
+
+    def __init__(
+            self,
+            percentile=90.0,
+            min_samples=10,
+            max_samples=1000,
+            max_copies=1):
+        """Constructor
+
+        Args:
+            percentile (float): percentile (0-100) of the recent task
+                durations above which a task is a straggler
+            min_samples (int): number of completed tasks needed before
+                stragglers are detected
+            max_samples (int): number of recent task durations kept
+            max_copies (int): maximum number of speculative copies of a task
+        """
+
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_copies = max_copies
+
+        self.durations = collections.deque(maxlen=max_samples)
+        self.n_copies = 0
+
+    def update(self, duration):
+        """Add the duration (s) of a completed task"""
+
+        self.durations.append(duration)
+
+    def threshold(self):
+        """Duration (s) above which a task is a straggler, None if unknown"""
+
+        if len(self.durations) < self.min_samples:
+            return None
+
+        # numpy isn't imported by import bluepyopt
+        import numpy
+
+        return float(numpy.percentile(self.durations, self.percentile))
+
+    def __str__(self):
+        """String representation"""
+
+        return 'Speculation above percentile %.6g of %d durations, ' \
+            '%d copies submitted' % (
+                self.percentile, len(self.durations), self.n_copies)
+
+
+class RetryPolicy(object):
+
+    """Policy for the resubmission of failed tasks
+
+    The tasks that failed with one of the retried kinds of failure are
+    resubmitted up to max_retries times. All the failures are recorded in
+    failures, which can be written to a report. The process pools of the
+    concurrent.futures backport of Python 2 hang when a worker dies, the
+    crashes are only detected with Python 3.
+    """
+
+    def __init__(
+            self,
+            max_retries=2,
+            retried_kinds=(CRASH,),
+            task_timeout=None):
+        """Constructor
+
+        Args:
+            max_retries (int): maximum number of times a task is resubmitted
+            retried_kinds (tuple): kinds of failures for which a task is
+                resubmitted, by default only worker crashes
+            task_timeout (float): time (s) a task is allowed to run, passed
+                to as_completed() by the users of the policy
+        """
+
+        self.max_retries = max_retries
+        self.retried_kinds = retried_kinds
+        self.task_timeout = task_timeout
+
+        self.failures = []
+
+    def should_retry(self, task, kind):
+        """Check if a task that failed with kind should be resubmitted"""
+
+        return kind in self.retried_kinds and \
+            task.attempts <= self.max_retries
+
+    def record(self, task, kind, action):
+        """Record the failure of a task
+
+        Args:
+            task (Task): failed task
+            kind (str): kind of failure
+            action (str): what was done with the task, e.g. 'retry'
+        """
+
+        exception = task.exception()
+
+        logger.warning(
+            'Task %s failed (%s, attempt %d): %s, action: %s',
+            task.func, kind, task.attempts,
+            exception.__class__.__name__, action)
+
+        self.failures.append({
+            'time': time.time(),
+            'kind': kind,
+            'action': action,
+            'attempt': task.attempts,
+            'args': task.args,
+            'exception': '%s: %s' % (exception.__class__.__name__, exception)
+        })
+
+    def counts(self):
+        """Return the number of failures of every kind"""
+
+        return collections.Counter(
+            failure['kind'] for failure in self.failures)
+
+    def write_report(self, filename):
+        """Write the recorded failures to a json file"""
+
+        with open(filename, 'w') as report_file:
+            json.dump(
+                {'counts': dict(self.counts()), 'failures': self.failures},
+                report_file,
+                indent=2,
+                default=str)
+
+    def __str__(self):
+        """String representation"""
+
+        return 'Retry of %s failures up to %d times, %d failures' % (
+            ', '.join(self.retried_kinds),
+            self.max_retries,
+            len(self.failures))
+
+
+class Executor(object):
+
+    """Runs tasks, possibly in parallel"""
+
+    # Time (s) between two checks of the state of the tasks
+    poll_interval = 0.01
+
+    def __init__(self):
+        """Constructor"""
+
+        # Futures that were cancelled, but were already running. They keep
+        # their worker busy until they finish
+        self._orphans = []
+
+    @property
+    def n_workers(self):
+        """Number of tasks that can run at the same time, None if unknown"""
+
+        return None
+
+    def _submit(self, func, *args):
+        """Submit task to the backend, return a future"""
+
+        raise NotImplementedError
+
+    def submit(self, func, *args):
+        """Submit task, return a Task"""
+
+        return Task(self._submit(func, *args), func, args)
+
+    def _recover(self):
+        """Restore the backend after a worker crash, if necessary"""
+        pass
+
+    def _orphan(self, futures):
+        """Keep track of the cancelled futures that still run"""
+
+        self._orphans.extend(
+            future for future in futures if not future.done())
+
+    def _speculate(self, pending, speculation, now):
+        """Submit copies of the straggler tasks to the idle workers"""
+
+        n_workers = self.n_workers
+        threshold = speculation.threshold()
+        if n_workers is None or threshold is None:
+            return
+
+        self._orphans = [
+            future for future in self._orphans if not future.done()]
+        busy = len(self._orphans) + sum(
+            1 for task in pending
+            for future in [task.future] + task.copies
+            if not future.done())
+
+        # Tasks that started first are copied first
+        for task in sorted(
+                pending,
+                key=lambda task: task.start_time or task.submit_time):
+            if busy >= n_workers:
+                break
+
+            running_time = now - (task.start_time or task.submit_time)
+            if len(task.copies) < speculation.max_copies and \
+                    running_time > threshold:
+                logger.debug(
+                    'Executor: task %s running for %.6g s (threshold '
+                    '%.6g s), submitting a speculative copy',
+                    task.func, running_time, threshold)
+                task.copies.append(self._submit(task.func, *task.args))
+                speculation.n_copies += 1
+                busy += 1
+
+    def as_completed(
+            self,
+            tasks,
+            timeout=None,
+            task_timeout=None,
+            speculation=None,
+            retry=None):
+        """Yield tasks as they complete
+
+        Args:
+            tasks (list of Tasks): tasks returned by submit()
+            timeout (float): time (s) after which TimeoutError is raised if
+                not all the tasks completed
+            task_timeout (float): time (s) a task is allowed to run, counted
+                from the moment the backend reports it is running (or from
+                its submission if the backend doesn't). Tasks that exceed
+                it are cancelled when the backend allows it, and yielded,
+                their result() raises TaskTimeoutError
+            speculation (Speculation): submit copies of the straggler tasks
+                when workers are idle, the result of the first copy that
+                finishes successfully is kept. The tasks need to return the
+                same result every time they run
+            retry (RetryPolicy): resubmit the tasks that failed in one of
+                the ways retried by the policy, instead of yielding them
+        """
+
+        start_time = time.time()
+        pending = list(tasks)
+
+        while pending:
+            now = time.time()
+            still_pending = []
+            for task in pending:
+                if task.start_time is None and task.running():
+                    task.start_time = now
+
+                if task.done():
+                    if task.end_time is None:
+                        task.end_time = now
+                    if not task.timed_out:
+                        straggler = bool(task.copies)
+                        # pylint: disable=W0212
+                        self._orphan(task._keep_first_finished())
+
+                        if retry is not None:
+                            kind = classify_failure(task.exception())
+                            if retry.should_retry(task, kind):
+                                retry.record(task, kind, 'retry')
+                                self._recover()
+                                task._resubmit(  # pylint: disable=W0212
+                                    self._submit(task.func, *task.args))
+                                still_pending.append(task)
+                                continue
+
+                        # The durations of the stragglers would be
+                        # shortened by their copies, they are left out
+                        if speculation is not None and not straggler:
+                            speculation.update(task.duration)
+                    yield task
+                elif task_timeout is not None and \
+                        now - (task.start_time or task.submit_time) > \
+                        task_timeout:
+                    futures = [task.future] + task.copies
+                    task.cancel()
+                    self._orphan(futures)
+                    task.timed_out = True
+                    task.end_time = now
+                    logger.debug(
+                        'Executor: task %s timed out after %.6g s',
+                        task.func, task.duration)
+                    yield task
+                else:
+                    still_pending.append(task)
+            pending = still_pending
+
+            if pending and speculation is not None:
+                self._speculate(pending, speculation, now)
+
+            if pending:
+                if timeout is not None and time.time() - start_time > timeout:
+                    raise concurrent.futures.TimeoutError(
+                        '%d tasks did not complete in %.6g s' %
+                        (len(pending), timeout))
+                time.sleep(self.poll_interval)
+
+    def map(self, func, *iterables):
+        """Apply func to every item of iterables, return the results
+
+        Can be used as map_function of an optimisation
+        """
+
+        tasks = [self.submit(func, *args) for args in zip(*iterables)]
+
+        return [task.result() for task in tasks]
+
+    def shutdown(self, wait=True):
+        """Release the resources of the executor"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def __str__(self):
+        """String representation"""
+
+        return '%s with %s workers' % (
+            self.__class__.__name__,
+            self.n_workers if self.n_workers is not None else 'unknown')
+
+
+class SerialExecutor(Executor):
+
+    """Runs tasks one after the other in the current process"""
+
+    @property
+    def n_workers(self):
+        """Number of tasks that can run at the same time"""
+
+        return 1
+
+    def _submit(self, func, *args):
+        """Run the task, return a completed future"""
+
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(func(*args))
+        except BaseException as exception:  # pylint: disable=W0703
+            future.set_exception(exception)
+
+        return future
+
+
+class FuturesExecutor(Executor):
+
+    """Runs tasks with a concurrent.futures executor"""
+
+    def __init__(self, executor=None, max_workers=None, mp_context=None):
+        """Constructor
+
+        Args:
+            executor (concurrent.futures.Executor): executor to use, by
+                default a ProcessPoolExecutor with max_workers processes is
+                created
+            max_workers (int): number of processes, by default the number
+                of processors of the machine
+            mp_context (multiprocessing context): context used to start the
+                processes of the created ProcessPoolExecutor, e.g. the
+                context of an ephys.workers.WorkerTemplate
+        """
+
+        super(FuturesExecutor, self).__init__()
+
+        self.own_executor = executor is None
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+        if executor is None:
+            executor = self._create_pool()
+
+        self.executor = executor
+
+    def _create_pool(self):
+        """Create a process pool"""
+
+        if self.mp_context is None:
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers)
+
+        # mp_context needs Python 3.7
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=self.mp_context)
+
+    @property
+    def n_workers(self):
+        """Number of tasks that can run at the same time"""
+
+        return getattr(self.executor, '_max_workers', None)
+
+    def _submit(self, func, *args):
+        """Submit task to the backend, return a future"""
+
+        return self.executor.submit(func, *args)
+
+    def _recover(self):
+        """Replace the process pool if a worker crash broke it"""
+
+        # A process pool can't be used anymore after one of its processes
+        # died, the pools created by this executor are replaced
+        if self.own_executor and getattr(self.executor, '_broken', False):
+            logger.warning(
+                'FuturesExecutor: a worker crashed, restarting the pool')
+            self.executor.shutdown(wait=False)
+            self.executor = self._create_pool()
+
+    def shutdown(self, wait=True):
+        """Release the resources of the executor"""
+
+        self.executor.shutdown(wait=wait)
+
+
+class ScoopExecutor(Executor):
+
+    """Runs tasks on scoop workers
+
+    The program needs to be started with python -m scoop
+    """
+
+    @property
+    def n_workers(self):
+        """Number of tasks that can run at the same time"""
+
+        import scoop
+
+        return getattr(scoop, 'SIZE', None)
+
+    def _submit(self, func, *args):
+        """Submit task to the backend, return a future"""
+
+        from scoop import futures
+
+        return futures.submit(func, *args)
+
+    def map(self, func, *iterables):
+        """Apply func to every item of iterables, return the results"""
+
+        from scoop import futures
+
+        return list(futures.map(func, *iterables))
+
+
+class IPyParallelExecutor(Executor):
+
+    """Runs tasks on the engines of an ipyparallel view"""
+
+    def __init__(self, view):
+        """Constructor
+
+        Args:
+            view (ipyparallel.View): view used to run the tasks, e.g.
+                client.load_balanced_view()
+        """
+
+        super(IPyParallelExecutor, self).__init__()
+
+        self.view = view
+
+    @property
+    def n_workers(self):
+        """Number of tasks that can run at the same time"""
+
+        targets = self.view.targets
+        if targets is None:
+            return len(self.view.client.ids)
+        elif isinstance(targets, int):
+            return 1
+        else:
+            return len(targets)
+
+    def _submit(self, func, *args):
+        """Submit task to the backend, return a future"""
+
+        # AsyncResult objects are concurrent.futures.Future objects
+        return self.view.apply_async(func, *args)
@@ -31,7 +31,8 @@ import dateutil.parser
 import itertools
 
 import numpy as np
-import matplotlib.pyplot as plt
+
+# matplotlib is imported by the functions that plot
 
 
 def get_engine_data(tasksdb_filename):
@@ -69,6 +70,8 @@ def get_engine_data(tasksdb_filename):
 def plot_usage(tasks, engine_number_map):
     """Plot usage stats"""
 
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(8, 8))
     for engine_uuid, task_list in tasks.iteritems():
         engine_number = engine_number_map[engine_uuid]
@@ -93,6 +96,8 @@ def plot_usage(tasks, engine_number_map):
 
 def plot_duration_histogram(tasks):
     """Plot duration histogram"""
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(8, 8))
 
     durations = np.fromiter((t['duration']
@@ -135,6 +140,8 @@ def run(arg_list):
     if not os.path.isfile(args.tasksdb_filename):
         raise IOError('Tasks db file not found at: %s' % args.tasksdb_filename)
 
+    import matplotlib.pyplot as plt
+
     tasks, engine_number_map = get_engine_data(args.tasksdb_filename)
     plot_usage(tasks, engine_number_map)
     plot_duration_histogram(tasks)
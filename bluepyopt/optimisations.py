@@ -30,3 +30,18 @@ class Optimisation(object):
         """Constructor"""
 
         self.evaluator = evaluator
+
+
+def __getattr__(name):
+    """Import DEAPOptimisation on first use"""
+
+    # Add some backward compatibility for the time when DEAPoptimisation not
+    # in deapext yet
+    # TODO deprecate this
+    if name == 'DEAPOptimisation':
+        import bluepyopt.deapext.optimisations
+
+        return bluepyopt.deapext.optimisations.DEAPOptimisation
+
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,282 @@
+"""Worker-side registry of evaluators"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# Mapping a bound method of an evaluator over a population pickles the whole
+# evaluator (cell model, protocols, features, ...) with every task. Instead,
+# the pickled evaluator (the payload) can be broadcast once to the workers,
+# where it is unpickled once and stored in a registry, keyed by the hash of
+# the payload. The tasks then only contain this key and a parameter list.
+
+import os
+import pickle
+import functools
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Evaluators registered in this process, by evaluator id
+_evaluators = {}
+
+
+class RegistryException(Exception):
+
+    """Exception raised when an evaluator is not registered"""
+
+
+def evaluator_payload(evaluator):
+    """Return pickled evaluator"""
+
+    return pickle.dumps(evaluator, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def payload_id(payload):
+    """Return id of pickled evaluator, based on its content"""
+
+    return hashlib.sha1(payload).hexdigest()
+
+
+def register(payload):
+    """Unpickle evaluator in this process, and return its id"""
+
+    evaluator_id = payload_id(payload)
+
+    if evaluator_id not in _evaluators:
+        logger.debug('Registering evaluator %s', evaluator_id)
+        _evaluators[evaluator_id] = pickle.loads(payload)
+
+    return evaluator_id
+
+
+def unregister(evaluator_id):
+    """Remove evaluator from the registry of this process"""
+
+    _evaluators.pop(evaluator_id, None)
+
+
+def is_registered(evaluator_id):
+    """Check if evaluator is registered in this process"""
+
+    return evaluator_id in _evaluators
+
+
+def get_evaluator(evaluator_id, loader=None):
+    """Return registered evaluator
+
+    Args:
+        evaluator_id (str): id of the evaluator
+        loader (callable): function that returns the payload of an
+            evaluator id, used when the evaluator is not registered yet
+    """
+
+    if evaluator_id not in _evaluators:
+        if loader is None:
+            raise RegistryException(
+                'Evaluator %s is not registered in process %d, it needs to '
+                'be broadcast to the workers before it is used' %
+                (evaluator_id, os.getpid()))
+
+        payload = loader(evaluator_id)
+        if payload_id(payload) != evaluator_id:
+            raise RegistryException(
+                'Payload loaded for evaluator %s has a different content' %
+                evaluator_id)
+        register(payload)
+
+    return _evaluators[evaluator_id]
+
+
+class RegisteredEvaluation(object):
+
+    """Task function evaluating parameters with a registered evaluator
+
+    Pickling this object only pickles the evaluator id, the method name and
+    the loader, so it can be mapped at low cost.
+    """
+
+    def __init__(
+            self,
+            evaluator_id,
+            method_name='evaluate_with_lists',
+            loader=None):
+        """Constructor
+
+        Args:
+            evaluator_id (str): id of the evaluator
+            method_name (str): evaluator method that is called
+            loader (callable): picklable function that returns the payload
+                of an evaluator id, called on workers on which the
+                evaluator is not registered
+        """
+
+        self.evaluator_id = evaluator_id
+        self.method_name = method_name
+        self.loader = loader
+
+    def __call__(self, *args):
+        """Call the method of the registered evaluator"""
+
+        evaluator = get_evaluator(self.evaluator_id, loader=self.loader)
+
+        return getattr(evaluator, self.method_name)(*args)
+
+
+class Broadcast(object):
+
+    """Ships evaluator payloads to the workers"""
+
+    def broadcast(self, evaluator_id, payload):
+        """Make payload available on the workers"""
+
+        raise NotImplementedError
+
+    @property
+    def loader(self):
+        """Picklable function returning the payload of an evaluator id"""
+
+        return None
+
+    def register(self, evaluator):
+        """Broadcast evaluator, and return its id"""
+
+        payload = evaluator_payload(evaluator)
+        evaluator_id = payload_id(payload)
+
+        logger.debug(
+            'Broadcasting evaluator %s (%d bytes) with %s',
+            evaluator_id,
+            len(payload),
+            self.__class__.__name__)
+        self.broadcast(evaluator_id, payload)
+
+        return evaluator_id
+
+
+class LocalBroadcast(Broadcast):
+
+    """Register the evaluator in the current process only
+
+    For map functions that run the tasks in the current process
+    """
+
+    def broadcast(self, evaluator_id, payload):
+        """Make payload available on the workers"""
+
+        register(payload)
+
+
+def _file_path(directory, evaluator_id):
+    """Path of the payload file of an evaluator"""
+
+    return os.path.join(directory, '%s.pkl' % evaluator_id)
+
+
+def _file_load(directory, evaluator_id):
+    """Return payload from the file of an evaluator"""
+
+    with open(_file_path(directory, evaluator_id), 'rb') as payload_file:
+        return payload_file.read()
+
+
+class FileBroadcast(Broadcast):
+
+    """Write the payload in a directory shared with the workers"""
+
+    def __init__(self, directory):
+        """Constructor
+
+        Args:
+            directory (str): directory accessible by all the workers
+        """
+
+        self.directory = directory
+
+    def broadcast(self, evaluator_id, payload):
+        """Make payload available on the workers"""
+
+        path = _file_path(self.directory, evaluator_id)
+        if not os.path.exists(path):
+            with open(path, 'wb') as payload_file:
+                payload_file.write(payload)
+
+    def load(self, evaluator_id):
+        """Read payload of an evaluator"""
+
+        return _file_load(self.directory, evaluator_id)
+
+    @property
+    def loader(self):
+        """Picklable function returning the payload of an evaluator id"""
+
+        # Bound methods can't be pickled by Python 2
+        return functools.partial(_file_load, self.directory)
+
+
+def _scoop_key(evaluator_id):
+    """Name of the scoop shared constant of an evaluator"""
+
+    return 'bluepyopt_evaluator_%s' % evaluator_id
+
+
+def _scoop_load(evaluator_id):
+    """Return payload from the scoop shared constants"""
+
+    from scoop import shared
+
+    return shared.getConst(_scoop_key(evaluator_id))
+
+
+class ScoopBroadcast(Broadcast):
+
+    """Share the payload as a scoop constant"""
+
+    def broadcast(self, evaluator_id, payload):
+        """Make payload available on the workers"""
+
+        from scoop import shared
+
+        shared.setConst(**{_scoop_key(evaluator_id): payload})
+
+    @property
+    def loader(self):
+        """Picklable function returning the payload of an evaluator id"""
+
+        return _scoop_load
+
+
+class IPyParallelBroadcast(Broadcast):
+
+    """Register the evaluator on the engines of an ipyparallel view"""
+
+    def __init__(self, view):
+        """Constructor
+
+        Args:
+            view (ipyparallel.DirectView): view on all the engines, e.g.
+                client[:]
+        """
+
+        self.view = view
+
+    def broadcast(self, evaluator_id, payload):
+        """Make payload available on the workers"""
+
+        self.view.apply_sync(register, payload)
@@ -28,3 +28,59 @@ from nose.plugins.attrib import attr
 def test_import():
     """bluepyopt: test importing bluepyopt"""
     import bluepyopt  # NOQA
+
+
+@attr('unit')
+def test_import_startup():
+    """bluepyopt: test that importing bluepyopt.ephys stays light"""
+
+    import os
+    import sys
+    import json
+    import subprocess
+
+    import nose.tools as nt
+
+    import bluepyopt
+
+    # A new process, the modules are already imported by other tests here
+    code = 'import sys, json, bluepyopt.ephys; ' \
+        'print(json.dumps(sorted(sys.modules)))'
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(bluepyopt.__file__))] +
+        [path for path in [env.get('PYTHONPATH')] if path])
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    modules = json.loads(output.decode().strip().split('\n')[-1])
+
+    heavy_modules = ['pandas', 'matplotlib', 'jinja2']
+    if sys.version_info >= (3, 7):
+        # Older versions import deapext with bluepyopt
+        heavy_modules += ['deap', 'bluepyopt.deapext']
+
+    for heavy_module in heavy_modules:
+        nt.assert_not_in(heavy_module, modules)
+
+
+@attr('unit')
+def test_lazy_subpackages():
+    """bluepyopt: test the subpackages imported on first use"""
+
+    import sys
+
+    import nose.tools as nt
+
+    import bluepyopt
+
+    if sys.version_info < (3, 7):
+        # Older versions only import deapext with bluepyopt
+        import bluepyopt.ephys  # NOQA
+
+    nt.assert_true(hasattr(bluepyopt.deapext.optimisations,
+                           'DEAPOptimisation'))
+    nt.assert_is(bluepyopt.optimisations.DEAPOptimisation,
+                 bluepyopt.deapext.optimisations.DEAPOptimisation)
+    nt.assert_true(hasattr(bluepyopt.ephys, 'simulators'))
+    nt.assert_raises(AttributeError, getattr, bluepyopt, 'not_a_module')
+    nt.assert_raises(
+        AttributeError, getattr, bluepyopt.deapext, 'not_a_module')
@@ -54,6 +54,258 @@ def test_eaAlphaMuPlusLambdaCheckpoint():
     nt.assert_true(isinstance(history, deap.tools.support.History))
 
 
+@attr('unit')
+def test_eaAlphaMuPlusLambdaCheckpoint_population_batches():
+    """deapext.algorithms: Testing evaluation of population batches"""
+
+    deap.creator.create('fit', deap.base.Fitness, weights=(-1.0,))
+    deap.creator.create(
+        'ind',
+        numpy.ndarray,
+        fitness=deap.creator.__dict__['fit'])
+
+    population = [deap.creator.__dict__['ind'](x)
+                  for x in numpy.random.uniform(0, 1,
+                                                (10, 2))]
+
+    batch_sizes = []
+
+    def evaluate_population(individuals):
+        """Evaluate a batch of individuals"""
+        batch_sizes.append(len(individuals))
+        return [deap.benchmarks.sphere(ind) for ind in individuals]
+
+    toolbox = deap.base.Toolbox()
+    toolbox.register("evaluate", deap.benchmarks.sphere)
+    toolbox.register("evaluate_population", evaluate_population)
+    toolbox.population_batch_size = 4
+    toolbox.register("select", lambda pop, mu: pop)
+    toolbox.register("variate", lambda par, toolb, cxpb, mutpb: par)
+
+    population, _, _, _ = \
+        bluepyopt.deapext.algorithms.eaAlphaMuPlusLambdaCheckpoint(
+            population=population,
+            toolbox=toolbox,
+            mu=1.0,
+            cxpb=1.0,
+            mutpb=1.0,
+            ngen=1,
+            stats=None,
+            halloffame=None,
+            cp_frequency=1,
+            cp_filename=None,
+            continue_cp=False)
+
+    nt.assert_equal(batch_sizes, [4, 4, 2])
+    for ind in population:
+        nt.assert_equal(ind.fitness.values, deap.benchmarks.sphere(ind))
+
+
+@attr('unit')
+def test_eaAlphaMuPlusLambdaCheckpoint_cost_model():
+    """deapext.algorithms: Testing longest predicted first submission"""
+
+    import bluepyopt.deapext.costmodel
+
+    deap.creator.create('fit', deap.base.Fitness, weights=(-1.0,))
+    deap.creator.create(
+        'ind',
+        numpy.ndarray,
+        fitness=deap.creator.__dict__['fit'])
+
+    population = [deap.creator.__dict__['ind'](x)
+                  for x in numpy.random.uniform(0, 1,
+                                                (10, 2))]
+
+    submitted = []
+
+    def evaluate_timed(ind):
+        """Evaluate, time grows with the first parameter"""
+        submitted.append(ind[0])
+        return deap.benchmarks.sphere(ind), {'protocol': numpy.exp(ind[0])}
+
+    toolbox = deap.base.Toolbox()
+    toolbox.register("evaluate", deap.benchmarks.sphere)
+    toolbox.register("evaluate_timed", evaluate_timed)
+    toolbox.cost_model = bluepyopt.deapext.costmodel.CostModel(
+        regularisation=0.0)
+    toolbox.register("select", lambda pop, mu: pop)
+    toolbox.register(
+        "variate",
+        lambda par, toolb, cxpb, mutpb: [
+            deap.creator.__dict__['ind'](x)
+            for x in numpy.random.uniform(0, 1, (10, 2))])
+
+    bluepyopt.deapext.algorithms.eaAlphaMuPlusLambdaCheckpoint(
+        population=population,
+        toolbox=toolbox,
+        mu=1.0,
+        cxpb=1.0,
+        mutpb=1.0,
+        ngen=2,
+        stats=None,
+        halloffame=None,
+        cp_frequency=1,
+        cp_filename=None,
+        continue_cp=False)
+
+    nt.assert_equal(len(submitted), 20)
+    nt.assert_equal(len(toolbox.cost_model.samples['protocol'][1]), 20)
+
+    # The offspring is submitted in order of decreasing expected time
+    nt.assert_equal(submitted[10:], sorted(submitted[10:], reverse=True))
+
+
+@attr('unit')
+def test_eaAlphaMuPlusLambdaCheckpoint_retry():
+    """deapext.algorithms: Testing max_score of failed evaluations"""
+
+    import bluepyopt.executors
+
+    deap.creator.create('fit', deap.base.Fitness, weights=(-1.0,))
+    deap.creator.create(
+        'ind',
+        numpy.ndarray,
+        fitness=deap.creator.__dict__['fit'])
+
+    population = [deap.creator.__dict__['ind'](x)
+                  for x in numpy.random.uniform(0, 1,
+                                                (10, 2))]
+
+    def evaluate(ind):
+        """Evaluate, fail when the first parameter is above 0.5"""
+        if ind[0] > 0.5:
+            raise RuntimeError('hoc error')
+        return deap.benchmarks.sphere(ind)
+
+    toolbox = deap.base.Toolbox()
+    toolbox.register("evaluate", evaluate)
+    toolbox.register("select", lambda pop, mu: pop)
+    toolbox.register("variate", lambda par, toolb, cxpb, mutpb: par)
+    toolbox.executor = bluepyopt.executors.SerialExecutor()
+    toolbox.retry = bluepyopt.executors.RetryPolicy()
+    toolbox.max_score_objectives = [250.0]
+
+    bluepyopt.deapext.algorithms.eaAlphaMuPlusLambdaCheckpoint(
+        population=population,
+        toolbox=toolbox,
+        mu=1.0,
+        cxpb=1.0,
+        mutpb=1.0,
+        ngen=1,
+        stats=None,
+        halloffame=None,
+        cp_frequency=1,
+        cp_filename=None,
+        continue_cp=False)
+
+    failed = [ind for ind in population if ind[0] > 0.5]
+    for ind in population:
+        if ind[0] > 0.5:
+            nt.assert_equal(ind.fitness.values, (250.0,))
+        else:
+            nt.assert_equal(ind.fitness.values, deap.benchmarks.sphere(ind))
+
+    # Simulator exceptions are not retried
+    nt.assert_equal(len(toolbox.retry.failures), len(failed))
+    for failure in toolbox.retry.failures:
+        nt.assert_equal(failure['kind'], bluepyopt.executors.SIMULATOR)
+        nt.assert_equal(failure['action'], 'max_score')
+
+    nt.assert_equal(
+        bluepyopt.deapext.algorithms.failure_report_filename(
+            'checkpoints/run.pkl'),
+        'checkpoints/run_failures.json')
+
+    # Other exceptions stop the optimisation
+    toolbox.register("evaluate", lambda ind: ind.unknown_attribute)
+    for ind in population:
+        del ind.fitness.values
+    nt.assert_raises(
+        AttributeError,
+        bluepyopt.deapext.algorithms.eaAlphaMuPlusLambdaCheckpoint,
+        population=population,
+        toolbox=toolbox,
+        mu=1.0,
+        cxpb=1.0,
+        mutpb=1.0,
+        ngen=1)
+
+
+@attr('unit')
+def test_eaAlphaMuPlusLambdaCheckpoint_fidelity_ladder():
+    """deapext.algorithms: Testing evaluation with a fidelity ladder"""
+
+    deap.creator.create('fit', deap.base.Fitness, weights=(-1.0,))
+    deap.creator.create(
+        'ind',
+        numpy.ndarray,
+        fitness=deap.creator.__dict__['fit'])
+
+    population = [deap.creator.__dict__['ind'](x)
+                  for x in numpy.random.uniform(0, 1,
+                                                (10, 2))]
+
+    def evaluate_coarse(ind):
+        """Cheap evaluation, with twice the full objective"""
+        return (2 * deap.benchmarks.sphere(ind)[0],)
+
+    toolbox = deap.base.Toolbox()
+    toolbox.register("evaluate", deap.benchmarks.sphere)
+    toolbox.register("select", lambda pop, mu: pop[:mu])
+    toolbox.register("variate", lambda par, toolb, cxpb, mutpb: par)
+    toolbox.fidelity_ladder = [(evaluate_coarse, 0.5)]
+
+    stats = deap.tools.Statistics(key=lambda ind: ind.fitness.values[0])
+    stats.register('min', numpy.min)
+    halloffame = deap.tools.HallOfFame(10, similar=numpy.array_equal)
+
+    population, hof, logbook, history = \
+        bluepyopt.deapext.algorithms.eaAlphaMuPlusLambdaCheckpoint(
+            population=population,
+            toolbox=toolbox,
+            mu=10,
+            cxpb=1.0,
+            mutpb=1.0,
+            ngen=1,
+            stats=stats,
+            halloffame=halloffame,
+            cp_frequency=1,
+            cp_filename=None,
+            continue_cp=False)
+
+    # The best half is evaluated again at the full fidelity
+    spheres = sorted(deap.benchmarks.sphere(ind)[0] for ind in population)
+    for ind in population:
+        sphere = deap.benchmarks.sphere(ind)[0]
+        if sphere <= spheres[4]:
+            nt.assert_equal(ind.fidelity, 1)
+            nt.assert_equal(ind.fitness.values, (sphere,))
+        else:
+            nt.assert_equal(ind.fidelity, 0)
+            nt.assert_equal(ind.fitness.values, (2 * sphere,))
+
+    nt.assert_true('fidelity' in logbook.header)
+    nt.assert_equal(logbook[0]['fidelity'], [5, 5])
+    nt.assert_equal(logbook[0]['nevals'], 10)
+
+    # Only the individuals of the full fidelity enter the hall of fame
+    nt.assert_equal(len(hof), 5)
+    for ind in hof:
+        nt.assert_equal(ind.fidelity, 1)
+
+    # The history keeps the fidelity of the individuals
+    nt.assert_equal(
+        sorted(ind.fidelity for ind in history.genealogy_history.values()),
+        [0] * 5 + [1] * 5)
+
+    # The selection takes the individuals of the full fidelity first
+    selected = bluepyopt.deapext.algorithms._select(  # pylint: disable=W0212
+        toolbox, list(reversed(population)), 7)
+    nt.assert_equal(
+        [ind.fidelity for ind in selected], [1] * 5 + [0] * 2)
+
+
 @attr('unit')
 def test_eaAlphaMuPlusLambdaCheckpoint_with_checkpoint():
     """deapext.algorithms: Testing eaAlphaMuPlusLambdaCheckpoint"""
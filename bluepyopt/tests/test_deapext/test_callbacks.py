@@ -0,0 +1,130 @@
+"""bluepyopt.deapext.callbacks tests"""
+
+import os
+import shutil
+import tempfile
+
+import numpy
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+
+import deap.tools
+
+import bluepyopt.deapext.algorithms as algorithms
+import bluepyopt.deapext.callbacks as callbacks
+
+
+def _generation(gen, population=None, halloffame=None, **kwargs):
+    """Return generation, without individuals by default"""
+
+    return algorithms.Generation(
+        gen, population or [], [], halloffame, deap.tools.Logbook(), None,
+        1, None, 1.0, 1.0, **kwargs)
+
+
+@attr('unit')
+def test_Callback():
+    """deapext.callbacks: Testing that Callback is abstract"""
+
+    class NoCall(callbacks.Callback):
+        """Callback without __call__"""
+
+    nt.assert_raises(TypeError, callbacks.Callback)
+    nt.assert_raises(TypeError, NoCall)
+    nt.assert_equal(str(callbacks.MaxNGen(2)), 'MaxNGen(2)')
+
+
+@attr('unit')
+def test_LogbookInfoWriter():
+    """deapext.callbacks: Testing LogbookInfoWriter"""
+
+    test_dir = tempfile.mkdtemp()
+    try:
+        cp_filename = os.path.join(test_dir, 'run.pkl')
+        writer = callbacks.LogbookInfoWriter()
+
+        nt.assert_false(writer(_generation(
+            1, stream='gen 1', cp_filename=cp_filename)))
+        nt.assert_false(writer(_generation(
+            2, stream='gen 2', cp_filename=cp_filename, checkpointed=True)))
+
+        with open(os.path.join(test_dir, 'logbook_info.txt')) as info_file:
+            nt.assert_equal(
+                info_file.read(),
+                'gen 2 %s \n' % os.path.join(test_dir, 'run'))
+    finally:
+        shutil.rmtree(test_dir)
+
+
+@attr('unit')
+def test_stop_criteria():
+    """deapext.callbacks: Testing MaxNGen and MaxWallTime"""
+
+    max_ngen = callbacks.MaxNGen(3)
+    nt.assert_false(max_ngen(_generation(2)))
+    nt.assert_true(max_ngen(_generation(3)))
+    nt.assert_equal(str(max_ngen), 'MaxNGen(3)')
+
+    max_wall_time = callbacks.MaxWallTime(0.0)
+    nt.assert_true(max_wall_time(_generation(1)))
+    nt.assert_false(callbacks.MaxWallTime(1000.0)(_generation(1)))
+
+    nt.assert_true(algorithms.run_callbacks(
+        [callbacks.MaxNGen(5), max_ngen], _generation(3)))
+    nt.assert_false(algorithms.run_callbacks([], _generation(3)))
+
+
+def _population(values_list):
+    """Return individuals with fitness values to minimise"""
+
+    from bluepyopt.deapext.optimisations import WSListIndividual
+
+    population = []
+    for values in values_list:
+        ind = WSListIndividual(values, obj_size=len(values))
+        ind.fitness.values = values
+        population.append(ind)
+
+    return population
+
+
+@attr('unit')
+def test_HypervolumeStagnation():
+    """deapext.callbacks: Testing HypervolumeStagnation"""
+
+    stagnation = callbacks.HypervolumeStagnation(epsilon=0.01, window=2)
+
+    fronts = [[[3.0, 1.0], [1.0, 3.0]],
+              [[2.0, 1.0], [1.0, 2.0]],
+              [[1.0, 1.0]],
+              [[1.0, 1.0]],
+              [[1.0, 1.0]]]
+    stops = [stagnation(_generation(gen, population=_population(front)))
+             for gen, front in enumerate(fronts, 1)]
+
+    nt.assert_equal(stops, [False, False, False, False, True])
+    nt.assert_equal(
+        stagnation.hypervolumes, sorted(stagnation.hypervolumes))
+    numpy.testing.assert_almost_equal(stagnation.reference, [3.3, 3.3])
+
+
+@attr('unit')
+def test_HallOfFameStagnation_TargetFitness():
+    """deapext.callbacks: Testing HallOfFameStagnation and TargetFitness"""
+
+    stagnation = callbacks.HallOfFameStagnation(window=2)
+    nt.assert_false(stagnation(_generation(1, halloffame=[[1.0]])))
+    nt.assert_false(stagnation(_generation(2, halloffame=[[0.5]])))
+    nt.assert_false(stagnation(_generation(3, halloffame=[[0.5]])))
+    nt.assert_true(stagnation(_generation(4, halloffame=[[0.5]])))
+
+    population = _population([[1.0, 2.0], [2.0, 0.5]])
+    nt.assert_true(callbacks.TargetFitness(2.5)(
+        _generation(1, population=population)))
+    nt.assert_false(callbacks.TargetFitness(2.0)(
+        _generation(1, population=population)))
+    nt.assert_true(callbacks.TargetFitness([2.0, 1.0])(
+        _generation(1, population=population)))
+    nt.assert_false(callbacks.TargetFitness([1.5, 1.0])(
+        _generation(1, population=population)))
@@ -0,0 +1,50 @@
+"""bluepyopt.deapext.costmodel tests"""
+
+import numpy
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+
+import bluepyopt.deapext.costmodel
+
+
+@attr('unit')
+def test_CostModel():
+    """deapext.costmodel: Testing CostModel predictions"""
+
+    cost_model = bluepyopt.deapext.costmodel.CostModel()
+    nt.assert_equal(cost_model.predict([0.5, 0.5]), None)
+
+    # The duration of step depends on the first parameter, the one of
+    # ramp is constant
+    rng = numpy.random.RandomState(1)
+    for params in rng.uniform(0, 1, (50, 2)):
+        cost_model.update(
+            params,
+            {'step': 0.1 * numpy.exp(3 * params[0]), 'ramp': 0.2})
+
+    nt.assert_equal(len(cost_model.samples['step'][1]), 50)
+    nt.assert_true('step: 50' in str(cost_model))
+
+    nt.assert_almost_equal(
+        cost_model.predict_protocol('step', [0.5, 0.1]),
+        0.1 * numpy.exp(1.5),
+        places=2)
+    nt.assert_almost_equal(
+        cost_model.predict_protocol('ramp', [0.5, 0.1]), 0.2, places=3)
+    nt.assert_true(cost_model.predict([0.9, 0.5]) >
+                   cost_model.predict([0.1, 0.5]))
+    nt.assert_equal(cost_model.predict_protocol('unknown', [0.5, 0.5]), None)
+
+
+@attr('unit')
+def test_CostModel_max_samples():
+    """deapext.costmodel: Testing CostModel keeps recent samples"""
+
+    cost_model = bluepyopt.deapext.costmodel.CostModel(max_samples=10)
+    for index in range(20):
+        cost_model.update([index], {'step': 1.0 + index})
+
+    params_list, durations = cost_model.samples['step']
+    nt.assert_equal(len(durations), 10)
+    nt.assert_equal(params_list[0], [10])
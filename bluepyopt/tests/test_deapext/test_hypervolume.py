@@ -0,0 +1,52 @@
+"""bluepyopt.deapext.tools.hypervolume tests"""
+
+import time
+
+import numpy
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+
+import bluepyopt.deapext.tools as tools
+
+
+@attr('unit')
+def test_hypervolume():
+    """deapext.tools: Testing hypervolume approximation"""
+
+    directions = tools.direction_vectors(3, n_directions=10000)
+    nt.assert_equal(directions.shape, (10000, 3))
+    numpy.testing.assert_almost_equal(
+        numpy.linalg.norm(directions, axis=1), 1.0)
+
+    # Exact values: a box, and two boxes overlapping by a quarter
+    nt.assert_almost_equal(
+        tools.hypervolume([[0.5, 0.5, 0.5]], [1, 1, 1], directions),
+        0.125, places=2)
+    nt.assert_almost_equal(
+        tools.hypervolume([[0.5, 0.0], [0.0, 0.5]], [1, 1],
+                          tools.direction_vectors(2, 10000)),
+        0.75, places=2)
+
+    # Points that don't dominate the reference point don't count
+    nt.assert_equal(tools.hypervolume([[2.0, 2.0]], [1, 1]), 0.0)
+    nt.assert_equal(tools.hypervolume([], [1, 1]), 0.0)
+
+
+@attr('unit')
+def test_hypervolume_many_objectives():
+    """deapext.tools: Testing hypervolume with many objectives"""
+
+    directions = tools.direction_vectors(30)
+    points = numpy.random.RandomState(1).uniform(0, 1, (200, 30))
+
+    start_time = time.time()
+    volume = tools.hypervolume(points, [1.5] * 30, directions)
+    nt.assert_true(time.time() - start_time < 1.0)
+
+    nt.assert_true(volume > 0)
+    nt.assert_true(volume < 1.5 ** 30)
+
+    # Improving the front increases the hypervolume
+    nt.assert_true(
+        tools.hypervolume(points * 0.9, [1.5] * 30, directions) > volume)
@@ -0,0 +1,155 @@
+"""bluepyopt.deapext.islands tests"""
+
+import os
+import shutil
+import tempfile
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+
+import deap.base
+
+import bluepyopt.deapext.islands as islands
+import bluepyopt.ephys.examples as examples
+
+
+@attr('unit')
+def test_migration_destinations():
+    """deapext.islands: Testing migration_destinations"""
+
+    nt.assert_equal(islands.migration_destinations(4, 'ring'), [1, 2, 3, 0])
+    nt.assert_equal(islands.migration_destinations(1, 'ring'), [0])
+
+    destinations = islands.migration_destinations(5, 'random')
+    nt.assert_equal(sorted(destinations), list(range(5)))
+    for index, destination in enumerate(destinations):
+        nt.assert_not_equal(index, destination)
+
+    nt.assert_raises(ValueError, islands.migration_destinations, 4, 'star')
+
+
+@attr('unit')
+def test_migrate():
+    """deapext.islands: Testing migrate"""
+
+    toolbox = deap.base.Toolbox()
+    # The individuals are numbers, the largest ones are the elite
+    toolbox.register(
+        'select', lambda inds, k: sorted(inds, reverse=True)[:k])
+
+    new_parents = islands.migrate(
+        [[1, 2, 3], [10, 20, 30]], toolbox, 1, [1, 0])
+
+    nt.assert_equal(sorted(new_parents[0]), [2, 3, 30])
+    nt.assert_equal(sorted(new_parents[1]), [3, 20, 30])
+
+
+@attr('unit')
+def test_IslandDEAPOptimisation():
+    """deapext.islands: Testing IslandDEAPOptimisation run and continue"""
+
+    nt.assert_raises(
+        ValueError,
+        islands.IslandDEAPOptimisation,
+        examples.simplecell.cell_evaluator,
+        topology='star')
+
+    test_dir = tempfile.mkdtemp()
+    try:
+        cp_filename = os.path.join(test_dir, 'archipelago.pkl')
+
+        optimisation = islands.IslandDEAPOptimisation(
+            examples.simplecell.cell_evaluator,
+            n_islands=2,
+            migration_interval=2,
+            n_migrants=1,
+            offspring_size=2,
+            selector_name='NSGA2')
+
+        populations, hof, logbooks, history = optimisation.run(
+            max_ngen=2, cp_filename=cp_filename)
+
+        nt.assert_equal(len(populations), 2)
+        nt.assert_equal(len(logbooks), 2)
+        for index, logbook in enumerate(logbooks):
+            nt.assert_equal(logbook.select('gen'), [1, 2])
+            nt.assert_equal(logbook.select('island'), [index, index])
+            nt.assert_equal(logbook.select('nevals'), [2, 2])
+        nt.assert_true(os.path.exists(cp_filename))
+
+        populations, hof, logbooks, history = optimisation.run(
+            max_ngen=3, continue_cp=True, cp_filename=cp_filename)
+
+        for logbook in logbooks:
+            nt.assert_equal(logbook.select('gen'), [1, 2, 3])
+        # History.update adds the parents again in every generation
+        nt.assert_equal(len(history.genealogy_history), 2 * (2 + 4 + 4))
+    finally:
+        shutil.rmtree(test_dir)
+
+
+@attr('unit')
+def test_IslandDEAPOptimisation_rng_streams():
+    """deapext.islands: Testing IslandDEAPOptimisation with rng_streams"""
+
+    import random
+
+    def draining_map(func, *iterables):
+        """Map that draws from the random module"""
+        random.random()
+        return list(map(func, *iterables))
+
+    def run(map_function=None):
+        """Return the parameters of the individuals of the islands"""
+        optimisation = islands.IslandDEAPOptimisation(
+            examples.simplecell.cell_evaluator,
+            n_islands=3,
+            migration_interval=1,
+            topology='random',
+            offspring_size=2,
+            selector_name='NSGA2',
+            map_function=map_function,
+            rng_streams=True)
+        populations, _, _, _ = optimisation.run(max_ngen=3)
+        return [[list(ind) for ind in population]
+                for population in populations]
+
+    nt.assert_equal(run(), run(draining_map))
+
+
+@attr('unit')
+def test_IslandDEAPOptimisation_callbacks():
+    """deapext.islands: Testing IslandDEAPOptimisation with callbacks"""
+
+    import bluepyopt.deapext.callbacks as callbacks
+
+    def optimisation():
+        """Archipelago of two islands"""
+        return islands.IslandDEAPOptimisation(
+            examples.simplecell.cell_evaluator,
+            n_islands=2,
+            migration_interval=1,
+            offspring_size=2,
+            selector_name='NSGA2')
+
+    generations = list(optimisation().run_iter(max_ngen=3))
+    nt.assert_equal([generation.gen for generation in generations],
+                    [1, 2, 3])
+    for generation in generations:
+        nt.assert_equal(len(generation.islands), 2)
+        nt.assert_equal(len(generation.population), 2 * 2 * 2
+                        if generation.gen > 1 else 2 * 2)
+        nt.assert_equal(len(generation.parents), 2 * 2)
+    nt.assert_equal(generations[-1].logbook.select('gen'), [1, 2, 3])
+    nt.assert_equal(generations[-1].logbook.select('nevals'), [4, 4, 4])
+
+    _, _, logbooks, _ = optimisation().run(
+        max_ngen=10, callbacks=[callbacks.MaxNGen(2)])
+    for logbook in logbooks:
+        nt.assert_equal(logbook.select('gen'), [1, 2])
+
+    # Every individual reaches an infinite target
+    _, _, logbooks, _ = optimisation().run(
+        max_ngen=10, callbacks=[callbacks.TargetFitness(float('inf'))])
+    for logbook in logbooks:
+        nt.assert_equal(logbook.select('gen'), [1])
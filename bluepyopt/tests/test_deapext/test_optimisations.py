@@ -1,5 +1,10 @@
 """bluepyopt.optimisations tests"""
 
+import copy
+import shutil
+import tempfile
+import multiprocessing
+
 import nose.tools as nt
 
 import bluepyopt.optimisations
@@ -60,6 +65,87 @@ def test_DEAPOptimisation_run():
     nt.assert_almost_equal(hist.genealogy_history[1], ind)
 
 
+@attr('unit')
+def test_DEAPOptimisation_run_evaluator_broadcast():
+    "deapext.optimisation: Testing DEAPOptimisation run with broadcast"
+
+    optimisation = bluepyopt.optimisations.DEAPOptimisation(
+        examples.simplecell.cell_evaluator,
+        offspring_size=1,
+        evaluator_broadcast=True)
+
+    nt.assert_is_instance(
+        optimisation.toolbox.evaluate.func,
+        bluepyopt.registry.RegisteredEvaluation)
+
+    pop, hof, log, hist = optimisation.run(max_ngen=1)
+
+    ind = [0.06007731830843009, 0.06508319290092013]
+    nt.assert_equal(len(pop), 1)
+    nt.assert_almost_equal(pop[0], ind)
+    nt.assert_equal(log[0]['nevals'], 1)
+
+
+@attr('unit')
+def test_DEAPOptimisation_run_evaluator_broadcast_pool():
+    "deapext.optimisation: Testing broadcast with a multiprocessing map"
+
+    # The protocols can't run in child processes of the pool workers
+    evaluator = copy.deepcopy(examples.simplecell.cell_evaluator)
+    evaluator.isolate_protocols = False
+
+    pool = multiprocessing.Pool(1)
+    directory = tempfile.mkdtemp()
+    try:
+        nt.assert_raises(
+            ValueError,
+            bluepyopt.optimisations.DEAPOptimisation,
+            evaluator,
+            map_function=pool.map,
+            evaluator_broadcast=True)
+
+        optimisation = bluepyopt.optimisations.DEAPOptimisation(
+            evaluator,
+            offspring_size=1,
+            map_function=pool.map,
+            evaluator_broadcast=bluepyopt.registry.FileBroadcast(directory))
+
+        pop, _, log, _ = optimisation.run(max_ngen=1)
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(directory)
+
+    ind = [0.06007731830843009, 0.06508319290092013]
+    nt.assert_equal(len(pop), 1)
+    nt.assert_almost_equal(pop[0], ind)
+    nt.assert_equal(log[0]['nevals'], 1)
+
+
+@attr('unit')
+def test_DEAPOptimisation_run_executor():
+    "deapext.optimisation: Testing DEAPOptimisation run with an executor"
+
+    nt.assert_raises(
+        Exception,
+        bluepyopt.optimisations.DEAPOptimisation,
+        examples.simplecell.cell_evaluator,
+        map_function=map,
+        executor=bluepyopt.executors.SerialExecutor())
+
+    optimisation = bluepyopt.optimisations.DEAPOptimisation(
+        examples.simplecell.cell_evaluator,
+        offspring_size=1,
+        executor=bluepyopt.executors.SerialExecutor())
+
+    pop, hof, log, hist = optimisation.run(max_ngen=1)
+
+    ind = [0.06007731830843009, 0.06508319290092013]
+    nt.assert_equal(len(pop), 1)
+    nt.assert_almost_equal(pop[0], ind)
+    nt.assert_equal(log[0]['nevals'], 1)
+
+
 @attr('unit')
 def test_selectorname():
     "deapext.optimisation: Testing selector_name argument"
@@ -84,3 +170,245 @@ def test_selectorname():
     nt.assert_equal(
         ibea_optimisation.toolbox.select.func,
         bluepyopt.deapext.tools.selIBEA)
+
+
+@attr('unit')
+def test_wave_offspring_size():
+    "deapext.optimisation: Testing wave_offspring_size"
+
+    from bluepyopt.deapext.optimisations import wave_offspring_size
+
+    nt.assert_equal(wave_offspring_size(100, 32), 96)
+    nt.assert_equal(wave_offspring_size(100, 40), 120)
+    nt.assert_equal(wave_offspring_size(10, 32), 32)
+    nt.assert_equal(wave_offspring_size(100, 40, bounds=(None, 110)), 80)
+    nt.assert_equal(wave_offspring_size(100, 32, bounds=(97, None)), 128)
+    nt.assert_equal(wave_offspring_size(100, 64, bounds=(90, 120)), 100)
+    nt.assert_raises(ValueError, wave_offspring_size, 10, 4, (20, 10))
+
+
+@attr('unit')
+def test_DEAPOptimisation_run_fill_worker_waves():
+    "deapext.optimisation: Testing DEAPOptimisation fill_worker_waves"
+
+    class ThreeWorkers(bluepyopt.executors.SerialExecutor):
+
+        """Serial executor pretending to have three workers"""
+
+        @property
+        def n_workers(self):
+            return 3
+
+    optimisation = bluepyopt.optimisations.DEAPOptimisation(
+        examples.simplecell.cell_evaluator,
+        offspring_size=2,
+        selector_name='NSGA2',
+        executor=ThreeWorkers())
+
+    pop, hof, log, hist = optimisation.run(
+        max_ngen=2, fill_worker_waves=True)
+
+    nt.assert_equal(log[0]['nevals'], 2)
+    nt.assert_equal(log[1]['nevals'], 3)
+    nt.assert_equal(len(pop), 2 + 3)
+
+
+@attr('unit')
+def test_DEAPOptimisation_speculation():
+    "deapext.optimisation: Testing DEAPOptimisation speculation argument"
+
+    nt.assert_raises(
+        Exception,
+        bluepyopt.optimisations.DEAPOptimisation,
+        examples.simplecell.cell_evaluator,
+        speculation=True)
+
+    # Evaluations without use_params_for_seed might not be reproducible
+    nt.assert_raises(
+        Exception,
+        bluepyopt.optimisations.DEAPOptimisation,
+        examples.simplecell.cell_evaluator,
+        executor=bluepyopt.executors.SerialExecutor(),
+        speculation=True)
+
+    evaluator = copy.copy(examples.simplecell.cell_evaluator)
+    evaluator.use_params_for_seed = True
+    optimisation = bluepyopt.optimisations.DEAPOptimisation(
+        evaluator,
+        offspring_size=1,
+        executor=bluepyopt.executors.SerialExecutor(),
+        speculation=True)
+
+    nt.assert_true(isinstance(
+        optimisation.toolbox.speculation, bluepyopt.executors.Speculation))
+
+    pop, hof, log, hist = optimisation.run(max_ngen=1)
+    nt.assert_equal(len(optimisation.speculation.durations), 1)
+
+
+@attr('unit')
+def test_DEAPOptimisation_retry():
+    "deapext.optimisation: Testing DEAPOptimisation retry argument"
+
+    nt.assert_raises(
+        Exception,
+        bluepyopt.optimisations.DEAPOptimisation,
+        examples.simplecell.cell_evaluator,
+        retry=True)
+
+    optimisation = bluepyopt.optimisations.DEAPOptimisation(
+        examples.simplecell.cell_evaluator,
+        executor=bluepyopt.executors.SerialExecutor(),
+        retry=True)
+
+    nt.assert_true(isinstance(
+        optimisation.toolbox.retry, bluepyopt.executors.RetryPolicy))
+    nt.assert_equal(
+        optimisation.toolbox.max_score_objectives,
+        examples.simplecell.cell_evaluator.max_score_objectives())
+
+
+@attr('unit')
+def test_DEAPOptimisation_rng_streams():
+    "deapext.optimisation: Testing DEAPOptimisation rng_streams argument"
+
+    import random
+
+    def draining_map(func, *iterables):
+        """Map that draws from the random module, like a busy scheduler"""
+        random.random()
+        return list(map(func, *iterables))
+
+    def run(rng_streams, map_function=None):
+        """Return the parameters of the individuals of an optimisation"""
+        optimisation = bluepyopt.optimisations.DEAPOptimisation(
+            examples.simplecell.cell_evaluator,
+            offspring_size=2,
+            selector_name='NSGA2',
+            map_function=map_function,
+            rng_streams=rng_streams)
+        pop, hof, log, hist = optimisation.run(max_ngen=3)
+        return [list(ind) for ind in pop], [ind.stream for ind in pop] \
+            if rng_streams else None
+
+    # Without streams, the random numbers drawn elsewhere change the run
+    nt.assert_not_equal(run(False), run(False, draining_map))
+
+    params, streams = run(True)
+    nt.assert_equal((params, streams), run(True, draining_map))
+    for stream in streams:
+        nt.assert_equal(stream[0], 1)
+        nt.assert_true(stream[1] in (1, 2, 3))
+
+
+@attr('unit')
+def test_DEAPOptimisation_run_iter():
+    "deapext.optimisation: Testing DEAPOptimisation run_iter and callbacks"
+
+    import bluepyopt.deapext.callbacks
+
+    optimisation = bluepyopt.optimisations.DEAPOptimisation(
+        examples.simplecell.cell_evaluator,
+        offspring_size=2,
+        selector_name='NSGA2')
+
+    gens = []
+    for generation in optimisation.run_iter(max_ngen=3):
+        gens.append(generation.gen)
+        nt.assert_equal(generation.record['gen'], generation.gen)
+        nt.assert_true(generation.halloffame is optimisation.hof)
+
+        # Settings changed between generations are used for the next ones
+        generation.lambda_ = 3
+
+    nt.assert_equal(gens, [1, 2, 3])
+    nt.assert_equal(generation.logbook.select('nevals'), [2, 3, 3])
+
+    # Stopping early
+    for generation in optimisation.run_iter(max_ngen=10):
+        if generation.gen == 2:
+            break
+    nt.assert_equal(len(generation.logbook), 2)
+
+    pop, hof, log, hist = optimisation.run(
+        max_ngen=10,
+        callbacks=[bluepyopt.deapext.callbacks.MaxNGen(2)])
+    nt.assert_equal(log.select('gen'), [1, 2])
+
+
+@attr('unit')
+def test_DEAPOptimisation_set_evaluator():
+    "deapext.optimisation: Testing switching evaluator with a callback"
+
+    import bluepyopt.deapext.callbacks
+
+    evaluator = examples.simplecell.cell_evaluator
+    full_evaluator = copy.deepcopy(evaluator)
+    evaluated = []
+
+    def evaluate_with_lists(param_list, **kwargs):
+        """Count the evaluations"""
+        evaluated.append(param_list)
+        return evaluator.evaluate_with_lists(param_list, **kwargs)
+
+    full_evaluator.evaluate_with_lists = evaluate_with_lists
+
+    optimisation = bluepyopt.optimisations.DEAPOptimisation(
+        evaluator,
+        offspring_size=2,
+        selector_name='NSGA2')
+
+    switch = bluepyopt.deapext.callbacks.SwitchEvaluator(
+        optimisation, full_evaluator, after_gen=2)
+    _, hof, log, _ = optimisation.run(max_ngen=3, callbacks=[switch])
+
+    nt.assert_true(switch.switched)
+    nt.assert_true(optimisation.evaluator is full_evaluator)
+
+    # The parents are evaluated again with the new evaluator
+    nt.assert_equal(log.select('nevals'), [2, 2, 4])
+    nt.assert_equal(len(evaluated), 4)
+    evaluated_params = [list(params) for params in evaluated]
+    for ind in hof:
+        nt.assert_true(list(ind) in evaluated_params)
+
+    class OtherEvaluator(object):
+        objectives = [None] * 5
+
+    nt.assert_raises(
+        ValueError, optimisation.set_evaluator, OtherEvaluator())
+
+
+@attr('unit')
+def test_DEAPOptimisation_fidelity_ladder():
+    "deapext.optimisation: Testing optimisation with levels of fidelity"
+
+    import bluepyopt.ephys as ephys
+
+    evaluator = examples.simplecell.cell_evaluator
+    multi_evaluator = ephys.evaluators.MultiFidelityEvaluator(
+        evaluator,
+        [ephys.evaluators.FidelityLevel(
+            'coarse', dt=0.1, total_duration=150, promote_fraction=0.5)])
+
+    optimisation = bluepyopt.optimisations.DEAPOptimisation(
+        multi_evaluator,
+        offspring_size=4,
+        selector_name='NSGA2')
+    nt.assert_equal(len(optimisation.toolbox.fidelity_ladder), 1)
+
+    pop, hof, log, hist = optimisation.run(max_ngen=2)
+
+    nt.assert_true('fidelity' in log.header)
+    nt.assert_equal(log.select('fidelity')[0], [2, 2])
+    nt.assert_equal(sum(log.select('fidelity')[1]), len(pop))
+    for ind in pop:
+        nt.assert_true(ind.fidelity in (0, 1))
+    for ind in hof:
+        nt.assert_equal(ind.fidelity, 1)
+    for ind in hist.genealogy_history.values():
+        nt.assert_true(hasattr(ind, 'fidelity'))
+
+    # Without levels, the ladder is removed
+    optimisation.set_evaluator(evaluator)
+    nt.assert_false(hasattr(optimisation.toolbox, 'fidelity_ladder'))
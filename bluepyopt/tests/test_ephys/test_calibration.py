@@ -0,0 +1,131 @@
+"""bluepyopt.ephys.calibration tests"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import copy
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+
+import bluepyopt.ephys as ephys
+
+param_dicts = [
+    {'gnabar_hh': 0.12, 'gkbar_hh': 0.036},
+    {'gnabar_hh': 0.1, 'gkbar_hh': 0.02},
+    {'gnabar_hh': 0.06, 'gkbar_hh': 0.04}]
+
+
+def _simplecell_evaluator():
+    """Copy of the evaluator of the simple cell example"""
+
+    import bluepyopt.ephys.examples as examples
+
+    evaluator = copy.deepcopy(examples.simplecell.cell_evaluator)
+
+    # Other tests can leave the parameters of the example frozen
+    evaluator.cell_model.unfreeze(evaluator.param_names)
+
+    return evaluator
+
+
+@attr('unit')
+def test_integratorsettings():
+    """ephys.calibration: Test IntegratorSettings"""
+
+    settings = ephys.calibration.IntegratorSettings(dt=0.1)
+    nt.assert_false(settings.cvode_active)
+    nt.assert_equal(str(settings), 'dt=0.1')
+    nt.assert_equal(
+        dict(settings.to_dict()),
+        dict(cvode_active=False, dt=0.1, cvode_atol=None))
+
+    evaluator = _simplecell_evaluator()
+    protocol = evaluator.fitness_protocols['Step1']
+    sequence = ephys.protocols.SequenceProtocol('sequence', [protocol])
+    settings.apply(sequence)
+    nt.assert_equal(protocol.dt, 0.1)
+    nt.assert_false(protocol.cvode_active)
+
+    settings = ephys.calibration.IntegratorSettings(
+        cvode_active=True, cvode_atol=1e-4)
+    settings.apply(protocol)
+    nt.assert_equal(protocol.dt, None)
+    nt.assert_equal(protocol.cvode_atol, 1e-4)
+    nt.assert_equal(str(settings), 'cvode atol=0.0001')
+
+    nt.assert_equal(len(ephys.calibration.default_candidates()), 6)
+
+
+@attr('unit')
+def test_calibrate_protocol():
+    """ephys.calibration: Test calibrate_protocol"""
+
+    evaluator = _simplecell_evaluator()
+    protocol = evaluator.fitness_protocols['Step1']
+
+    trials = ephys.calibration.calibrate_protocol(
+        evaluator,
+        protocol,
+        param_dicts,
+        candidates=[
+            ephys.calibration.IntegratorSettings(dt=20.0),
+            ephys.calibration.IntegratorSettings(
+                cvode_active=True, cvode_atol=1e-3)])
+
+    nt.assert_equal(len(trials), 3)
+    nt.assert_equal(trials[0].settings, None)
+    nt.assert_equal(trials[0].deviation, 0.0)
+
+    # The spikes are missed with a very large time step
+    nt.assert_true(trials[1].deviation > 1.0)
+    for trial in trials:
+        nt.assert_true(trial.duration > 0)
+
+    # The protocol isn't changed
+    nt.assert_equal(protocol.dt, None)
+    nt.assert_equal(protocol.cvode_atol, None)
+
+
+@attr('unit')
+def test_calibrate_protocols():
+    """ephys.calibration: Test calibrate_protocols"""
+
+    evaluator = _simplecell_evaluator()
+    protocol = evaluator.fitness_protocols['Step1']
+    accurate = ephys.calibration.IntegratorSettings(
+        cvode_active=True, cvode_atol=1e-3)
+
+    chosen = ephys.calibration.calibrate_protocols(
+        evaluator,
+        param_dicts,
+        candidates=[
+            ephys.calibration.IntegratorSettings(dt=20.0),
+            accurate],
+        max_deviation=0.5)
+
+    nt.assert_equal(list(chosen), ['Step1'])
+    nt.assert_true(chosen['Step1'] in (None, accurate))
+    nt.assert_equal(protocol.dt, None)
+    if chosen['Step1'] is not None:
+        nt.assert_equal(protocol.cvode_atol, 1e-3)
+
+    # The evaluator uses the stored settings
+    nt.assert_equal(
+        len(evaluator.evaluate_with_lists([0.12, 0.036])), 1)
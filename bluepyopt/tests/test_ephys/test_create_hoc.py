@@ -63,6 +63,20 @@ def test_create_hoc():
     nt.ok_('endtemplate' in hoc)
 
 
+@attr('unit')
+def test_create_hoc_d_lambda():
+    """ephys.create_hoc: Test create_hoc with the d_lambda rule"""
+    mech = utils.make_mech()
+    parameters = utils.make_parameters()
+
+    hoc = create_hoc.create_hoc([mech, ], parameters, template_name='CCell')
+    nt.assert_false('geom_nseg_d_lambda(' in hoc)
+
+    hoc = create_hoc.create_hoc([mech, ], parameters, template_name='CCell',
+                                nseg_frequency=100, d_lambda=0.1)
+    nt.ok_('geom_nseg_d_lambda(100, 0.1)' in hoc)
+
+
 @attr('unit')
 def test_create_hoc_filename():
     """ephys.create_hoc: Test create_hoc template_filename"""
@@ -80,3 +94,27 @@ def test_create_hoc_filename():
     nt.ok_('begintemplate' in hoc)
     nt.ok_('endtemplate' in hoc)
     nt.ok_('Test template' in hoc)
+
+
+@attr('unit')
+def test_create_hoc_environment_cache():
+    """ephys.create_hoc: Test the cache of the jinja2 environments"""
+    mech = utils.make_mech()
+    parameters = utils.make_parameters()
+
+    hoc = create_hoc.create_hoc([mech, ], parameters, template_name='CCell')
+    environment = create_hoc._get_environment(
+        create_hoc.DEFAULT_TEMPLATE_DIR)
+    nt.assert_is(
+        create_hoc._get_environment(create_hoc.DEFAULT_TEMPLATE_DIR + '/'),
+        environment)
+    nt.assert_is(
+        environment.get_template('cell_template.jinja2'),
+        environment.get_template('cell_template.jinja2'))
+
+    nt.assert_equal(
+        create_hoc.create_hoc([mech, ], parameters, template_name='CCell',
+                              disable_banner=True),
+        create_hoc.create_hoc([mech, ], parameters, template_name='CCell',
+                              disable_banner=True))
+    nt.ok_('CCell' in hoc)
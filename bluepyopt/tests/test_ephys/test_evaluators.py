@@ -120,3 +120,277 @@ def test_CellEvaluator_evaluate():
     score_dict = evaluator.objective_dict(score)
 
     nt.assert_almost_equal(score_dict['singleton'], expected_score)
+
+
+def _make_hh_step_evaluator(sim, cvode_active=False, **kwargs):
+    """Create evaluator of a hh cell with two step protocols"""
+
+    simple_morph = ephys.morphologies.NrnFileMorphology(
+        simple_morphology_path)
+
+    somatic_loc = ephys.locations.NrnSeclistLocation('somatic', 'somatic')
+    hh_mech = ephys.mechanisms.NrnMODMechanism(
+        name='hh', suffix='hh', locations=[somatic_loc])
+
+    gkbar = ephys.parameters.NrnSectionParameter(
+        name='gkbar_hh',
+        param_name='gkbar_hh',
+        bounds=[0.01, 0.075],
+        locations=[somatic_loc])
+
+    cell_model = ephys.models.CellModel('CellModel',
+                                        morph=simple_morph,
+                                        mechs=[hh_mech],
+                                        params=[gkbar])
+
+    soma_loc = ephys.locations.NrnSeclistCompLocation(
+        name='soma_loc',
+        seclist_name='somatic',
+        sec_index=0,
+        comp_x=.5)
+
+    protocols = {}
+    objectives = []
+    for amplitude in [0.02, 0.05]:
+        name = 'step_%.2f' % amplitude
+        rec_soma = ephys.recordings.CompRecording(
+            name='%s.soma.v' % name,
+            location=soma_loc,
+            variable='v')
+        stim = ephys.stimuli.NrnSquarePulse(
+            step_amplitude=amplitude,
+            step_delay=100.0,
+            step_duration=100,
+            total_duration=200,
+            location=soma_loc)
+        protocols[name] = ephys.protocols.SweepProtocol(
+            name=name,
+            stimuli=[stim],
+            recordings=[rec_soma],
+            cvode_active=cvode_active)
+
+        for efel_feature_name in ['voltage_base', 'Spikecount']:
+            efeature = ephys.efeatures.eFELFeature(
+                name='%s.%s' % (name, efel_feature_name),
+                efel_feature_name=efel_feature_name,
+                recording_names={'': '%s.soma.v' % name},
+                stim_start=100.0,
+                stim_end=200.0,
+                exp_mean=-65,
+                exp_std=1)
+            objectives.append(ephys.objectives.SingletonObjective(
+                efeature.name, feature=efeature))
+
+    fitness_calc = ephys.objectivescalculators.ObjectivesCalculator(
+        objectives=objectives)
+
+    return ephys.evaluators.CellEvaluator(
+        cell_model=cell_model,
+        param_names=['gkbar_hh'],
+        fitness_calculator=fitness_calc,
+        fitness_protocols=protocols,
+        sim=sim,
+        isolate_protocols=False,
+        **kwargs)
+
+
+@attr('unit')
+def test_CellEvaluator_prefix_snapshots():
+    """ephys.evaluators: Test CellEvaluator with prefix snapshots"""
+    sim = ephys.simulators.NrnSimulator()
+
+    scores = []
+    for prefix_snapshots in [False, True]:
+        evaluator = _make_hh_step_evaluator(
+            sim, prefix_snapshots=prefix_snapshots)
+        scores.append(evaluator.evaluate([0.03]))
+
+    for score, snapshot_score in zip(*scores):
+        nt.assert_almost_equal(score, snapshot_score)
+
+    objectives, timings = evaluator.evaluate_with_timings([0.03])
+    nt.assert_equal(objectives, scores[1])
+    nt.assert_equal(list(timings.keys()), ['prefix_snapshots'])
+
+
+@attr('unit')
+def test_CellEvaluatorTimed_evaluate_with_timings():
+    """ephys.evaluators: Test the timings of CellEvaluatorTimed"""
+    sim = ephys.simulators.NrnSimulator()
+
+    evaluator = _make_hh_step_evaluator(sim)
+    timed_evaluator = ephys.evaluators.CellEvaluatorTimed(
+        cell_model=evaluator.cell_model,
+        param_names=evaluator.param_names,
+        fitness_calculator=evaluator.fitness_calculator,
+        fitness_protocols=evaluator.fitness_protocols,
+        sim=sim,
+        isolate_protocols=False)
+
+    objectives, timings = timed_evaluator.evaluate_with_timings([0.03])
+    nt.assert_equal(objectives, evaluator.evaluate([0.03]))
+    nt.assert_equal(sorted(timings.keys()), ['step_0.02', 'step_0.05'])
+    nt.assert_true(all(duration > 0 for duration in timings.values()))
+
+    # Every evaluation records its own timings
+    timed_evaluator.protocol_durations['old_protocol'] = 1.0
+    _, timings = timed_evaluator.evaluate_with_timings([0.03])
+    nt.assert_equal(sorted(timings.keys()), ['step_0.02', 'step_0.05'])
+
+
+@attr('unit')
+def test_CellEvaluator_evaluate_population():
+    """ephys.evaluators: Test CellEvaluator evaluate_population"""
+    # Other tests can leave a cvode minstep behind in the global state
+    sim = ephys.simulators.NrnSimulator(dt=0.025, cvode_minstep=0.0)
+
+    param_lists = [[0.02], [0.03], [0.06]]
+
+    evaluator = _make_hh_step_evaluator(sim)
+    population_scores = evaluator.evaluate_population(param_lists)
+    nt.assert_equal(len(population_scores), len(param_lists))
+    for param_list, scores in zip(param_lists, population_scores):
+        for score, population_score in zip(
+                evaluator.evaluate(param_list), scores):
+            nt.assert_almost_equal(score, population_score)
+
+    # Every cell has its own time step with cvode, spike counts are
+    # compared since the time steps differ from the ones of single runs
+    evaluator = _make_hh_step_evaluator(sim, cvode_active=True)
+    population_scores = evaluator.evaluate_population(param_lists)
+    for param_list, scores in zip(param_lists, population_scores):
+        score_dict = evaluator.objective_dict(evaluator.evaluate(param_list))
+        population_score_dict = evaluator.objective_dict(scores)
+        for name in score_dict:
+            if name.endswith('Spikecount'):
+                nt.assert_equal(score_dict[name], population_score_dict[name])
+
+
+@attr('unit')
+def test_CellEvaluator_max_score_objectives():
+    """ephys.evaluators: Test CellEvaluator max_score_objectives"""
+
+    import bluepyopt.ephys.examples as examples
+
+    evaluator = examples.simplecell.cell_evaluator
+
+    nt.assert_equal(
+        evaluator.max_score_objectives(),
+        [250.0] * len(evaluator.fitness_calculator.objectives))
+
+
+@attr('unit')
+def test_CellEvaluator_stream_globalindex():
+    """ephys.evaluators: Test CellEvaluator stream_globalindex"""
+
+    import bluepyopt.tools
+
+    class Individual(list):
+        """Parameter list with a random stream"""
+        stream = (1, 2, 3)
+
+    nt.assert_equal(
+        ephys.evaluators.CellEvaluator.stream_globalindex(Individual([0.1])),
+        bluepyopt.tools.stream_seed(1, 2, 3))
+    nt.assert_equal(
+        ephys.evaluators.CellEvaluator.stream_globalindex([0.1]), None)
+
+
+@attr('unit')
+def test_CellEvaluatorTimed_stream_globalindex():
+    """ephys.evaluators: Test the Random123 streams of CellEvaluatorTimed"""
+
+    import bluepyopt.tools
+
+    class Individual(list):
+        """Parameter list with a random stream"""
+        stream = (1, 2, 3)
+
+    class GlobalIndexProtocol(ephys.protocols.Protocol):
+        """Protocol recording the Random123 global index of its runs"""
+
+        def __init__(self):
+            super(GlobalIndexProtocol, self).__init__(name='global_index')
+            self.global_indices = []
+
+        def run(self, cell_model, param_values, sim=None, isolate=None):
+            self.global_indices.append(sim.random123_globalindex)
+            return {}
+
+    global_indices = []
+    for evaluator_class in [ephys.evaluators.CellEvaluator,
+                            ephys.evaluators.CellEvaluatorTimed]:
+        protocol = GlobalIndexProtocol()
+        evaluator = evaluator_class(
+            cell_model=ephys.models.CellModel('test_model', params=[]),
+            param_names=[],
+            fitness_protocols={protocol.name: protocol},
+            fitness_calculator=ephys.objectivescalculators.
+            ObjectivesCalculator(objectives=[]),
+            sim=ephys.simulators.NrnSimulator())
+        evaluator.evaluate_with_lists(Individual([]))
+        global_indices.append(protocol.global_indices)
+
+    nt.assert_equal(
+        global_indices, [[bluepyopt.tools.stream_seed(1, 2, 3)]] * 2)
+
+    # The global index of the simulator is restored after the run
+    evaluator.evaluate_with_lists([])
+    nt.assert_equal(
+        protocol.global_indices,
+        [bluepyopt.tools.stream_seed(1, 2, 3), None])
+    nt.assert_equal(evaluator.sim.random123_globalindex, None)
+
+    # MultiFidelityEvaluator passes the global index to the full evaluation
+    multi_evaluator = ephys.evaluators.MultiFidelityEvaluator(
+        evaluator=evaluator, fidelity_levels=[])
+    multi_evaluator.evaluate_with_dicts({}, random123_globalindex=5)
+    nt.assert_equal(protocol.global_indices[-1], 5)
+
+
+@attr('unit')
+def test_MultiFidelityEvaluator():
+    """ephys.evaluators: Test MultiFidelityEvaluator"""
+    sim = ephys.simulators.NrnSimulator(dt=0.025, cvode_minstep=0.0)
+
+    evaluator = _make_hh_step_evaluator(sim, cvode_active=True)
+    fidelity = ephys.evaluators.FidelityLevel(
+        'coarse',
+        dt=0.1,
+        total_duration=150,
+        protocol_names=['step_0.02'],
+        promote_fraction=0.25)
+    multi_evaluator = ephys.evaluators.MultiFidelityEvaluator(
+        evaluator, [fidelity])
+
+    nt.assert_equal(multi_evaluator.objectives, evaluator.objectives)
+    nt.assert_equal(multi_evaluator.params, evaluator.params)
+    nt.assert_true('coarse' in str(multi_evaluator))
+
+    # The protocols of the level are changed copies
+    level_evaluator = multi_evaluator.level_evaluator(0)
+    nt.assert_equal(list(level_evaluator.fitness_protocols), ['step_0.02'])
+    protocol = level_evaluator.fitness_protocols['step_0.02']
+    nt.assert_false(protocol.cvode_active)
+    nt.assert_equal(protocol.total_duration, 150)
+    nt.assert_true(evaluator.fitness_protocols['step_0.02'].cvode_active)
+    nt.assert_equal(
+        evaluator.fitness_protocols['step_0.02'].total_duration, 200)
+    nt.assert_equal(protocol.dt, 0.1)
+    nt.assert_equal(evaluator.fitness_protocols['step_0.02'].dt, None)
+
+    # The features of the skipped protocols get their max_score
+    coarse_scores = evaluator.objective_dict(
+        multi_evaluator.evaluate_at_fidelity(0, [0.03]))
+    nt.assert_equal(coarse_scores['step_0.05.Spikecount'], 250.0)
+    nt.assert_equal(coarse_scores['step_0.05.voltage_base'], 250.0)
+    nt.assert_true(coarse_scores['step_0.02.voltage_base'] < 250.0)
+    nt.assert_equal(sim.neuron.h.dt, 0.025)
+
+    # The last level is the full evaluation
+    scores = evaluator.evaluate([0.03])
+    nt.assert_equal(multi_evaluator.evaluate_at_fidelity(1, [0.03]), scores)
+    nt.assert_equal(multi_evaluator.evaluate_with_lists([0.03]), scores)
+    nt.assert_equal(
+        multi_evaluator.max_score_objectives(),
+        evaluator.max_score_objectives())
@@ -1,8 +1,14 @@
 """Test ephys model objects"""
 
 import os
+import copy
+import json
+import shutil
+import tarfile
+import zipfile
 import tempfile
 import contextlib
+import multiprocessing.pool
 
 import nose.tools as nt
 from nose.plugins.attrib import attr
@@ -93,6 +99,44 @@ def test_load_hoc_template():
     nt.ok_(hasattr(sim.neuron.h, template_name))
 
 
+@attr('unit')
+def test_template_caches():
+    """ephys.models: Test the caches of the hoc templates"""
+
+    template_name = 'test_template_caches'
+    hoc_string = ephys.models.CellModel.create_empty_template(
+        template_name, seclist_names=['somatic'])
+    nt.assert_is(
+        ephys.models.CellModel.create_empty_template(
+            template_name, seclist_names=['somatic']),
+        hoc_string)
+    nt.assert_is_not(
+        ephys.models.CellModel.create_empty_template(template_name),
+        hoc_string)
+
+    nt.assert_equal(
+        ephys.models.HocCellModel.get_template_name(hoc_string),
+        template_name)
+    nt.assert_equal(
+        ephys.models._template_names[hoc_string], template_name)
+
+    ephys.models.HocCellModel.load_hoc_template(sim, hoc_string)
+    nt.assert_equal(
+        ephys.models._defined_templates[template_name], hoc_string)
+
+    # A template can't be defined again with other code
+    other_hoc_string = ephys.models.CellModel.create_empty_template(
+        template_name, seclist_names=['basal'])
+    nt.assert_raises(
+        ValueError,
+        ephys.models.HocCellModel.load_hoc_template,
+        sim,
+        other_hoc_string)
+    nt.assert_equal(
+        ephys.models._defined_templates[template_name], hoc_string)
+    nt.assert_true(hasattr(sim.neuron.h, template_name))
+
+
 @attr('unit')
 def test_HocCellModel():
     """ephys.models: Test HOCCellModel class"""
@@ -148,6 +192,198 @@ def test_CellModel_create_hoc():
     nt.assert_true(isinstance(cell_model_hoc, ephys.models.HocCellModel))
 
 
+def _population_model(name):
+    """Model with section and range parameters for the hoc export"""
+
+    all_loc = ephys.locations.NrnSeclistLocation('all', seclist_name='all')
+    scaler = ephys.parameterscalers.NrnSegmentSomaDistanceScaler(
+        distribution='(1 + {distance} / 100) * {value}')
+
+    return ephys.models.CellModel(
+        name,
+        morph=ephys.morphologies.NrnFileMorphology(apic_morphology_path),
+        mechs=[ephys.mechanisms.NrnMODMechanism(
+            'pas', suffix='pas', locations=[all_loc])],
+        params=[
+            ephys.parameters.NrnSectionParameter(
+                'cm', param_name='cm', bounds=[0.5, 2.0],
+                locations=[all_loc]),
+            ephys.parameters.NrnRangeParameter(
+                'g_pas', param_name='g_pas', bounds=[1e-5, 1e-3],
+                value_scaler=scaler, locations=[all_loc])])
+
+
+@attr('unit')
+def test_CellModel_write_hocs():
+    """ephys.models: Test write_hocs"""
+
+    cell_model = _population_model('CellModel_write_hocs')
+    param_values_list = [{'cm': 1.0, 'g_pas': 1e-4},
+                         {'cm': 2.0, 'g_pas': 3e-4},
+                         {'cm': 0.5, 'g_pas': 5e-4}]
+
+    output_dir = tempfile.mkdtemp()
+    try:
+        shared_dir = os.path.join(output_dir, 'shared')
+        thread_pool = multiprocessing.pool.ThreadPool(2)
+        filenames = cell_model.write_hocs(
+            param_values_list, shared_dir, map_function=thread_pool.map,
+            chunk_size=2)
+        thread_pool.close()
+        nt.assert_equal(filenames, [
+            'CellModel_write_hocs_shared.hoc',
+            'CellModel_write_hocs_0.hoc',
+            'CellModel_write_hocs_1.hoc',
+            'CellModel_write_hocs_2.hoc',
+            'CellModel_write_hocs_parameters.json'])
+        with open(os.path.join(
+                shared_dir, 'CellModel_write_hocs_parameters.json')) as fd:
+            nt.assert_equal(
+                json.load(fd)['CellModel_write_hocs_1'],
+                param_values_list[1])
+
+        # The model isn't changed
+        for param in cell_model.params.values():
+            nt.assert_false(param.frozen)
+
+        standalone_dir = os.path.join(output_dir, 'standalone')
+        cell_model.write_hocs(
+            param_values_list, standalone_dir, shared=False,
+            template_names=['CellModel_write_hocs_standalone_%d' % index
+                            for index in range(3)])
+
+        # The templates load the shared file from their directory
+        for index in range(3):
+            sim.neuron.h.load_file(os.path.join(
+                shared_dir, 'CellModel_write_hocs_%d.hoc' % index))
+            sim.neuron.h.load_file(os.path.join(
+                standalone_dir,
+                'CellModel_write_hocs_standalone_%d.hoc' % index))
+
+        morphology_dir, morphology_name = os.path.split(apic_morphology_path)
+        for index, param_values in enumerate(param_values_list):
+            shared_cell = getattr(
+                sim.neuron.h, 'CellModel_write_hocs_%d' % index)(
+                    morphology_dir, morphology_name)
+            standalone_cell = getattr(
+                sim.neuron.h, 'CellModel_write_hocs_standalone_%d' % index)(
+                    morphology_dir, morphology_name)
+
+            sections = list(shared_cell.all)
+            nt.assert_equal(len(sections), len(list(standalone_cell.all)))
+            for section, standalone_section in zip(
+                    sections, standalone_cell.all):
+                nt.assert_equal(section.cm, param_values['cm'])
+                for segment, standalone_segment in zip(
+                        section, standalone_section):
+                    nt.assert_equal(
+                        segment.g_pas, standalone_segment.g_pas)
+            nt.assert_true(
+                sections[-1](0.5).g_pas > param_values['g_pas'])
+
+            # Break the reference cycles, so that the cells are deleted
+            sim.neuron.h.execute('objref CellRef', shared_cell)
+            sim.neuron.h.execute('objref CellRef', standalone_cell)
+
+        archives = {'zip': None, 'tar.gz': None}
+        for extension in archives:
+            archive_path = os.path.join(
+                output_dir, 'population.%s' % extension)
+            filenames = cell_model.write_hocs(
+                param_values_list, archive_path, disable_banner=True)
+            if extension == 'zip':
+                with zipfile.ZipFile(archive_path) as archive:
+                    nt.assert_equal(archive.namelist(), filenames)
+                    archives[extension] = archive.read(
+                        'CellModel_write_hocs_0.hoc').decode()
+            else:
+                with tarfile.open(archive_path) as archive:
+                    nt.assert_equal(archive.getnames(), filenames)
+                    archives[extension] = archive.extractfile(
+                        'CellModel_write_hocs_0.hoc').read().decode()
+        nt.assert_equal(archives['zip'], archives['tar.gz'])
+        nt.assert_true(
+            'load_file("CellModel_write_hocs_shared.hoc")' in archives['zip'])
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def _cell_state(cell_model, param_values):
+    """Geometry and parameters of the segments of an instantiated model"""
+
+    cell_model.freeze(param_values)
+    cell_model.instantiate(sim=sim)
+    icell = cell_model.icell
+    sections = [
+        (section.name().split('.')[-1], section.nseg, section.L,
+         str(section.parentseg()),
+         [(segment.diam, segment.cm, segment.g_pas) for segment in section])
+        for section in icell.all]
+    seclists = [[section.name().split('.')[-1]
+                 for section in getattr(icell, seclist_name)]
+                for seclist_name in cell_model.seclist_names]
+    cell_model.destroy(sim=sim)
+    cell_model.unfreeze(param_values.keys())
+
+    return sections, seclists
+
+
+@attr('unit')
+def test_CellModel_builder():
+    """ephys.models: Test the python builder"""
+
+    nt.assert_raises(
+        ValueError, ephys.models.CellModel, 'CellModel_builder',
+        builder='unknown')
+
+    hoc_model = _population_model('CellModel_builder')
+    python_model = _population_model('CellModel_builder')
+    python_model.builder = 'python'
+
+    for param_values in [{'cm': 1.0, 'g_pas': 1e-4},
+                         {'cm': 2.0, 'g_pas': 3e-4}]:
+        nt.assert_equal(
+            _cell_state(python_model, param_values),
+            _cell_state(hoc_model, param_values))
+    nt.assert_true(python_model.morphology._topology is not None)
+
+    # The topology is copied without its NEURON vectors
+    copied_model = copy.deepcopy(python_model)
+    nt.assert_equal(
+        _cell_state(copied_model, {'cm': 0.5, 'g_pas': 5e-4}),
+        _cell_state(hoc_model, {'cm': 0.5, 'g_pas': 5e-4}))
+
+
+@attr('unit')
+def test_CellModel_load_topology():
+    """ephys.models: Test the topology of isolated protocol runs"""
+
+    cell_model = _population_model('CellModel_load_topology')
+    cell_model.builder = 'python'
+    soma_loc = ephys.locations.NrnSeclistCompLocation(
+        name='soma_loc', seclist_name='somatic', sec_index=0, comp_x=0.5)
+    protocol = ephys.protocols.SweepProtocol(
+        'step',
+        stimuli=[ephys.stimuli.NrnSquarePulse(
+            step_amplitude=0.1, step_delay=10, step_duration=20,
+            location=soma_loc, total_duration=50)],
+        recordings=[ephys.recordings.CompRecording(
+            name='step.soma.v', location=soma_loc, variable='v')])
+    param_values = {'cm': 1.0, 'g_pas': 1e-4}
+
+    responses = protocol.run(cell_model, param_values, sim=sim)
+    topology = cell_model.morphology.topology
+    nt.assert_true(topology is not None)
+
+    # The next isolated processes don't read the morphology file
+    cell_model.morphology.morphology_path = 'not_a_morphology.swc'
+    cached_responses = protocol.run(cell_model, param_values, sim=sim)
+    nt.assert_is(cell_model.morphology.topology, topology)
+    nt.assert_equal(
+        list(cached_responses['step.soma.v']['voltage']),
+        list(responses['step.soma.v']['voltage']))
+
+
 @attr('unit')
 def test_CellModel_destroy():
     """ephys.models: Test CellModel destroy"""
@@ -2,6 +2,7 @@
 
 import json
 import os
+import pickle
 
 
 import nose.tools as nt
@@ -18,6 +19,10 @@ testdata_dir = os.path.join(
 simpleswc_morphpath = os.path.join(testdata_dir, 'simple.swc')
 simpleswc_ax1_morphpath = os.path.join(testdata_dir, 'simple_ax1.swc')
 simpleswc_ax2_morphpath = os.path.join(testdata_dir, 'simple_ax2.asc')
+apicswc_morphpath = os.path.join(testdata_dir, 'apic.swc')
+l5pc_morphpath = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '../../../examples/l5pc/morphology/C060114A7.asc')
 simplewrong_morphpath = os.path.join(testdata_dir, 'simple.wrong')
 
 
@@ -133,3 +138,240 @@ def test_serialize():
     deserialized = instantiator(serialized)
     nt.ok_(isinstance(deserialized, ephys.morphologies.NrnFileMorphology))
     nt.eq_(deserialized.morphology_path, simpleswc_morphpath)
+
+
+class _CountedPointProcessMechanism(
+        ephys.mechanisms.NrnMODPointProcessMechanism):
+
+    """Point process mechanism that counts its instantiations"""
+
+    instantiated = 0
+
+    def instantiate(self, sim=None, icell=None):
+        super(_CountedPointProcessMechanism, self).instantiate(
+            sim=sim, icell=icell)
+        self.instantiated += 1
+
+    def destroy(self, sim=None):
+        super(_CountedPointProcessMechanism, self).destroy(sim=sim)
+        self.instantiated -= 1
+
+
+@attr('unit')
+def test_nrnfilemorphology_d_lambda():
+    """ephys.morphology: testing d_lambda nseg after the parameters"""
+
+    sim = ephys.simulators.NrnSimulator()
+    sim.neuron.h.load_file('fixnseg.hoc')
+
+    morph = ephys.morphologies.NrnFileMorphology(
+        apicswc_morphpath, nseg_frequency=100, d_lambda=0.001)
+    all_loc = ephys.locations.NrnSeclistLocation('all', seclist_name='all')
+    ra = ephys.parameters.NrnSectionParameter(
+        name='Ra', param_name='Ra', locations=[all_loc], bounds=[1, 1000])
+    cm = ephys.parameters.NrnRangeParameter(
+        name='cm', param_name='cm', locations=[all_loc], frozen=True,
+        value=1.0,
+        value_scaler=ephys.parameterscalers.NrnSegmentLinearScaler())
+    soma_loc = ephys.locations.NrnSeclistCompLocation(
+        name='soma_loc', seclist_name='somatic', sec_index=0, comp_x=0.5)
+    expsyn = _CountedPointProcessMechanism(
+        name='expsyn', suffix='ExpSyn', locations=[soma_loc])
+    cell = ephys.models.CellModel(
+        name='cell_d_lambda', morph=morph, mechs=[expsyn], params=[ra, cm])
+
+    cell.freeze({'Ra': 100.0})
+    cell.instantiate(sim=sim)
+    sections = list(cell.icell.all)
+    # The point processes of the old segments are destroyed
+    nt.assert_equal(expsyn.instantiated, 1)
+    nt.assert_equal(sim.neuron.h.List('ExpSyn').count(), 1)
+    for section in sections:
+        nt.assert_almost_equal(
+            morph.lambda_f(section, 100),
+            sim.neuron.h.lambda_f(100, sec=section))
+        nt.assert_equal(section.nseg, morph.d_lambda_nseg(section))
+        nt.assert_equal(section.nseg % 2, 1)
+        nt.assert_true(all(segment.cm == 1.0 for segment in section))
+    nsegs = [section.nseg for section in sections]
+    nt.assert_true(max(nsegs) > 1)
+    nt.assert_equal(len(morph._nseg_cache), 1)
+
+    # A new instantiation starts from the cached discretisation
+    cell.destroy(sim=sim)
+    cell.instantiate(sim=sim)
+    nt.assert_false(morph.update_nseg(sim=sim, icell=cell.icell))
+    nt.assert_equal([section.nseg for section in cell.icell.all], nsegs)
+    cell.destroy(sim=sim)
+    cell.unfreeze(['Ra'])
+
+    # A larger Ra makes lambda shorter
+    cell.freeze({'Ra': 400.0})
+    cell.instantiate(sim=sim)
+    nt.assert_equal(len(morph._nseg_cache), 2)
+    new_nsegs = [section.nseg for section in cell.icell.all]
+    nt.assert_true(all(new >= old for new, old in zip(new_nsegs, nsegs)))
+    nt.assert_true(sum(new_nsegs) > sum(nsegs))
+    cell.destroy(sim=sim)
+
+    # The exported hoc template applies the same rule after biophys()
+    hoc_string = ephys.models.CellModel(
+        name='cell_d_lambda_hoc', morph=morph, mechs=[], params=[ra, cm]
+    ).create_hoc({'Ra': 400.0})
+    hoc_cell = ephys.models.HocCellModel(
+        'cell_d_lambda_hoc', apicswc_morphpath, hoc_string=hoc_string)
+    hoc_cell.instantiate(sim=sim)
+    nt.assert_equal(
+        [section.nseg for section in hoc_cell.icell.all], new_nsegs)
+    hoc_cell.destroy(sim=sim)
+
+
+def _area_profile(sim, icell, seclist_name, bin_length=100.0):
+    """Membrane area per bin of soma distance"""
+
+    sim.neuron.h.distance(0, 0.5, sec=icell.soma[0])
+    areas = {}
+    for section in getattr(icell, seclist_name):
+        section.nseg = 1 + 2 * int(section.L / 5.0)
+        for segment in section:
+            distance = sim.neuron.h.distance(1, segment.x, sec=section)
+            index = int(distance / bin_length)
+            areas[index] = areas.get(index, 0.0) + segment.area()
+
+    return areas
+
+
+@attr('unit')
+def test_nrnfilemorphology_reduce():
+    """ephys.morphology: testing morphology reduction"""
+
+    sim = ephys.simulators.NrnSimulator()
+
+    cells = {}
+    for collapse_distance in [None, 50.0]:
+        morph = ephys.morphologies.NrnFileMorphology(
+            l5pc_morphpath,
+            do_replace_axon=True,
+            collapse_distance=collapse_distance)
+        cell = ephys.models.CellModel(
+            name='cell_reduce_%d' % len(cells),
+            morph=morph, mechs=[], params=[])
+        cell.instantiate(sim=sim)
+        cells[collapse_distance] = cell
+
+    full, reduced = cells[None].icell, cells[50.0].icell
+
+    nt.assert_equal(len(list(reduced.somatic)), len(list(full.somatic)))
+    nt.assert_equal(len(list(reduced.axonal)), len(list(full.axonal)))
+    for seclist_name in ['basal', 'apical']:
+        nt.assert_true(
+            len(list(getattr(reduced, seclist_name))) <
+            len(list(getattr(full, seclist_name))))
+
+        # The membrane area at every soma distance is preserved, up to the
+        # interpolation of the diameters between the bins
+        full_areas = _area_profile(sim, full, seclist_name)
+        reduced_areas = _area_profile(sim, reduced, seclist_name)
+        nt.assert_equal(sorted(full_areas), sorted(reduced_areas))
+        for index, area in full_areas.items():
+            nt.assert_true(
+                abs(reduced_areas[index] - area) < 0.05 * area + 10.0)
+
+    # Nothing is collapsed within the collapse distance
+    sim.neuron.h.distance(0, 0.5, sec=reduced.soma[0])
+    for section in reduced.apical:
+        if sim.neuron.h.distance(1, 0.0, sec=section) < 50.0:
+            nt.assert_true(len(section.children()) != 1)
+
+    for cell in cells.values():
+        cell.destroy(sim=sim)
+
+
+@attr('unit')
+def test_nrnfilemorphology_merge_chains():
+    """ephys.morphology: testing the merge of the section chains"""
+
+    sim = ephys.simulators.NrnSimulator()
+
+    def _section(name, points):
+        """Section with 3d points"""
+        section = sim.neuron.h.Section(name=name)
+        for x, y in points:
+            sim.neuron.h.pt3dadd(x, y, 0.0, 1.0, sec=section)
+        return section
+
+    # The first point of the child is the last point of the parent
+    joined = _section('merge_joined', [(0, 0), (10, 0)])
+    joined_child = _section('merge_joined_child', [(10, 0), (20, 0)])
+    joined_child.connect(joined(1), 0)
+
+    # The child starts elsewhere, and has children
+    apart = _section('merge_apart', [(0, 0), (10, 0)])
+    apart_child = _section('merge_apart_child', [(10, 5), (20, 5)])
+    apart_child.connect(apart(1), 0)
+    grandchildren = [_section('merge_apart_grandchild_%d' % index,
+                              [(15, 5), (15, 10)]) for index in range(2)]
+    grandchildren[0].connect(apart_child(0.5), 0)
+    grandchildren[1].connect(apart_child(1), 0)
+
+    class Cell(object):
+        """Section list of the sections"""
+        basal = sim.neuron.h.SectionList()
+
+    for section in [joined, joined_child, apart, apart_child] + grandchildren:
+        Cell.basal.append(sec=section)
+
+    ephys.morphologies.NrnFileMorphology.merge_chains(
+        sim=sim, icell=Cell, seclist_names=['basal'])
+
+    nt.assert_equal(joined.n3d(), 3)
+    nt.assert_almost_equal(joined.L, 20)
+    nt.assert_equal(apart.n3d(), 4)
+    nt.assert_almost_equal(apart.L, 25)
+    nt.assert_equal(
+        [grandchild.parentseg().sec.name() for grandchild in grandchildren],
+        ['merge_apart', 'merge_apart'])
+    nt.assert_almost_equal(grandchildren[0].parentseg().x, 0.8)
+    nt.assert_almost_equal(grandchildren[1].parentseg().x, 1.0)
+
+
+@attr('unit')
+def test_nrnfilemorphology_topology():
+    """ephys.morphology: testing the sections created from a topology"""
+
+    sim = ephys.simulators.NrnSimulator()
+
+    morph = ephys.morphologies.NrnFileMorphology(
+        l5pc_morphpath, do_replace_axon=True, collapse_distance=50.0)
+    cell = ephys.models.CellModel(
+        name='cell_topology', morph=morph, mechs=[], params=[])
+
+    def sections(icell):
+        """Geometry of the sections of a cell"""
+        return [
+            (section.name().split('.')[-1], section.nseg, section.L,
+             section.n3d(), str(section.parentseg()).split('.')[-1],
+             [segment.diam for segment in section])
+            for section in icell.all]
+
+    cell.instantiate(sim=sim)
+    reference = sections(cell.icell)
+    cell.destroy(sim=sim)
+
+    # Imported the first time, created from the topology the next times
+    cell.builder = 'python'
+    for _ in range(2):
+        cell.instantiate(sim=sim)
+        nt.assert_equal(sections(cell.icell), reference)
+        nt.assert_equal(
+            len(list(cell.icell.apical)),
+            len(morph._topology.seclists['apical']))
+        cell.destroy(sim=sim)
+
+    topology = pickle.loads(pickle.dumps(morph._topology))
+    icell = cell.create_empty_cell(
+        'cell_topology', sim=sim, seclist_names=cell.seclist_names,
+        secarray_names=cell.secarray_names)
+    topology.instantiate(sim=sim, icell=icell)
+    nt.assert_equal(sections(icell), reference)
+    icell.destroy()
@@ -1,6 +1,7 @@
 """Test ephys.parameterscalers"""
 
 import json
+import math  # NOQA
 
 import nose.tools as nt
 from nose.plugins.attrib import attr
@@ -36,6 +37,38 @@ def test_NrnSegmentSomaDistanceScaler_dist_params():
                     '(-0.9 + 2 * math.exp(1 * 0.003) * 1')
 
 
+@attr('unit')
+def test_scale_distances():
+    """ephys.parameterscalers: scale_distances of the scalers"""
+
+    distances = [0.0, 12.5, 1000.0 / 3]
+
+    scaler = NrnSegmentLinearScaler(multiplier=2.0, offset=1.0)
+    nt.assert_equal(scaler.scale_distances(3.0, distances), [7.0] * 3)
+
+    scaler = NrnSegmentSomaDistanceScaler(
+        distribution='{value} ** 2 * math.exp({distance} * {C})',
+        dist_param_names=['C'])
+    scaler.C = -0.003
+    # The distribution is evaluated as a string for negative values
+    for value in [0.5, -0.5]:
+        nt.assert_equal(
+            scaler.scale_distances(value, distances),
+            [eval(scaler.eval_dist(value, distance))  # pylint: disable=W0123
+             for distance in distances])
+    nt.assert_equal(scaler.scale_distances(-0.5, [0.0]), [-0.25])
+
+    # A single function is compiled for all the values
+    n_functions = len(ephys.parameterscalers._distance_functions)
+    for value in [0.1, 0.2, 0.3]:
+        nt.assert_equal(
+            scaler.scale_distances(value, distances),
+            [eval(scaler.eval_dist(value, distance))  # pylint: disable=W0123
+             for distance in distances])
+    nt.assert_equal(
+        len(ephys.parameterscalers._distance_functions), n_functions)
+
+
 @attr('unit')
 def test_serialize():
     """ephys.parameterscalers: test serialization"""
@@ -366,6 +366,72 @@ def test_sweepprotocol_run_unisolated():
     dummy_cell.destroy(sim=nrn_sim)
 
 
+@attr('unit')
+def test_sweepprotocol_integrator_settings():
+    """ephys.protocols: Test SweepProtocol with its own time step"""
+
+    nt.assert_raises(
+        ValueError,
+        ephys.protocols.SweepProtocol,
+        name='prot',
+        cvode_active=True,
+        dt=0.1)
+
+    nrn_sim = ephys.simulators.NrnSimulator(dt=0.025, cvode_active=True)
+    dummy_cell = testmodels.dummycells.DummyCellModel1()
+    soma_loc = ephys.locations.NrnSeclistCompLocation(
+        name='soma_loc',
+        seclist_name='somatic',
+        sec_index=0,
+        comp_x=.5)
+    rec_soma = ephys.recordings.CompRecording(
+        name='soma.v',
+        location=soma_loc,
+        variable='v')
+    stim = ephys.stimuli.NrnSquarePulse(
+        step_amplitude=0.1,
+        step_delay=5.0,
+        step_duration=10,
+        total_duration=20,
+        location=soma_loc)
+
+    protocol = ephys.protocols.SweepProtocol(
+        name='prot',
+        stimuli=[stim],
+        recordings=[rec_soma],
+        dt=0.1)
+    nt.assert_equal(
+        protocol.integrator_settings(),
+        dict(cvode_active=False, dt=0.1))
+
+    responses = protocol.run(
+        cell_model=dummy_cell,
+        param_values={},
+        sim=nrn_sim,
+        isolate=False)
+
+    times = responses['soma.v']['time']
+    nt.assert_almost_equal(times[1] - times[0], 0.1)
+    nt.assert_equal(len(times), 201)
+
+    # The settings of the simulator are restored after the run
+    nt.assert_equal(nrn_sim.neuron.h.dt, 0.025)
+
+    protocol = ephys.protocols.SweepProtocol(
+        name='prot',
+        stimuli=[stim],
+        recordings=[rec_soma],
+        cvode_active=True,
+        cvode_atol=1e-4)
+    old_atol = nrn_sim.cvode.atol()
+    protocol.run(
+        cell_model=dummy_cell,
+        param_values={},
+        sim=nrn_sim,
+        isolate=False)
+    nt.assert_equal(nrn_sim.cvode.atol(), old_atol)
+
+
 @attr('unit')
 def test_nrnsimulator_exception():
     """ephys.protocols: test if protocol raise nrn sim exception"""
@@ -417,3 +483,184 @@ def test_nrnsimulator_exception():
 
     protocol.destroy(sim=nrn_sim)
     dummy_cell.destroy(sim=nrn_sim)
+
+
+def _make_hh_cell_model(name):
+    """Create a hh soma cell model"""
+
+    import os
+    morph = ephys.morphologies.NrnFileMorphology(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     'testdata', 'simple.swc'))
+    somatic_loc = ephys.locations.NrnSeclistLocation(
+        'somatic', seclist_name='somatic')
+    hh_mech = ephys.mechanisms.NrnMODMechanism(
+        name='hh', suffix='hh', locations=[somatic_loc])
+
+    return ephys.models.CellModel(name=name, morph=morph, mechs=[hh_mech])
+
+
+def _make_step_protocols(cvode_active):
+    """Create step protocols with same holding current"""
+
+    soma_loc = ephys.locations.NrnSeclistCompLocation(
+        name='soma_loc',
+        seclist_name='somatic',
+        sec_index=0,
+        comp_x=.5)
+
+    step_protocols = []
+    for index, amplitude in enumerate([0.01, 0.05, 0.1]):
+        rec_soma = ephys.recordings.CompRecording(
+            name='step%d.soma.v' % index,
+            location=soma_loc,
+            variable='v')
+
+        step_stim = ephys.stimuli.NrnSquarePulse(
+            step_amplitude=amplitude,
+            step_delay=100.0 + 10 * index,
+            step_duration=50,
+            total_duration=200,
+            location=soma_loc)
+        hold_stim = ephys.stimuli.NrnSquarePulse(
+            step_amplitude=-0.005,
+            step_delay=0.0,
+            step_duration=200,
+            total_duration=200,
+            location=soma_loc)
+
+        step_protocols.append(ephys.protocols.StepProtocol(
+            name='step%d' % index,
+            step_stimulus=step_stim,
+            holding_stimulus=hold_stim,
+            recordings=[rec_soma],
+            cvode_active=cvode_active))
+
+    return step_protocols
+
+
+@attr('unit')
+def test_snapshotsequenceprotocol_plan():
+    """ephys.protocols: Test SnapshotSequenceProtocol plan"""
+
+    step_protocols = _make_step_protocols(cvode_active=False)
+
+    seq_protocol = ephys.protocols.SnapshotSequenceProtocol(
+        name='seq_prot',
+        protocols=step_protocols + _make_step_protocols(cvode_active=True)[:1])
+
+    roots = seq_protocol.plan()
+    nt.assert_equal(len(roots), 2)
+
+    # step0 leaves the tree at 100 ms, step1 and step2 at 110 ms
+    tree = roots[0]
+    nt.assert_equal(tree.protocols, step_protocols)
+    nt.assert_equal((tree.start, tree.end), (0.0, 100.0))
+    nt.assert_equal(len(tree.children), 2)
+    nt.assert_equal(tree.children[0].protocols, step_protocols[:1])
+    nt.assert_true(tree.children[0].is_leaf)
+    nt.assert_equal(tree.children[0].end, 200.0)
+    nt.assert_equal(tree.children[1].protocols, step_protocols[1:])
+    nt.assert_equal(
+        (tree.children[1].start, tree.children[1].end), (100.0, 110.0))
+    nt.assert_equal(
+        [child.start for child in tree.children[1].children], [110.0, 110.0])
+    nt.assert_true('step2' in str(tree))
+
+    # The cvode protocol can't share the fixed time step simulation
+    nt.assert_true(roots[1].is_leaf)
+    nt.assert_equal(roots[1].simulated_duration, 200.0)
+
+    nt.assert_equal(seq_protocol.saved_duration, 100.0 * 2 + 10.0)
+
+
+@attr('unit')
+def test_snapshotsequenceprotocol_run():
+    """ephys.protocols: Test SnapshotSequenceProtocol against full runs"""
+
+    import numpy
+
+    # Other tests can leave a cvode minstep behind in the global state
+    nrn_sim = ephys.simulators.NrnSimulator(dt=0.025, cvode_minstep=0.0)
+
+    def _spike_count(voltage):
+        """Number of upward crossings of -20 mV"""
+        above = numpy.array(voltage) > -20.0
+        return numpy.sum(above[1:] & ~above[:-1])
+
+    for cvode_active in [False, True]:
+        cell_model = _make_hh_cell_model('snapshot_cell')
+        step_protocols = _make_step_protocols(cvode_active)
+
+        full_responses = {}
+        for protocol in step_protocols:
+            full_responses.update(protocol.run(
+                cell_model=cell_model,
+                param_values={},
+                sim=nrn_sim,
+                isolate=False))
+
+        seq_protocol = ephys.protocols.SnapshotSequenceProtocol(
+            name='seq_prot',
+            protocols=step_protocols)
+        responses = seq_protocol.run(
+            cell_model=cell_model,
+            param_values={},
+            sim=nrn_sim,
+            isolate=False)
+
+        nt.assert_equal(set(responses.keys()), set(full_responses.keys()))
+
+        for name, response in responses.items():
+            full_response = full_responses[name]
+            time = numpy.array(response['time'])
+            nt.assert_true(numpy.all(numpy.diff(time) >= 0))
+            nt.assert_almost_equal(time[-1], full_response['time'].iloc[-1])
+            if cvode_active:
+                # Restoring a state reinitialises cvode, so the time steps
+                # after the snapshot differ from the ones of a full run
+                nt.assert_equal(
+                    _spike_count(response['voltage']),
+                    _spike_count(full_response['voltage']))
+            else:
+                voltage = numpy.interp(
+                    full_response['time'], time, response['voltage'])
+                nt.assert_true(
+                    numpy.max(numpy.abs(
+                        voltage - full_response['voltage'])) < 1e-6)
+
+
+@attr('unit')
+def test_sweepprotocol_run_population_local_dt():
+    """ephys.protocols: Test local time steps of SweepProtocol populations"""
+
+    class LocalDtSimulator(ephys.simulators.NrnSimulator):
+
+        """Simulator that records if cells have their own time step"""
+
+        def __init__(self):
+            super(LocalDtSimulator, self).__init__()
+            self.use_local_dt = []
+
+        def _integrate(self, integrate_func):
+            self.use_local_dt.append(bool(self.cvode.use_local_dt()))
+            super(LocalDtSimulator, self)._integrate(integrate_func)
+
+    nrn_sim = LocalDtSimulator()
+    cell_model = _make_hh_cell_model('local_dt_cell')
+    protocol = _make_step_protocols(cvode_active=None)[0]
+
+    responses_list = protocol.run_population(
+        cell_model=cell_model,
+        param_values_list=[{}, {}],
+        sim=nrn_sim,
+        isolate=False)
+    nt.assert_equal(len(responses_list), 2)
+
+    protocol.run_population(
+        cell_model=cell_model,
+        param_values_list=[{}],
+        sim=nrn_sim,
+        isolate=False)
+
+    nt.assert_equal(nrn_sim.use_local_dt, [True, False])
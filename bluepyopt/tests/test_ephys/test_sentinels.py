@@ -0,0 +1,141 @@
+"""bluepyopt.ephys.sentinels tests"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# pylint:disable=W0612
+
+import os
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+
+import bluepyopt.ephys as ephys
+
+
+def _make_cell_model():
+    """Create a hh soma cell model"""
+
+    morph = ephys.morphologies.NrnFileMorphology(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     'testdata', 'simple.swc'))
+    somatic_loc = ephys.locations.NrnSeclistLocation(
+        'somatic', seclist_name='somatic')
+    hh_mech = ephys.mechanisms.NrnMODMechanism(
+        name='hh', suffix='hh', locations=[somatic_loc])
+
+    return ephys.models.CellModel(
+        name='sentinel_cell', morph=morph, mechs=[hh_mech])
+
+
+def _run_protocol(sentinels, step_amplitude=0.05):
+    """Run hh soma step protocol with sentinels"""
+
+    nrn_sim = ephys.simulators.NrnSimulator()
+    soma_loc = ephys.locations.NrnSeclistCompLocation(
+        name='soma_loc',
+        seclist_name='somatic',
+        sec_index=0,
+        comp_x=.5)
+
+    rec_soma = ephys.recordings.CompRecording(
+        name='soma.v',
+        location=soma_loc,
+        variable='v')
+
+    stim = ephys.stimuli.NrnSquarePulse(
+        step_amplitude=step_amplitude,
+        step_delay=20.0,
+        step_duration=200,
+        total_duration=250,
+        location=soma_loc)
+
+    protocol = ephys.protocols.SweepProtocol(
+        name='prot',
+        stimuli=[stim],
+        recordings=[rec_soma],
+        sentinels=[sentinel(soma_loc) for sentinel in sentinels])
+
+    responses = protocol.run(
+        cell_model=_make_cell_model(),
+        param_values={},
+        sim=nrn_sim,
+        isolate=False)
+
+    return protocol, nrn_sim, responses
+
+
+@attr('unit')
+def test_spikecount_sentinel():
+    """ephys.sentinels: Test SpikeCountSentinel"""
+
+    protocol, nrn_sim, responses = _run_protocol([
+        lambda loc: ephys.sentinels.SpikeCountSentinel(
+            name='spikecount', location=loc, max_spikes=3)])
+
+    nt.assert_equal(responses['soma.v'], None)
+    sentinel = protocol.sentinels[0]
+    nt.assert_true(sentinel.triggered)
+    nt.assert_equal(sentinel.spike_count, 4)
+    nt.assert_true(nrn_sim.neuron.h.t < protocol.total_duration)
+    nt.assert_equal(protocol.triggered_sentinels, [sentinel])
+    nt.assert_true('spikecount' in str(protocol))
+
+    protocol, _, responses = _run_protocol([
+        lambda loc: ephys.sentinels.SpikeCountSentinel(
+            name='spikecount', location=loc, max_spikes=1000)])
+
+    nt.assert_not_equal(responses['soma.v'], None)
+    nt.assert_false(protocol.sentinels[0].triggered)
+
+
+@attr('unit')
+def test_depolarisationblock_sentinel():
+    """ephys.sentinels: Test DepolarisationBlockSentinel"""
+
+    # Strong step current drives the cell in depolarisation block
+    protocol, nrn_sim, responses = _run_protocol([
+        lambda loc: ephys.sentinels.DepolarisationBlockSentinel(
+            name='block', location=loc, voltage_threshold=-40.0,
+            max_duration=20.0)], step_amplitude=1.0)
+
+    nt.assert_equal(responses['soma.v'], None)
+    nt.assert_true(protocol.sentinels[0].triggered)
+    nt.assert_true(40.0 <= nrn_sim.neuron.h.t < 100.0)
+
+    # Spikes are shorter than max_duration
+    protocol, _, responses = _run_protocol([
+        lambda loc: ephys.sentinels.DepolarisationBlockSentinel(
+            name='block', location=loc, voltage_threshold=-20.0,
+            max_duration=10.0)])
+
+    nt.assert_not_equal(responses['soma.v'], None)
+    nt.assert_false(protocol.sentinels[0].triggered)
+
+
+@attr('unit')
+def test_nan_sentinel():
+    """ephys.sentinels: Test NaNSentinel"""
+
+    protocol, _, responses = _run_protocol([
+        lambda loc: ephys.sentinels.NaNSentinel(
+            name='nan', location=loc)])
+
+    nt.assert_not_equal(responses['soma.v'], None)
+    nt.assert_false(protocol.sentinels[0].triggered)
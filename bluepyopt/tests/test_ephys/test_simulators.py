@@ -21,9 +21,11 @@ Copyright (c) 2016, EPFL/Blue Brain Project
 
 # pylint:disable=W0612
 
+import sys
 import types
 import nose.tools as nt
 from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
 
 import mock
 
@@ -115,3 +117,144 @@ def test_disable_banner_exception(mock_glob):
     with warnings.catch_warnings(record=True) as warnings_record:
         ephys.simulators.NrnSimulator._nrn_disable_banner()
         nt.assert_equal(len(warnings_record), 1)
+
+
+@attr('unit')
+def test_nrnsim_watchdog_max_steps():
+    """ephys.simulators: test if watchdog aborts run after max_steps"""
+
+    neuron_sim = ephys.simulators.NrnSimulator(dt=0.025, max_steps=10)
+    soma = neuron_sim.neuron.h.Section(name='soma')
+
+    nt.assert_raises(
+        ephys.simulators.NrnSimulatorAbortException,
+        neuron_sim.run, 100, cvode_active=False)
+    nt.assert_true(neuron_sim.neuron.h.t < 100)
+    nt.assert_equal(neuron_sim.abort_counts['max_steps'], 1)
+    nt.assert_equal(neuron_sim.last_abort_reason, 'max_steps')
+
+    # The local time steps are counted as well
+    soma.insert('hh')
+    nt.assert_raises(
+        ephys.simulators.NrnSimulatorAbortException,
+        neuron_sim.run, 100, cvode_active=True, use_local_dt=True)
+    nt.assert_true(neuron_sim.neuron.h.t < 100)
+    nt.assert_equal(neuron_sim.abort_counts['max_steps'], 2)
+
+    # Watchdog is removed after the run
+    neuron_sim.max_steps = None
+    neuron_sim.run(10, cvode_active=False)
+    nt.assert_almost_equal(neuron_sim.neuron.h.t, 10)
+    neuron_sim.run(100, cvode_active=True, use_local_dt=True)
+    nt.assert_almost_equal(neuron_sim.neuron.h.t, 100)
+
+
+@attr('unit')
+def test_nrnsim_watchdog_max_wallclock():
+    """ephys.simulators: test if watchdog aborts run after max_wallclock"""
+
+    neuron_sim = ephys.simulators.NrnSimulator(
+        dt=0.025, max_wallclock=0.0, watchdog_interval=1)
+    soma = neuron_sim.neuron.h.Section(name='soma')  # NOQA
+
+    try:
+        neuron_sim.run(100, cvode_active=False)
+    except ephys.simulators.NrnSimulatorException as e:
+        nt.assert_equal(e.reason, 'max_wallclock')
+    else:
+        raise AssertionError('NrnSimulatorException not raised')
+
+    nt.assert_equal(neuron_sim.abort_counts['max_wallclock'], 1)
+
+
+def _thread_responses():
+    """Responses of a tree of sections with several threads settings"""
+
+    neuron = ephys.simulators.NrnSimulator().neuron
+
+    # Binary tree of sections, to have a cell that can be split
+    sections = [neuron.h.Section(name='tree_%d' % index)
+                for index in range(15)]
+    for index, section in enumerate(sections[1:], 1):
+        section.connect(sections[(index - 1) // 2](1))
+    for section in sections:
+        section.insert('hh')
+        section.L = 100
+        section.diam = 2
+        section.nseg = 5
+
+    iclamp = neuron.h.IClamp(sections[0](0.5))
+    iclamp.delay = 5
+    iclamp.dur = 20
+    iclamp.amp = 1.0
+    voltage = neuron.h.Vector()
+    voltage.record(sections[-1](0.5)._ref_v)
+
+    # A run under the watchdog doesn't prevent the next runs with threads
+    watchdog_sim = ephys.simulators.NrnSimulator(dt=0.025, max_steps=10)
+    nt.assert_raises(
+        ephys.simulators.NrnSimulatorAbortException,
+        watchdog_sim.run, 30, cvode_active=False)
+
+    parallel_context = neuron.h.ParallelContext()
+    responses = {}
+    for nthread, multisplit in [(1, False), (2, False), (2, True)]:
+        neuron_sim = ephys.simulators.NrnSimulator(
+            dt=0.025,
+            nthread=nthread,
+            cache_efficient=nthread > 1,
+            multisplit=multisplit)
+        neuron_sim.run(30, cvode_active=False)
+        responses[nthread, multisplit] = (
+            parallel_context.nthread(),
+            voltage.to_python(),
+            neuron.h.SectionRef(sec=sections[-1]).root == sections[0])
+
+    # The watchdog also aborts the runs with threads
+    watchdog_sim = ephys.simulators.NrnSimulator(
+        dt=0.025, max_steps=10, nthread=2)
+    try:
+        watchdog_sim.run(30, cvode_active=False)
+    except ephys.simulators.NrnSimulatorAbortException as e:
+        abort = (parallel_context.nthread(), e.reason, neuron.h.t)
+    else:
+        abort = None
+
+    return responses, abort
+
+
+@attr('unit')
+def test_nrnsim_nthread():
+    """ephys.simulators: test if threads give the single-thread responses"""
+
+    import multiprocessing
+
+    nt.assert_raises(
+        ValueError, ephys.simulators.NrnSimulator, nthread=0)
+
+    # The threads are used in a new process, this one keeps its settings
+    if sys.version_info[0] < 3:
+        raise SkipTest('Python 2 can only fork processes')
+    pool = multiprocessing.get_context('spawn').Pool(1)
+    try:
+        responses, abort = pool.apply(_thread_responses)
+    finally:
+        pool.terminate()
+
+    used_nthread, abort_reason, abort_time = abort
+    nt.assert_equal(used_nthread, 2)
+    nt.assert_equal(abort_reason, 'max_steps')
+    nt.assert_true(abort_time < 1)
+
+    _, reference, _ = responses[1, False]
+    # The spikes reach the last section
+    nt.assert_true(max(reference) > 0)
+    for (nthread, _), (used_nthread, response, connected) in \
+            responses.items():
+        nt.assert_equal(used_nthread, nthread)
+        # The sections are reconnected after the run
+        nt.assert_true(connected)
+        nt.assert_equal(len(response), len(reference))
+        nt.assert_true(max(
+            abs(value - reference_value) for value, reference_value in
+            zip(response, reference)) < 1e-6)
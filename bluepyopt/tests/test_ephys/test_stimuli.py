@@ -213,3 +213,46 @@ def test_NrnRampPulse_instantiate():
     recording.destroy(sim=nrn_sim)
     stim.destroy(sim=nrn_sim)
     dummy_cell.destroy(sim=nrn_sim)
+
+
+@attr('unit')
+def test_stimulus_timeline():
+    """ephys.stimuli: test timeline of stimuli"""
+
+    nt.assert_equal(ephys.stimuli.Stimulus().timeline(), None)
+    nt.assert_equal(
+        ephys.stimuli.NrnNetStimStimulus(total_duration=100).timeline(),
+        None)
+
+    square = ephys.stimuli.NrnSquarePulse(
+        step_amplitude=0.1,
+        step_delay=20,
+        step_duration=50,
+        total_duration=100)
+    nt.assert_equal(
+        square.timeline(),
+        [(0.0, 20, 0.0, 0.0), (20, 70, 0.1, 0.1), (70, 100, 0.0, 0.0)])
+
+    holding = ephys.stimuli.NrnSquarePulse(
+        step_amplitude=-0.1,
+        step_delay=0,
+        step_duration=100,
+        total_duration=100)
+    nt.assert_equal(holding.timeline(), [(0, 100, -0.1, -0.1)])
+
+    ramp = ephys.stimuli.NrnRampPulse(
+        ramp_amplitude_start=0.1,
+        ramp_amplitude_end=0.2,
+        ramp_delay=20,
+        ramp_duration=50,
+        total_duration=100)
+    nt.assert_equal(
+        ramp.timeline(),
+        [(0.0, 20, 0.0, 0.0), (20, 70, 0.1, 0.2), (70, 100, 0.0, 0.0)])
+
+    play = ephys.stimuli.NrnCurrentPlayStimulus(
+        time_points=[10, 20, 20, 30],
+        current_points=[0.0, 0.0, 0.1, 0.2])
+    nt.assert_equal(
+        play.timeline(),
+        [(0.0, 10, 0.0, 0.0), (10, 20, 0.0, 0.0), (20, 30, 0.1, 0.2)])
@@ -0,0 +1,149 @@
+"""bluepyopt.ephys.workers tests"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import os
+import sys
+import copy
+import multiprocessing
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
+
+import numpy
+
+import bluepyopt.ephys as ephys
+
+
+@attr('unit')
+def test_prewarm():
+    """ephys.workers: test prewarm"""
+
+    sim = ephys.workers.prewarm()
+    nt.assert_is_instance(sim, ephys.simulators.NrnSimulator)
+    nt.assert_true(sim.neuron.h.name_declared('Import3d_SWC_read'))
+
+
+def _skip_without_forkserver():
+    """Skip the test on Python 2, which has no forkserver"""
+
+    if sys.version_info[0] < 3:
+        nt.assert_raises(ValueError, ephys.workers.WorkerTemplate)
+        raise SkipTest('Python 2 has no forkserver')
+
+
+@attr('unit')
+def test_WorkerTemplate():
+    """ephys.workers: test if isolated protocols run in the template"""
+
+    _skip_without_forkserver()
+
+    import bluepyopt.ephys.examples as examples
+
+    evaluator = copy.deepcopy(examples.simplecell.cell_evaluator)
+    evaluator.cell_model.unfreeze(evaluator.param_names)
+    protocol = evaluator.fitness_protocols['Step1']
+    param_values = {'gnabar_hh': 0.12, 'gkbar_hh': 0.036}
+
+    template = ephys.workers.WorkerTemplate()
+    nt.assert_equal(
+        str(template),
+        'WorkerTemplate(mechanisms_dir=None, '
+        'hoc_files=stdrun.hoc, import3d.hoc)')
+
+    responses = evaluator.run_protocol(
+        protocol, param_values, isolate=template)
+    nt.assert_true(template.running)
+    nt.assert_false(ephys.workers._PREWARM_ENV in os.environ)
+
+    # The state of NEURON in this process can be changed by other tests,
+    # the reference is run in a new process
+    pool = multiprocessing.get_context('spawn').Pool(1)
+    reference_responses = pool.apply(
+        evaluator.run_protocol, (protocol, param_values, False))
+    pool.terminate()
+    pool.join()
+
+    for name, response in reference_responses.items():
+        numpy.testing.assert_array_almost_equal(
+            responses[name]['voltage'], response['voltage'])
+
+    if sys.version_info < (3, 7):
+        nt.assert_raises(ValueError, template.executor)
+    else:
+        with template.executor(max_workers=1) as executor:
+            nt.assert_equal(executor.submit(abs, -1).result(), 1)
+
+
+@attr('unit')
+def test_WorkerTemplate_settings():
+    """ephys.workers: test templates with other settings"""
+
+    _skip_without_forkserver()
+
+    template = ephys.workers.WorkerTemplate()
+    template.start()
+    nt.assert_true(template.running)
+
+    other_template = ephys.workers.WorkerTemplate(mechanisms_dir='.')
+    nt.assert_false(other_template.running)
+    nt.assert_raises(ValueError, other_template.start)
+
+    # A forkserver that was not started by a template isn't pre-warmed
+    started_forkserver = ephys.workers._started_forkserver
+    ephys.workers._started_forkserver = None
+    try:
+        nt.assert_false(template.running)
+        template.start()
+        nt.assert_false(template.running)
+    finally:
+        ephys.workers._started_forkserver = started_forkserver
+    nt.assert_true(template.running)
+
+
+@attr('unit')
+def test_prewarm_from_environment():
+    """ephys.workers: test prewarm_from_environment"""
+
+    nt.assert_equal(ephys.workers.prewarm_from_environment(), None)
+
+    os.environ[ephys.workers._PREWARM_ENV] = '{"hoc_files": ["stdrun.hoc"]}'
+    try:
+        sim = ephys.workers.prewarm_from_environment()
+    finally:
+        os.environ.pop(ephys.workers._PREWARM_ENV, None)
+    nt.assert_is_instance(sim, ephys.simulators.NrnSimulator)
+
+
+@attr('unit')
+def test_forkserver_pid():
+    """ephys.workers: test the pid of a forkserver that can't be read"""
+
+    _skip_without_forkserver()
+
+    import multiprocessing.forkserver
+
+    forkserver = multiprocessing.forkserver._forkserver
+    multiprocessing.forkserver._forkserver = object()
+    try:
+        nt.assert_equal(ephys.workers._forkserver_pid(), None)
+    finally:
+        multiprocessing.forkserver._forkserver = forkserver
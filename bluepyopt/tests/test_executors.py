@@ -0,0 +1,348 @@
+"""bluepyopt.executors tests"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# pylint:disable=W0612
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import concurrent.futures
+import concurrent.futures.process
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
+
+import bluepyopt
+import bluepyopt.executors
+
+
+def _crash_once(marker_path):
+    """Kill the worker process the first time it is called"""
+
+    if not os.path.exists(marker_path):
+        open(marker_path, 'w').close()
+        os._exit(1)  # pylint: disable=W0212
+
+    return 'survived'
+
+
+class FakeIPyParallelView(object):
+
+    """Load balanced view running the tasks in local processes"""
+
+    def __init__(self, pool, n_engines):
+        """Constructor"""
+
+        class Client(object):
+            """Client with engine ids"""
+            ids = list(range(n_engines))
+
+        self.pool = pool
+        self.client = Client()
+        self.targets = None
+
+    def apply_async(self, func, *args):
+        """Submit task"""
+
+        return self.pool.submit(func, *args)
+
+
+@attr('unit')
+def test_SerialExecutor():
+    """bluepyopt.executors: test SerialExecutor"""
+
+    executor = bluepyopt.executors.SerialExecutor()
+    nt.assert_equal(executor.n_workers, 1)
+    nt.assert_equal(str(executor), 'SerialExecutor with 1 workers')
+
+    task = executor.submit(pow, 2, 3)
+    nt.assert_true(task.done())
+    nt.assert_equal(task.result(), 8)
+    nt.assert_equal(task.exception(), None)
+
+    failed_task = executor.submit(pow, 2, 'a')
+    nt.assert_true(isinstance(failed_task.exception(), TypeError))
+    nt.assert_raises(TypeError, failed_task.result)
+
+    nt.assert_equal(
+        set(executor.as_completed([task, failed_task])),
+        set([task, failed_task]))
+
+    nt.assert_equal(executor.map(pow, [1, 2, 3], [2, 2, 2]), [1, 4, 9])
+
+
+@attr('unit')
+def test_FuturesExecutor():
+    """bluepyopt.executors: test FuturesExecutor with processes"""
+
+    with bluepyopt.executors.FuturesExecutor(max_workers=2) as executor:
+        nt.assert_equal(executor.n_workers, 2)
+        nt.assert_equal(executor.map(pow, [1, 2, 3], [2, 2, 2]), [1, 4, 9])
+
+        slow_task = executor.submit(time.sleep, 0.5)
+        fast_task = executor.submit(pow, 2, 3)
+
+        completed = list(executor.as_completed([slow_task, fast_task]))
+        nt.assert_equal(completed, [fast_task, slow_task])
+        nt.assert_true(slow_task.duration >= fast_task.duration)
+
+        # Per task timeout
+        slow_task = executor.submit(time.sleep, 2)
+        completed = list(executor.as_completed([slow_task], task_timeout=0.1))
+        nt.assert_equal(completed, [slow_task])
+        nt.assert_true(slow_task.timed_out)
+        nt.assert_raises(
+            bluepyopt.executors.TaskTimeoutError, slow_task.result)
+
+        # Global timeout
+        slow_task = executor.submit(time.sleep, 2)
+        nt.assert_raises(
+            concurrent.futures.TimeoutError,
+            list,
+            executor.as_completed([slow_task], timeout=0.1))
+
+
+@attr('unit')
+def test_IPyParallelExecutor():
+    """bluepyopt.executors: test IPyParallelExecutor"""
+
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=2)
+    try:
+        executor = bluepyopt.executors.IPyParallelExecutor(
+            FakeIPyParallelView(pool, n_engines=2))
+
+        nt.assert_equal(executor.n_workers, 2)
+        nt.assert_equal(executor.map(pow, [1, 2, 3], [2, 2, 2]), [1, 4, 9])
+
+        tasks = [executor.submit(pow, 2, exponent) for exponent in range(4)]
+        nt.assert_equal(
+            sorted(task.result() for task in executor.as_completed(tasks)),
+            [1, 2, 4, 8])
+    finally:
+        pool.shutdown()
+
+
+@attr('unit')
+def test_Speculation():
+    """bluepyopt.executors: test speculative execution of stragglers"""
+
+    speculation = bluepyopt.executors.Speculation(
+        percentile=50.0, min_samples=3)
+    nt.assert_equal(speculation.threshold(), None)
+    for duration in [1.0, 2.0, 3.0]:
+        speculation.update(duration)
+    nt.assert_equal(speculation.threshold(), 2.0)
+
+    speculation = bluepyopt.executors.Speculation(
+        percentile=90.0, min_samples=5)
+
+    # The first call of the straggler hangs until released, its copy
+    # returns immediately
+    calls = []
+    release = threading.Event()
+
+    def evaluate(value):
+        """Return value, hang on the first call with value 'straggler'"""
+        calls.append(value)
+        if value == 'straggler' and calls.count(value) == 1:
+            release.wait(10)
+        return value
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    try:
+        executor = bluepyopt.executors.FuturesExecutor(pool)
+
+        tasks = [executor.submit(evaluate, index) for index in range(5)]
+        list(executor.as_completed(tasks, speculation=speculation))
+        nt.assert_equal(len(speculation.durations), 5)
+
+        task = executor.submit(evaluate, 'straggler')
+        start_time = time.time()
+        completed = list(executor.as_completed(
+            [task], speculation=speculation))
+        nt.assert_true(time.time() - start_time < 5)
+
+        nt.assert_equal(completed, [task])
+        nt.assert_equal(task.result(), 'straggler')
+        nt.assert_equal(calls.count('straggler'), 2)
+        nt.assert_equal(speculation.n_copies, 1)
+        nt.assert_equal(task.copies, [])
+
+        # The hanging call can't be cancelled, it keeps its worker busy and
+        # no copy is submitted for the next straggler
+        nt.assert_equal(len(executor._orphans), 1)
+        timer = threading.Timer(0.5, release.set)
+        timer.start()
+        task = executor.submit(evaluate, 'straggler')
+        list(executor.as_completed([task], speculation=speculation))
+        nt.assert_equal(task.result(), 'straggler')
+        nt.assert_equal(speculation.n_copies, 1)
+        timer.join()
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+@attr('unit')
+def test_Speculation_failures():
+    """bluepyopt.executors: test speculative copies that fail"""
+
+    # The first call hangs for a while, the copy fails immediately
+    calls = []
+
+    def evaluate(value, fail_first):
+        """Return value after a while the first time, fail afterwards"""
+        calls.append(value)
+        if calls.count(value) == 1:
+            time.sleep(0.5)
+            if fail_first:
+                raise ValueError('first call of %s' % value)
+            return value
+        raise ValueError('copy of %s' % value)
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    try:
+        executor = bluepyopt.executors.FuturesExecutor(pool)
+        speculation = bluepyopt.executors.Speculation(min_samples=1)
+        speculation.update(0.0)
+
+        # The failed copy doesn't replace the task
+        task = executor.submit(evaluate, 'slow', False)
+        list(executor.as_completed([task], speculation=speculation))
+        nt.assert_equal(calls.count('slow'), 2)
+        nt.assert_equal(task.result(), 'slow')
+
+        # The task fails when all the copies failed
+        task = executor.submit(evaluate, 'failing', True)
+        list(executor.as_completed([task], speculation=speculation))
+        nt.assert_equal(calls.count('failing'), 2)
+        nt.assert_equal(str(task.exception()), 'first call of failing')
+        nt.assert_equal(speculation.n_copies, 2)
+    finally:
+        pool.shutdown()
+
+
+@attr('unit')
+def test_classify_failure():
+    """bluepyopt.executors: test classify_failure"""
+
+    import bluepyopt.ephys.simulators
+
+    classify = bluepyopt.executors.classify_failure
+
+    nt.assert_equal(classify(None), None)
+    if sys.version_info[0] >= 3:
+        nt.assert_equal(
+            classify(concurrent.futures.process.BrokenProcessPool('died')),
+            bluepyopt.executors.CRASH)
+    nt.assert_equal(
+        classify(bluepyopt.executors.TaskTimeoutError('too long')),
+        bluepyopt.executors.TIMEOUT)
+    nt.assert_equal(
+        classify(bluepyopt.ephys.simulators.NrnSimulatorException(
+            'Neuron simulator error', None)),
+        bluepyopt.executors.SIMULATOR)
+    nt.assert_equal(
+        classify(RuntimeError('hoc error')), bluepyopt.executors.SIMULATOR)
+    nt.assert_equal(classify(ValueError('bug')), None)
+
+    # Only the RuntimeErrors of hoc are simulator failures
+    sim = bluepyopt.ephys.simulators.NrnSimulator()
+    with nt.assert_raises(RuntimeError) as context:
+        sim.neuron.h.Vector().resize(-1)
+    nt.assert_equal(
+        classify(context.exception), bluepyopt.executors.SIMULATOR)
+    nt.assert_equal(classify(RuntimeError('bug')), None)
+    nt.assert_equal(classify(NotImplementedError('bug')), None)
+
+    # Exceptions re-raised with the traceback as message
+    nt.assert_equal(
+        classify(Exception(
+            'Traceback (most recent call last):\n  ...\n'
+            'bluepyopt.ephys.simulators.NrnSimulatorAbortException: '
+            'aborted')),
+        bluepyopt.executors.SIMULATOR)
+    nt.assert_equal(
+        classify(Exception(
+            'Traceback (most recent call last):\n  ...\n'
+            'RuntimeError: hoc error')),
+        bluepyopt.executors.SIMULATOR)
+    nt.assert_equal(
+        classify(Exception(
+            'Traceback (most recent call last):\n  ...\n'
+            'RuntimeError: dictionary changed size during iteration')),
+        None)
+
+    class RemoteError(Exception):
+        """Remote exception with the name of the original exception"""
+        ename = 'EngineError'
+
+    nt.assert_equal(
+        classify(RemoteError('engine died')), bluepyopt.executors.CRASH)
+
+
+@attr('unit')
+def test_RetryPolicy():
+    """bluepyopt.executors: test retry of tasks of crashed workers"""
+
+    if sys.version_info[0] < 3:
+        raise SkipTest('The process pools of Python 2 hang when a worker '
+                       'dies')
+
+    test_dir = tempfile.mkdtemp()
+    try:
+        retry = bluepyopt.executors.RetryPolicy(max_retries=1)
+        marker_path = os.path.join(test_dir, 'marker')
+
+        with bluepyopt.executors.FuturesExecutor(max_workers=1) as executor:
+            task = executor.submit(_crash_once, marker_path)
+            completed = list(executor.as_completed([task], retry=retry))
+
+            nt.assert_equal(completed, [task])
+            nt.assert_equal(task.result(), 'survived')
+            nt.assert_equal(task.attempts, 2)
+
+            # Tasks that keep failing are yielded after max_retries
+            os.remove(marker_path)
+            retry.max_retries = 0
+            task = executor.submit(_crash_once, marker_path)
+            list(executor.as_completed([task], retry=retry))
+            nt.assert_equal(
+                bluepyopt.executors.classify_failure(task.exception()),
+                bluepyopt.executors.CRASH)
+
+        nt.assert_equal(len(retry.failures), 1)
+        nt.assert_equal(retry.failures[0]['kind'], bluepyopt.executors.CRASH)
+        nt.assert_equal(retry.failures[0]['action'], 'retry')
+
+        report_path = os.path.join(test_dir, 'failures.json')
+        retry.write_report(report_path)
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        nt.assert_equal(report['counts'], {'crash': 1})
+        nt.assert_equal(len(report['failures']), 1)
+    finally:
+        shutil.rmtree(test_dir)
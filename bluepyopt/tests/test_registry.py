@@ -0,0 +1,118 @@
+"""bluepyopt.registry tests"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# pylint:disable=W0612
+
+import pickle
+import shutil
+import tempfile
+
+import nose.tools as nt
+from nose.plugins.attrib import attr
+
+import bluepyopt
+import bluepyopt.registry
+
+
+class SumEvaluator(bluepyopt.evaluators.Evaluator):
+
+    """Evaluator with a large attribute"""
+
+    def __init__(self):
+        """Constructor"""
+
+        super(SumEvaluator, self).__init__()
+        self.data = list(range(10000))
+
+    def evaluate_with_lists(self, params):
+        """Evaluate"""
+
+        return [sum(params)]
+
+
+@attr('unit')
+def test_register():
+    """bluepyopt.registry: test register and get_evaluator"""
+
+    payload = bluepyopt.registry.evaluator_payload(SumEvaluator())
+    evaluator_id = bluepyopt.registry.register(payload)
+
+    nt.assert_equal(evaluator_id, bluepyopt.registry.payload_id(payload))
+    nt.assert_true(bluepyopt.registry.is_registered(evaluator_id))
+
+    evaluator = bluepyopt.registry.get_evaluator(evaluator_id)
+    nt.assert_equal(evaluator.evaluate_with_lists([1, 2]), [3])
+
+    # Registering the same content again keeps the same evaluator
+    nt.assert_equal(bluepyopt.registry.register(payload), evaluator_id)
+    nt.assert_true(
+        bluepyopt.registry.get_evaluator(evaluator_id) is evaluator)
+
+    bluepyopt.registry.unregister(evaluator_id)
+    nt.assert_false(bluepyopt.registry.is_registered(evaluator_id))
+    nt.assert_raises(
+        bluepyopt.registry.RegistryException,
+        bluepyopt.registry.get_evaluator,
+        evaluator_id)
+
+
+@attr('unit')
+def test_RegisteredEvaluation():
+    """bluepyopt.registry: test RegisteredEvaluation with FileBroadcast"""
+
+    directory = tempfile.mkdtemp()
+    try:
+        evaluator = SumEvaluator()
+        broadcast = bluepyopt.registry.FileBroadcast(directory)
+        evaluator_id = broadcast.register(evaluator)
+
+        evaluation = bluepyopt.registry.RegisteredEvaluation(
+            evaluator_id, loader=broadcast.loader)
+
+        # The task is much smaller than the evaluator
+        task = pickle.dumps((evaluation, [1, 2]))
+        nt.assert_true(len(task) < 1000)
+        nt.assert_true(
+            len(bluepyopt.registry.evaluator_payload(evaluator)) > 10000)
+
+        # A worker loads the evaluator when it isn't registered yet
+        nt.assert_false(bluepyopt.registry.is_registered(evaluator_id))
+        worker_evaluation, params = pickle.loads(task)
+        nt.assert_equal(worker_evaluation(params), [3])
+        nt.assert_true(bluepyopt.registry.is_registered(evaluator_id))
+
+        bluepyopt.registry.unregister(evaluator_id)
+    finally:
+        shutil.rmtree(directory)
+
+
+@attr('unit')
+def test_LocalBroadcast():
+    """bluepyopt.registry: test LocalBroadcast"""
+
+    broadcast = bluepyopt.registry.LocalBroadcast()
+    evaluator_id = broadcast.register(SumEvaluator())
+
+    nt.assert_equal(broadcast.loader, None)
+    evaluation = bluepyopt.registry.RegisteredEvaluation(evaluator_id)
+    nt.assert_equal(evaluation([3, 4]), [7])
+
+    bluepyopt.registry.unregister(evaluator_id)
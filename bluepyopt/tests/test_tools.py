@@ -37,3 +37,28 @@ def test_uint32_seed():
     import numpy
     for hash_value in hashes:
         nt.assert_equal(hash_value, numpy.uint32(hash_value))
+
+
+@attr('unit')
+def test_random_stream():
+    """bluepyopt.tools: test stream_seed and random_stream"""
+
+    import random
+    import bluepyopt.tools as bpoptools
+
+    nt.assert_equal(
+        bpoptools.stream_seed(1, 2, 3), bpoptools.uint32_seed('1/2/3'))
+    nt.assert_not_equal(
+        bpoptools.stream_seed(1, 2, 3), bpoptools.stream_seed(1, 3, 2))
+
+    random.seed(1)
+    with bpoptools.random_stream(1, 2, 3):
+        first_draw = random.random()
+    after_stream = random.random()
+
+    random.seed(1)
+    nt.assert_equal(random.random(), after_stream)
+
+    # The stream doesn't depend on the state of the random module
+    with bpoptools.random_stream(1, 2, 3):
+        nt.assert_equal(random.random(), first_draw)
@@ -1,6 +1,8 @@
 """BluePyOpt tools"""
 
+import random
 import hashlib
+import contextlib
 
 
 def uint32_seed(string):
@@ -9,3 +11,30 @@ def uint32_seed(string):
     hex_value = hashlib.md5(string.encode('utf-8')).hexdigest()
 
     return int(hex_value, 16) & 0xFFFFFFFF
+
+
+def stream_seed(*keys):
+    """Get unsigned int seed of a random stream identified by keys
+
+    The seed only depends on the keys, e.g. (seed, generation, index), not on
+    the order in which the streams are used
+    """
+
+    return uint32_seed('/'.join(str(key) for key in keys))
+
+
+@contextlib.contextmanager
+def random_stream(*keys):
+    """Draw from the random stream identified by keys in this context
+
+    The random module is seeded with stream_seed(*keys), so that functions
+    using it (e.g. the DEAP operators) draw from the stream, and its state
+    is restored when the context exits
+    """
+
+    state = random.getstate()
+    random.seed(stream_seed(*keys))
+    try:
+        yield
+    finally:
+        random.setstate(state)
@@ -0,0 +1,123 @@
+"""Time of the hoc export of a population of L5PC models
+
+Run from the examples/l5pc directory:
+
+    python benchmark/hoc_benchmark.py --n-models 1000 --processes 4
+
+The models are exported one by one with CellModel.create_hoc, and in bulk
+with CellModel.write_hocs to an archive, serially and with a process pool,
+with and without the shared section.
+"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import l5pc_evaluator  # NOQA
+
+
+def population(evaluator, n_models, seed=1):
+    """Random parameter sets within the bounds of the parameters"""
+
+    rng = random.Random(seed)
+
+    return [dict((param.name, rng.uniform(*param.bounds))
+                 for param in evaluator.params)
+            for _ in range(n_models)]
+
+
+def export_hoc(cell_model, param_dicts):
+    """Time of the creation of the hoc code of every parameter set"""
+
+    start_time = time.time()
+    for param_dict in param_dicts:
+        cell_model.create_hoc(param_dict)
+
+    return time.time() - start_time
+
+
+def write_hocs(cell_model, param_dicts, output, shared, processes):
+    """Time of the bulk export of the parameter sets"""
+
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+
+    start_time = time.time()
+    cell_model.write_hocs(
+        param_dicts,
+        output,
+        shared=shared,
+        map_function=pool.map if pool is not None else None)
+    duration = time.time() - start_time
+
+    if pool is not None:
+        pool.terminate()
+        pool.join()
+
+    return duration, os.path.getsize(output)
+
+
+def main():
+    """Main"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--n-models', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--archive', default='population.tar',
+                        help='name of the archive, its extension sets the '
+                        'format')
+    args = parser.parse_args()
+
+    evaluator = l5pc_evaluator.create()
+    param_dicts = population(evaluator, args.n_models)
+
+    duration = export_hoc(evaluator.cell_model, param_dicts)
+    print('%d models' % args.n_models)
+    print('%-34s %9s %14s' % ('export', 'time (s)', 'archive (kB)'))
+    print('%-34s %9.3f %14s' % ('create_hoc one by one', duration, '-'))
+
+    output_dir = tempfile.mkdtemp()
+    try:
+        for shared in [False, True]:
+            for processes in sorted(set([1, args.processes])):
+                duration, size = write_hocs(
+                    evaluator.cell_model,
+                    param_dicts,
+                    os.path.join(output_dir, args.archive),
+                    shared,
+                    processes)
+                print('%-34s %9.3f %14.1f' % (
+                    'write_hocs, %d process(es)%s' % (
+                        processes, ', shared' if shared else ''),
+                    duration, size / 1024.0))
+    finally:
+        shutil.rmtree(output_dir)
+
+
+if __name__ == '__main__':
+    main()
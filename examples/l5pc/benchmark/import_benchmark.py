@@ -0,0 +1,109 @@
+"""Startup time of the imports of an evaluation worker
+
+Run from the examples/l5pc directory:
+
+    python benchmark/import_benchmark.py --max-time 0.5
+
+Every import is timed in new python processes, from which the time of an
+empty python process is subtracted. The script fails if an import takes
+longer than --max-time, or if bluepyopt.ephys imports one of the modules
+that are only needed to optimise or to plot, so that it can be used to
+guard against startup regressions.
+"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+IMPORTS = [
+    ('bluepyopt', 'import bluepyopt'),
+    ('bluepyopt.ephys', 'import bluepyopt.ephys'),
+    ('l5pc_evaluator', 'import l5pc_evaluator'),
+    ('bluepyopt.deapext', 'import bluepyopt.deapext.optimisations')]
+
+HEAVY_MODULES = ['pandas', 'matplotlib', 'deap', 'jinja2']
+
+
+def run_python(code):
+    """Wall-clock time and imported modules of a new python process"""
+
+    code += '; import sys, json; print(json.dumps(sorted(sys.modules)))'
+    start_time = time.time()
+    output = subprocess.check_output([sys.executable, '-c', code])
+    duration = time.time() - start_time
+
+    return duration, json.loads(output.decode().strip().split('\n')[-1])
+
+
+def best_time(code, repeats):
+    """Best time and imported modules of code"""
+
+    durations = []
+    for _ in range(repeats):
+        duration, modules = run_python(code)
+        durations.append(duration)
+
+    return min(durations), modules
+
+
+def main():
+    """Main"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-time', type=float, default=None,
+                        help='maximum time (s) of the import of '
+                        'bluepyopt.ephys')
+    args = parser.parse_args()
+
+    empty_time, _ = best_time('pass', args.repeats)
+
+    print('Import times over an empty python process (%.3f s)' % empty_time)
+    print('%-18s %9s   %s' % ('import', 'time (s)', 'heavy modules'))
+    failures = []
+    for name, code in IMPORTS:
+        duration, modules = best_time(code, args.repeats)
+        duration -= empty_time
+        heavy_modules = [module for module in HEAVY_MODULES
+                         if module in modules]
+        print('%-18s %9.3f   %s' % (
+            name, duration, ', '.join(heavy_modules)))
+
+        if name == 'bluepyopt.ephys':
+            if heavy_modules:
+                failures.append(
+                    'bluepyopt.ephys imports %s' % ', '.join(heavy_modules))
+            if args.max_time is not None and duration > args.max_time:
+                failures.append(
+                    'bluepyopt.ephys takes %.3f s to import, more than '
+                    '%.3f s' % (duration, args.max_time))
+
+    for failure in failures:
+        print('FAILED: %s' % failure)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
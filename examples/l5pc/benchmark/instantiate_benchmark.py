@@ -0,0 +1,103 @@
+"""Instantiation time of the L5PC model with the hoc and python builders
+
+Run from the examples/l5pc directory:
+
+    python benchmark/instantiate_benchmark.py --repeats 20 --scores
+
+The model is instantiated and destroyed with the release parameters, with
+the morphology imported by NEURON every time (builder='hoc'), and with the
+sections created from the topology of the morphology (builder='python').
+The first instantiation, which imports the morphology with both builders,
+is timed separately. With --scores, the protocols are run with both
+builders, and the differences of the scores are printed.
+"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(0, os.path.abspath('benchmark'))
+
+import l5pc_evaluator  # NOQA
+
+from nseg_benchmark import release_params  # NOQA
+
+
+def instantiate(evaluator, repeats):
+    """Time of the first instantiation and best time of the next ones"""
+
+    cell_model = evaluator.cell_model
+    cell_model.freeze(release_params)
+
+    durations = []
+    for _ in range(repeats + 1):
+        start_time = time.time()
+        cell_model.instantiate(sim=evaluator.sim)
+        durations.append(time.time() - start_time)
+        cell_model.destroy(sim=evaluator.sim)
+
+    cell_model.unfreeze(release_params.keys())
+
+    return durations[0], min(durations[1:])
+
+
+def main():
+    """Main"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--scores', action='store_true',
+                        help='compare the scores of the builders')
+    args = parser.parse_args()
+
+    print('%-8s %15s %15s %9s' % (
+        'builder', 'first (ms)', 'next (ms)', 'speedup'))
+    reference_time = None
+    scores = {}
+    for builder in ['hoc', 'python']:
+        evaluator = l5pc_evaluator.create()
+        evaluator.cell_model.builder = builder
+
+        first_time, next_time = instantiate(evaluator, args.repeats)
+        if reference_time is None:
+            reference_time = next_time
+        print('%-8s %15.1f %15.1f %9.1f' % (
+            builder, first_time * 1000, next_time * 1000,
+            reference_time / next_time))
+
+        if args.scores:
+            responses = evaluator.run_protocols(
+                evaluator.fitness_protocols.values(), release_params)
+            scores[builder] = \
+                evaluator.fitness_calculator.calculate_scores(responses)
+
+    if args.scores:
+        differences = [abs(scores['python'][name] - scores['hoc'][name])
+                       for name in scores['hoc']]
+        print('Score differences: max %g over %d objectives' % (
+            max(differences), len(differences)))
+
+
+if __name__ == '__main__':
+    main()
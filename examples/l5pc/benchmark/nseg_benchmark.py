@@ -0,0 +1,146 @@
+"""Compare the 40 um nseg rule with the d_lambda rule on the L5PC model
+
+Run from the examples/l5pc directory, after compiling the mechanisms with
+nrnivmodl mechanisms:
+
+    python benchmark/nseg_benchmark.py
+"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import bluepyopt.ephys as ephys  # NOQA
+
+import l5pc_evaluator  # NOQA
+
+morphology_path = os.path.join('morphology', 'C060114A7.asc')
+
+# Parameters in release circuit model
+release_params = {
+    'gNaTs2_tbar_NaTs2_t.apical': 0.026145,
+    'gSKv3_1bar_SKv3_1.apical': 0.004226,
+    'gImbar_Im.apical': 0.000143,
+    'gNaTa_tbar_NaTa_t.axonal': 3.137968,
+    'gK_Tstbar_K_Tst.axonal': 0.089259,
+    'gamma_CaDynamics_E2.axonal': 0.002910,
+    'gNap_Et2bar_Nap_Et2.axonal': 0.006827,
+    'gSK_E2bar_SK_E2.axonal': 0.007104,
+    'gCa_HVAbar_Ca_HVA.axonal': 0.000990,
+    'gK_Pstbar_K_Pst.axonal': 0.973538,
+    'gSKv3_1bar_SKv3_1.axonal': 1.021945,
+    'decay_CaDynamics_E2.axonal': 287.198731,
+    'gCa_LVAstbar_Ca_LVAst.axonal': 0.008752,
+    'gamma_CaDynamics_E2.somatic': 0.000609,
+    'gSKv3_1bar_SKv3_1.somatic': 0.303472,
+    'gSK_E2bar_SK_E2.somatic': 0.008407,
+    'gCa_HVAbar_Ca_HVA.somatic': 0.000994,
+    'gNaTs2_tbar_NaTs2_t.somatic': 0.983955,
+    'decay_CaDynamics_E2.somatic': 210.485284,
+    'gCa_LVAstbar_Ca_LVAst.somatic': 0.000333
+}
+
+
+def count_segments(evaluator):
+    """Number of segments of the model with the release parameters"""
+
+    cell_model = evaluator.cell_model
+    cell_model.freeze(release_params)
+    cell_model.instantiate(sim=evaluator.sim)
+    n_segments = sum(section.nseg for section in cell_model.icell.all)
+    cell_model.destroy(sim=evaluator.sim)
+    cell_model.unfreeze(release_params.keys())
+
+    return n_segments
+
+
+def run(evaluator, repeats):
+    """Run the protocols, return the best time and the scores"""
+
+    durations = []
+    for _ in range(repeats):
+        start_time = time.time()
+        responses = evaluator.run_protocols(
+            evaluator.fitness_protocols.values(), release_params)
+        durations.append(time.time() - start_time)
+
+    scores = evaluator.fitness_calculator.calculate_scores(responses)
+
+    return min(durations), scores
+
+
+def evaluate(nseg_frequency, d_lambda, repeats):
+    """Segments, time and scores of a discretisation"""
+
+    evaluator = l5pc_evaluator.create()
+    evaluator.cell_model.morphology = ephys.morphologies.NrnFileMorphology(
+        morphology_path,
+        do_replace_axon=True,
+        nseg_frequency=nseg_frequency,
+        d_lambda=d_lambda)
+
+    n_segments = count_segments(evaluator)
+    duration, scores = run(evaluator, repeats)
+
+    return n_segments, duration, scores
+
+
+def main():
+    """Main"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--frequency', type=float, default=100.0,
+                        help='frequency (Hz) of the d_lambda rule')
+    parser.add_argument('--d-lambda', type=float, nargs='+',
+                        default=[0.1, 0.3],
+                        help='d_lambda values to compare')
+    parser.add_argument('--reference-d-lambda', type=float, default=0.02,
+                        help='d_lambda of the fine reference discretisation')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    _, _, reference_scores = evaluate(
+        args.frequency, args.reference_d_lambda, 1)
+
+    discretisations = [('1 + 2*int(L/40)', None, None)] + [
+        ('d_lambda=%g at %g Hz' % (d_lambda, args.frequency),
+         args.frequency, d_lambda) for d_lambda in args.d_lambda]
+
+    print('Score differences with d_lambda=%g, in standard deviations of '
+          'the features' % args.reference_d_lambda)
+    print('%-26s %9s %9s %12s %12s' % (
+        'discretisation', 'segments', 'time (s)', 'mean diff', 'max diff'))
+    for label, nseg_frequency, d_lambda in discretisations:
+        n_segments, duration, scores = evaluate(
+            nseg_frequency, d_lambda, args.repeats)
+        differences = [abs(scores[name] - reference_scores[name])
+                       for name in reference_scores]
+        print('%-26s %9d %9.2f %12.3f %12.3f' % (
+            label, n_segments, duration,
+            sum(differences) / len(differences), max(differences)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Time to first simulation of isolated L5PC protocols per start method
+
+Run from the examples/l5pc directory, after compiling the mechanisms with
+nrnivmodl mechanisms:
+
+    python benchmark/startup_benchmark.py
+
+Every start method is measured in a new python process, so that the first
+isolated run pays for the start of its worker like in a new optimisation.
+The overhead is the difference with the best time of the protocol run in
+the main process.
+"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import bluepyopt.ephys as ephys  # NOQA
+
+import l5pc_evaluator  # NOQA
+import nseg_benchmark  # NOQA
+
+METHODS = ['in-process', 'fork', 'spawn', 'forkserver', 'template']
+
+
+def measure(method, protocol_name, repeats):
+    """Durations of the runs of a protocol with a start method"""
+
+    evaluator = l5pc_evaluator.create()
+    protocol = evaluator.fitness_protocols[protocol_name]
+
+    startup = 0.0
+    if method == 'in-process':
+        isolate = False
+    elif method == 'template':
+        isolate = ephys.workers.WorkerTemplate(
+            modules=['bluepyopt.ephys', 'l5pc_evaluator'])
+        start_time = time.time()
+        isolate.start()
+        startup = time.time() - start_time
+    else:
+        multiprocessing.set_start_method(method, force=True)
+        isolate = True
+
+    durations = []
+    for _ in range(repeats):
+        start_time = time.time()
+        evaluator.run_protocol(
+            protocol, nseg_benchmark.release_params, isolate=isolate)
+        durations.append(time.time() - start_time)
+
+    return {'startup': startup, 'durations': durations}
+
+
+def main():
+    """Main"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--protocol', default='bAP',
+                        help='protocol to run')
+    parser.add_argument('--methods', nargs='+', default=METHODS,
+                        choices=METHODS, help='start methods to compare')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--measure', choices=METHODS,
+                        help='measure a single start method and print the '
+                        'results as json')
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        print(json.dumps(measure(args.measure, args.protocol, args.repeats)))
+        return
+
+    results = {}
+    for method in args.methods:
+        output = subprocess.check_output(
+            [sys.executable, __file__, '--measure', method,
+             '--protocol', args.protocol, '--repeats', str(args.repeats)])
+        results[method] = json.loads(output.decode().strip().split('\n')[-1])
+
+    simulation = min(results['in-process']['durations']) \
+        if 'in-process' in results else 0.0
+
+    print('Protocol %s, %d runs, overheads over the best in-process run '
+          '(%.3f s)' % (args.protocol, args.repeats, simulation))
+    print('%-11s %11s %11s %11s %14s %13s' % (
+        'method', 'startup (s)', 'first (s)', 'best (s)',
+        'first ovh (s)', 'best ovh (s)'))
+    for method, result in results.items():
+        durations = result['durations']
+        print('%-11s %11.3f %11.3f %11.3f %14.3f %13.3f' % (
+            method, result['startup'], durations[0], min(durations),
+            durations[0] - simulation, min(durations) - simulation))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Speedup of the L5PC protocols with NEURON threads
+
+Run from the examples/l5pc directory, after compiling the mechanisms with
+nrnivmodl mechanisms:
+
+    python benchmark/thread_benchmark.py --nthreads 1 2 4 8
+
+The speedup is only meaningful on a machine with at least as many free
+cores as threads.
+"""
+
+"""
+Copyright (c) 2016, EPFL/Blue Brain Project
+
+ This file is part of BluePyOpt <https://github.com/BlueBrain/BluePyOpt>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import bluepyopt.ephys as ephys  # NOQA
+
+import l5pc_evaluator  # NOQA
+import nseg_benchmark  # NOQA
+
+
+def evaluate(nthread, multisplit, dt, repeats):
+    """Time and scores of the protocols with a number of threads"""
+
+    evaluator = l5pc_evaluator.create()
+    evaluator.sim = ephys.simulators.NrnSimulator(
+        dt=dt,
+        cvode_active=dt is None,
+        nthread=nthread,
+        cache_efficient=True,
+        multisplit=multisplit)
+
+    # The threads are used by a single process
+    evaluator.isolate_protocols = False
+
+    return nseg_benchmark.run(evaluator, repeats)
+
+
+def main():
+    """Main"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nthreads', type=int, nargs='+',
+                        default=[1, 2, 4],
+                        help='numbers of threads to compare')
+    parser.add_argument('--dt', type=float, default=None,
+                        help='fixed time step, by default cvode is used')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    reference_duration, reference_scores = evaluate(
+        1, False, args.dt, args.repeats)
+
+    print('Score differences with a single thread, in standard deviations '
+          'of the features')
+    print('%8s %11s %9s %9s %12s' % (
+        'threads', 'multisplit', 'time (s)', 'speedup', 'max diff'))
+    for nthread in args.nthreads:
+        for multisplit in [False, True] if nthread > 1 else [False]:
+            if nthread == 1:
+                duration, scores = reference_duration, reference_scores
+            else:
+                duration, scores = evaluate(
+                    nthread, multisplit, args.dt, args.repeats)
+            differences = [abs(scores[name] - reference_scores[name])
+                           for name in reference_scores]
+            print('%8d %11s %9.2f %9.2f %12.3g' % (
+                nthread, multisplit, duration,
+                reference_duration / duration, max(differences)))
+
+
+if __name__ == '__main__':
+    main()
@@ -31,8 +31,6 @@ import os
 import sys
 import textwrap
 
-from datetime import datetime
-
 import bluepyopt
 
 import l5pc_evaluator
@@ -51,23 +49,21 @@ def create_optimizer(args):
 
         logger.debug('Using ipyparallel with %d engines', len(rc))
 
-        lview = rc.load_balanced_view()
-
-        def mapper(func, it):
-            start_time = datetime.now()
-            ret = lview.map_sync(func, it)
-            logger.debug('Generation took %s', datetime.now() - start_time)
-            return ret
+        executor = bluepyopt.executors.IPyParallelExecutor(
+            rc.load_balanced_view())
 
-        map_function = mapper
+        # Send the evaluator once to every engine, instead of with every task
+        evaluator_broadcast = bluepyopt.registry.IPyParallelBroadcast(rc[:])
     else:
-        map_function = None
+        executor = None
+        evaluator_broadcast = None
 
     evaluator = l5pc_evaluator.create()
     seed = os.getenv('BLUEPYOPT_SEED', args.seed)
     opt = bluepyopt.optimisations.DEAPOptimisation(
         evaluator=evaluator,
-        map_function=map_function,
+        executor=executor,
+        evaluator_broadcast=evaluator_broadcast,
         seed=seed)
 
     return opt
@@ -36,7 +36,8 @@ setuptools.setup(
         'ipyparallel',
         'pickleshare>=0.7.3',
         'Jinja2>=2.8',
-        'future'],
+        'future',
+        'futures; python_version < "3"'],
     packages=setuptools.find_packages(
         exclude=(
             'examples',
@@ -67,5 +68,7 @@ setuptools.setup(
     package_data={
         'bluepyopt': [
             'ephys/templates/cell_template.jinja2',
+            'ephys/templates/cell_template_population.jinja2',
+            'ephys/templates/cell_template_shared.jinja2',
             'ephys/examples/simplecell/simple.swc'],
     })